@@ -0,0 +1,82 @@
+"""
+ワーカー起動時間のベンチマーク
+
+新しいPythonプロセスで main をインポートし、lifespan の起動処理が終わるまで
+（リクエストを受け付けられるようになるまで）の時間を測定する。
+--workers を指定すると、その数のプロセスを同時に起動する（複数ワーカーの同時起動を想定）。
+
+DATABASE_URL が未設定の場合は一時ディレクトリのSQLiteを使用する。
+1回目の起動はテーブル作成とサンプルデータ挿入を含むため、集計から除外する。
+
+使用方法:
+  python benchmarks/bench_cold_start.py [--runs 5] [--workers 4]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 子プロセスで実行するスクリプト（インポートと起動処理の時間をJSONで出力）
+CHILD_SCRIPT = """
+import asyncio, json, os, time
+start = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print(json.dumps({"import_ms": (imported - start) * 1000, "startup_ms": (ready - imported) * 1000}))
+os._exit(0)
+"""
+
+
+def start_workers(n: int, env: dict) -> list[dict]:
+    processes = [
+        subprocess.Popen([sys.executable, "-c", CHILD_SCRIPT], cwd=BACKEND_DIR, env=env,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        for _ in range(n)
+    ]
+    results = []
+    for process in processes:
+        out, _ = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError("ワーカーの起動に失敗しました")
+        results.append(json.loads(out.strip().splitlines()[-1]))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+    # 初回起動（スキーマ作成・サンプルデータ挿入）
+    start_workers(1, env)
+
+    samples = []
+    for _ in range(args.runs):
+        samples.extend(start_workers(args.workers, env))
+
+    for key, label in (("import_ms", "インポート"), ("startup_ms", "起動処理")):
+        values = [s[key] for s in samples]
+        print(f"{label:>6}: 中央値 {statistics.median(values):7.1f} ms, 最大 {max(values):7.1f} ms")
+    totals = [s["import_ms"] + s["startup_ms"] for s in samples]
+    print(f"{'合計':>6}: 中央値 {statistics.median(totals):7.1f} ms, 最大 {max(totals):7.1f} ms"
+          f"  (同時起動数 {args.workers}, {args.runs} 回)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+haversine距離計算のマイクロベンチマーク
+
+スカラー版（haversine_distance を1点ずつ呼ぶ）とNumPyによる一括版
+（haversine_many / within_range_mask / distance_matrix）を 1千〜100万点で比較する
+
+使用方法:
+  python benchmarks/bench_haversine.py [点数 ...]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+# プロジェクトルートをPythonパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.geo_utils import distance_matrix, haversine_distance, haversine_many, within_range_mask
+
+SHELTER = (35.6762, 139.7660)
+RANGE_KM = 3.0
+MATRIX_SHELTERS = 100
+
+
+def best_of(func, repeat: int = 3) -> float:
+    """repeat回実行した最短時間（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(count: int, rng: np.random.Generator) -> None:
+    lats = rng.uniform(35.45, 35.95, count)
+    lons = rng.uniform(139.45, 140.05, count)
+    lat_list = lats.tolist()
+    lon_list = lons.tolist()
+
+    def scalar():
+        return [haversine_distance(lat, lon, *SHELTER) for lat, lon in zip(lat_list, lon_list)]
+
+    scalar_sec = best_of(scalar, repeat=1 if count >= 1_000_000 else 3)
+    vector_sec = best_of(lambda: haversine_many(lats, lons, *SHELTER))
+    mask_sec = best_of(lambda: within_range_mask(lats, lons, *SHELTER, RANGE_KM))
+
+    # スカラー版と結果が一致することを確認
+    max_error = float(np.max(np.abs(np.asarray(scalar()) - haversine_many(lats, lons, *SHELTER))))
+    assert max_error < 1e-9, max_error
+
+    print(
+        f"{count:>10,} | {scalar_sec * 1000:>10.2f} ms | {vector_sec * 1000:>9.2f} ms | "
+        f"{mask_sec * 1000:>9.2f} ms | {scalar_sec / vector_sec:>7.0f}x"
+    )
+
+
+def run_matrix(count: int, rng: np.random.Generator) -> None:
+    shelter_lats = rng.uniform(35.45, 35.95, MATRIX_SHELTERS)
+    shelter_lons = rng.uniform(139.45, 140.05, MATRIX_SHELTERS)
+    lats = rng.uniform(35.45, 35.95, count)
+    lons = rng.uniform(139.45, 140.05, count)
+
+    matrix_sec = best_of(lambda: distance_matrix(shelter_lats, shelter_lons, lats, lons))
+    print(f"  避難所 {MATRIX_SHELTERS} × {count:,} 点の距離行列: {matrix_sec * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 100_000, 1_000_000]
+    rng = np.random.default_rng(42)
+
+    print("      点数 |   スカラー |  haversine_many | within_range_mask | 高速化")
+    for count in counts:
+        run(count, rng)
+
+    print()
+    for count in counts:
+        if count <= 100_000:
+            run_matrix(count, rng)
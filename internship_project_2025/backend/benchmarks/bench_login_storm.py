@@ -0,0 +1,118 @@
+"""
+ログイン集中時のベンチマーク
+
+ログインを並列に送り続けながら、認証不要の /api/users/qr/{user_id} の応答時間を測定する。
+bcryptをイベントループ上で直接実行した場合（inline）と、
+スレッドプールに逃がした場合（pool）で p50/p99 とログインのスループットを比較する。
+
+アプリはプロセス内で起動し（httpx の ASGITransport を使用）、
+DATABASE_URL が未設定の場合は一時ディレクトリのSQLiteにサンプルデータを作成する。
+
+使用方法:
+  python benchmarks/bench_login_storm.py [--concurrency 32] [--seconds 5]
+
+httpx が必要（pip install -r requirements-dev.txt）
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# プロジェクトルートをPythonパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import httpx
+
+from main import app
+from services.auth import pwd_context
+from services.password_hasher import password_hash_pool
+
+LOGIN = {"email": "user1-01@example.com", "password": "user1-01pass"}
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def probe(client: httpx.AsyncClient, user_id: str, seconds: float) -> list[float]:
+    """QR用エンドポイントを一定間隔で呼び出し、応答時間（ms）を返す"""
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        response = await client.get(f"/api/users/qr/{user_id}")
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+async def login_flood(client: httpx.AsyncClient, stop: asyncio.Event, counts: dict) -> None:
+    while not stop.is_set():
+        response = await client.post("/api/users/login", json=LOGIN)
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+
+
+async def run(mode: str, concurrency: int, seconds: float) -> None:
+    original_run = password_hash_pool.run
+    if mode == "inline":
+        # 従来の動作: bcryptをイベントループ上で直接実行
+        async def inline_run(func, *args):
+            return func(*args)
+        password_hash_pool.run = inline_run
+
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            token = (await client.post("/api/users/login", json=LOGIN)).json()["access_token"]
+            me = await client.get("/api/users/me", headers={"Authorization": f"Bearer {token}"})
+            user_id = me.json()["user_id"]
+
+            idle = await probe(client, user_id, 1.0)
+
+            stop = asyncio.Event()
+            counts: dict[int, int] = {}
+            flooders = [asyncio.create_task(login_flood(client, stop, counts)) for _ in range(concurrency)]
+            start = time.perf_counter()
+            loaded = await probe(client, user_id, seconds)
+            stop.set()
+            await asyncio.gather(*flooders)
+            elapsed = time.perf_counter() - start
+    finally:
+        password_hash_pool.run = original_run
+
+    logins = counts.get(200, 0)
+    print(
+        f"{mode:>6} | 平常時 p50 {statistics.median(idle):6.1f} ms, p99 {percentile(idle, 99):6.1f} ms"
+        f" | ログイン集中時 p50 {statistics.median(loaded):6.1f} ms, p99 {percentile(loaded, 99):7.1f} ms"
+        f" | ログイン {logins / elapsed:5.1f} 件/秒, 503 {counts.get(503, 0)} 件"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"bcrypt rounds: {pwd_context.handler('bcrypt').default_rounds}, "
+          f"ワーカー数: {password_hash_pool.max_workers}, 待ち行列上限: {password_hash_pool.max_queue}, "
+          f"同時ログイン数: {args.concurrency}")
+    # ASGITransport は lifespan を実行しないため、起動処理（テーブル作成・サンプルデータ挿入）を明示的に行う
+    async with app.router.lifespan_context(app):
+        for mode in ("inline", "pool"):
+            await run(mode, args.concurrency, args.seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+一覧レスポンスのシリアライズ性能のベンチマーク
+
+在庫一覧（InventoryInfo）1000件あたりの、行の組み立てからレスポンス本文の作成までの時間を比較する。
+- pydantic: 行ごとに InventoryInfo を検証付きで作成し、FastAPIの response_model による検証・変換を経て JSONResponse で出力（従来の方法）
+- construct: model_construct で検証を省き、TypeAdapter で直接JSONに変換
+- orjson: 辞書の行を orjson で出力（utils/fast_json.py の方法）
+あわせて gzip（と brotli がある場合は br）の圧縮時間と圧縮後のサイズを表示する。
+
+使用方法:
+  python benchmarks/bench_serialization.py [--rows 1000] [--repeat 50]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+# プロジェクトルートをPythonパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import TypeAdapter
+
+from db_manager import MEDICATION_DESCRIPTIONS, MEDICATION_NAMES
+from schemas import InventoryInfo
+from utils.fast_json import COMPRESSORS, dumps
+
+FIELDS = ("shelter_name", "medication_name", "quantity", "expiry_date", "description", "required_quantity")
+
+
+def make_rows(n: int) -> list[tuple]:
+    """ORMから読み込んだ値の代わりに使う行"""
+    rows = []
+    for i in range(n):
+        name = MEDICATION_NAMES[i % len(MEDICATION_NAMES)]
+        rows.append((
+            f"避難所{i % 50:03d}", name, i % 300, date(2026, 1, 1) + timedelta(days=i % 365),
+            MEDICATION_DESCRIPTIONS[name], i % 40
+        ))
+    return rows
+
+
+response_field = create_model_field(name="response", type_=list[InventoryInfo], mode="serialization")
+loop = asyncio.new_event_loop()
+
+
+def build_pydantic(rows: list[tuple]) -> bytes:
+    items = [InventoryInfo(**dict(zip(FIELDS, row))) for row in rows]
+    content = loop.run_until_complete(
+        serialize_response(field=response_field, response_content=items, is_coroutine=True)
+    )
+    return JSONResponse(content).body
+
+
+construct_adapter = TypeAdapter(list[InventoryInfo])
+
+
+def build_construct(rows: list[tuple]) -> bytes:
+    items = [InventoryInfo.model_construct(**dict(zip(FIELDS, row))) for row in rows]
+    return construct_adapter.dump_json(items)
+
+
+def build_orjson(rows: list[tuple]) -> bytes:
+    return dumps([dict(zip(FIELDS, row)) for row in rows])
+
+
+def measure(func, arg, repeat: int) -> float:
+    """1回あたりの時間（ms）"""
+    func(arg)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(arg)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    per_1k = 1000 / args.rows
+
+    print(f"{args.rows} 件（1000件あたりの時間）")
+    results = {}
+    for label, func in (("pydantic", build_pydantic), ("construct", build_construct), ("orjson", build_orjson)):
+        elapsed = measure(func, rows, args.repeat)
+        results[label] = func(rows)
+        print(f"  {label:>9}: {elapsed * per_1k:7.2f} ms")
+
+    body = results["orjson"]
+    assert body == results["construct"] == results["pydantic"], "出力が一致しません"
+    print(f"本文 {len(body) / 1024:.1f} KiB")
+    for encoding, compress in COMPRESSORS.items():
+        elapsed = measure(compress, body, args.repeat)
+        print(f"  {encoding:>9}: {elapsed * per_1k:7.2f} ms, {len(compress(body)) / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
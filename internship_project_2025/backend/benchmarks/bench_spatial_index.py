@@ -0,0 +1,83 @@
+"""
+空間インデックスのベンチマーク
+
+全ユーザー走査（空間インデックス導入前の範囲検索相当）とグリッド索引による検索の
+1回あたりのレイテンシを、ユーザー数 1万 / 10万 / 100万 で比較する
+
+使用方法:
+  python benchmarks/bench_spatial_index.py [ユーザー数 ...]
+"""
+
+import os
+import random
+import sys
+import time
+
+# プロジェクトルートをPythonパスに追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.geo_utils import is_within_range
+from utils.spatial_index import GridIndex
+
+# 東京23区周辺（約60km四方）にユーザーを分布させる
+LAT_RANGE = (35.45, 35.95)
+LON_RANGE = (139.45, 140.05)
+RANGE_KM = 3.0
+QUERY_COUNT = 20
+
+
+def generate_users(count: int, rng: random.Random) -> list[tuple[int, float, float]]:
+    return [
+        (i, rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+        for i in range(count)
+    ]
+
+
+def linear_scan(users, lat: float, lon: float, range_km: float) -> list[int]:
+    return [
+        user_id for user_id, u_lat, u_lon in users
+        if is_within_range(u_lat, u_lon, lat, lon, range_km)
+    ]
+
+
+def run(count: int) -> None:
+    rng = random.Random(42)
+    users = generate_users(count, rng)
+    queries = [
+        (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))
+        for _ in range(QUERY_COUNT)
+    ]
+
+    start = time.perf_counter()
+    index = GridIndex()
+    index.bulk_load(users)
+    build_sec = time.perf_counter() - start
+
+    # 全件走査は100万件だと1回で1秒以上かかるため回数を絞る
+    scan_queries = queries[:max(1, min(QUERY_COUNT, 2_000_000 // count))]
+    start = time.perf_counter()
+    for lat, lon in scan_queries:
+        expected = linear_scan(users, lat, lon, RANGE_KM)
+    scan_ms = (time.perf_counter() - start) / len(scan_queries) * 1000
+
+    start = time.perf_counter()
+    for lat, lon in queries:
+        found = index.query(lat, lon, RANGE_KM)
+    index_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    # 結果が一致することを確認
+    lat, lon = scan_queries[-1]
+    assert sorted(index.query(lat, lon, RANGE_KM)) == sorted(linear_scan(users, lat, lon, RANGE_KM))
+
+    print(
+        f"{count:>10,} | {build_sec:>9.2f} s | {scan_ms:>12.2f} ms | "
+        f"{index_ms:>10.3f} ms | {scan_ms / index_ms:>8.0f}x | {len(found):>7,}"
+    )
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    print(f"集約範囲 {RANGE_KM}km, 検索 {QUERY_COUNT} 回の平均")
+    print(" ユーザー数 |   索引構築 |     全件走査 |   グリッド |   高速化 | 範囲内数")
+    for count in counts:
+        run(count)
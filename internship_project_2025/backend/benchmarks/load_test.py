@@ -0,0 +1,351 @@
+"""
+APIの負荷試験ハーネス
+
+災害発生直後を想定し、ログイン集中のあとに QRコードの読み取り・担当避難所の在庫ポーリング・
+在庫の一括更新・ログインを混在させて main:app に HTTP で負荷をかけ、
+フェーズとエンドポイントごとの p50/p95/p99 とスループットを出力する。
+
+DATABASE_URL が未設定の場合は一時ディレクトリのSQLiteを作成し、
+db_manager.py generate で負荷試験用データを入れてから uvicorn で main:app を起動する。
+ローカルのPostgreSQLを使う場合は DATABASE_URL を指定する（--generate でデータも作成）。
+--url を指定した場合は起動済みのサーバーに負荷をかける。
+いずれも db_manager.py generate で作成した負荷試験用アカウントを使う。
+
+--save-baseline で結果を保存し、--baseline で保存済みの結果と比較する。
+p95 または p99 が許容範囲（--tolerance）を超えて悪化した、またはエラーが増えた
+エンドポイントがあれば終了コード1で終了する。
+
+使用方法:
+  python benchmarks/load_test.py [--users 20000] [--shelters 50] [--concurrency 50]
+                                 [--surge-seconds 10] [--duration 30] [--workers 1]
+                                 [--url http://localhost:8000] [--generate]
+                                 [--save-baseline FILE] [--baseline FILE] [--tolerance 0.2]
+
+httpx が必要（pip install -r requirements-dev.txt）
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 負荷試験用アカウント（db_manager.py generate と同じ形式）
+LOAD_PASSWORD = "loadtest-pass"
+
+
+def user_email(n: int) -> str:
+    return f"load-user{n:07d}@example.com"
+
+
+def admin_email(n: int) -> str:
+    return f"load-admin{n:05d}@example.com"
+
+
+# 定常フェーズの操作の比率
+MIX = {
+    "qr_scan": 40,
+    "inventory_poll": 30,
+    "user_me": 10,
+    "user_login": 15,
+    "bulk_update": 5,
+}
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+class Recorder:
+    """エンドポイントごとの応答時間とエラー数の記録"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    async def request(self, endpoint: str, send) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except httpx.HTTPError:
+            response = None
+        self.latencies[endpoint].append((time.perf_counter() - start) * 1000)
+        if response is None or response.status_code >= 400:
+            self.errors[endpoint] += 1
+        return response
+
+    def finish(self) -> None:
+        self.elapsed = time.perf_counter() - self.started
+
+    def summary(self) -> dict[str, dict]:
+        return {
+            endpoint: {
+                "count": len(values),
+                "errors": self.errors[endpoint],
+                "rps": len(values) / self.elapsed if self.elapsed else 0.0,
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+            }
+            for endpoint, values in sorted(self.latencies.items())
+        }
+
+
+class Pool:
+    """負荷試験中に使うアカウントとトークン"""
+
+    def __init__(self):
+        self.user_ids: list[str] = []
+        self.user_tokens: list[str] = []
+        self.admin_tokens: list[str] = []
+        self.medications: dict[str, list[str]] = {}
+
+
+async def prepare(client: httpx.AsyncClient, accounts: int, admins: int) -> Pool:
+    """ユーザーと管理者をログインさせ、QR読み取り対象のIDと在庫の医薬品名を集める"""
+    pool = Pool()
+    semaphore = asyncio.Semaphore(16)
+
+    async def login_user(n: int):
+        async with semaphore:
+            response = await client.post("/api/users/login", json={"email": user_email(n), "password": LOAD_PASSWORD})
+            if response.status_code != 200:
+                return
+            token = response.json()["access_token"]
+            me = await client.get("/api/users/me", headers={"Authorization": f"Bearer {token}"})
+            pool.user_tokens.append(token)
+            pool.user_ids.append(me.json()["user_id"])
+
+    async def login_admin(n: int):
+        async with semaphore:
+            response = await client.post("/api/admins/login", json={"email": admin_email(n), "password": LOAD_PASSWORD})
+            if response.status_code != 200:
+                return
+            token = response.json()["access_token"]
+            inventory = await client.get("/api/admins/my-shelter/inventory", headers={"Authorization": f"Bearer {token}"})
+            pool.admin_tokens.append(token)
+            pool.medications[token] = [row["medication_name"] for row in inventory.json()]
+
+    await asyncio.gather(*(login_user(n) for n in range(1, accounts + 1)))
+    await asyncio.gather(*(login_admin(n) for n in range(1, admins + 1)))
+    if not pool.user_ids or not pool.admin_tokens:
+        raise SystemExit("負荷試験用アカウントでログインできません。db_manager.py generate でデータを作成してください")
+    return pool
+
+
+async def login_surge(client: httpx.AsyncClient, recorder: Recorder, accounts: int, deadline: float, rng: random.Random):
+    while time.perf_counter() < deadline:
+        n = rng.randint(1, accounts)
+        await recorder.request("POST /api/users/login", lambda: client.post(
+            "/api/users/login", json={"email": user_email(n), "password": LOAD_PASSWORD}
+        ))
+
+
+async def steady_mix(client: httpx.AsyncClient, recorder: Recorder, pool: Pool, accounts: int,
+                     deadline: float, rng: random.Random):
+    operations = list(MIX)
+    weights = list(MIX.values())
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        if operation == "qr_scan":
+            user_id = rng.choice(pool.user_ids)
+            await recorder.request("GET /api/users/qr/{user_id}", lambda: client.get(f"/api/users/qr/{user_id}"))
+        elif operation == "user_me":
+            headers = {"Authorization": f"Bearer {rng.choice(pool.user_tokens)}"}
+            await recorder.request("GET /api/users/me", lambda: client.get("/api/users/me", headers=headers))
+        elif operation == "user_login":
+            n = rng.randint(1, accounts)
+            await recorder.request("POST /api/users/login", lambda: client.post(
+                "/api/users/login", json={"email": user_email(n), "password": LOAD_PASSWORD}
+            ))
+        elif operation == "inventory_poll":
+            headers = {"Authorization": f"Bearer {rng.choice(pool.admin_tokens)}"}
+            await recorder.request("GET /api/admins/my-shelter/inventory", lambda: client.get(
+                "/api/admins/my-shelter/inventory", headers=headers
+            ))
+        else:
+            token = rng.choice(pool.admin_tokens)
+            names = pool.medications[token]
+            items = [
+                {"medication_name": name, "quantity": rng.randint(0, 100)}
+                for name in rng.sample(names, min(10, len(names)))
+            ]
+            await recorder.request("PUT /api/admins/my-shelter/inventory", lambda: client.put(
+                "/api/admins/my-shelter/inventory",
+                headers={"Authorization": f"Bearer {token}"},
+                json={"items": items},
+            ))
+
+
+def print_report(phase: str, recorder: Recorder) -> None:
+    summary = recorder.summary()
+    total = sum(row["count"] for row in summary.values())
+    print(f"\n=== {phase} ({recorder.elapsed:.1f}秒, 合計 {total / recorder.elapsed:.1f} 件/秒) ===")
+    print(f"{'エンドポイント':<40} {'件数':>7} {'エラー':>6} {'件/秒':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for endpoint, row in summary.items():
+        print(f"{endpoint:<40} {row['count']:>7} {row['errors']:>6} {row['rps']:>8.1f}"
+              f" {row['p50']:>6.1f}ms {row['p95']:>6.1f}ms {row['p99']:>6.1f}ms")
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> bool:
+    """ベースラインと比較し、悪化があればFalseを返す"""
+    print(f"\n=== ベースラインとの比較（許容範囲 +{tolerance:.0%}） ===")
+    ok = True
+    for key, base in baseline.items():
+        current = results.get(key)
+        if current is None:
+            print(f"  - {key}: 今回の結果にありません")
+            continue
+        problems = []
+        for metric in ("p95", "p99"):
+            if current[metric] > base[metric] * (1 + tolerance):
+                problems.append(f"{metric} {base[metric]:.1f}ms → {current[metric]:.1f}ms")
+        base_error_rate = base["errors"] / max(base["count"], 1)
+        error_rate = current["errors"] / max(current["count"], 1)
+        if error_rate > base_error_rate + 0.01:
+            problems.append(f"エラー率 {base_error_rate:.1%} → {error_rate:.1%}")
+        if problems:
+            ok = False
+            print(f"  ✗ {key}: {', '.join(problems)}")
+        else:
+            print(f"  ✓ {key}: p95 {current['p95']:.1f}ms, p99 {current['p99']:.1f}ms")
+    return ok
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_db_manager(env: dict, *args: str) -> None:
+    subprocess.run([sys.executable, "db_manager.py", *args], cwd=BACKEND_DIR, env=env, check=True)
+
+
+async def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 120.0) -> None:
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise SystemExit("サーバーの起動に失敗しました")
+            try:
+                if (await client.get("/health")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.5)
+    raise SystemExit("サーバーが起動しませんでした")
+
+
+async def run_load(url: str, args: argparse.Namespace) -> dict:
+    rng = random.Random(args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0) as client:
+        accounts = min(args.accounts, args.users)
+        pool = await prepare(client, accounts, min(args.admins, args.shelters))
+        print(f"準備完了: ユーザー {len(pool.user_ids)} 名, 管理者 {len(pool.admin_tokens)} 名, 同時接続数 {args.concurrency}")
+
+        surge = Recorder()
+        deadline = time.perf_counter() + args.surge_seconds
+        await asyncio.gather(*(
+            login_surge(client, surge, accounts, deadline, random.Random(rng.random()))
+            for _ in range(args.concurrency)
+        ))
+        surge.finish()
+
+        mix = Recorder()
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*(
+            steady_mix(client, mix, pool, accounts, deadline, random.Random(rng.random()))
+            for _ in range(args.concurrency)
+        ))
+        mix.finish()
+
+    print_report("ログイン集中", surge)
+    print_report("定常（混在）", mix)
+    results = {}
+    for phase, recorder in (("surge", surge), ("mix", mix)):
+        for endpoint, row in recorder.summary().items():
+            results[f"{phase} {endpoint}"] = row
+    return results
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000, help="生成するユーザー数")
+    parser.add_argument("--shelters", type=int, default=50, help="生成する避難所数")
+    parser.add_argument("--accounts", type=int, default=1000, help="負荷試験で使うユーザーアカウント数")
+    parser.add_argument("--admins", type=int, default=50, help="負荷試験で使う管理者アカウント数")
+    parser.add_argument("--concurrency", type=int, default=50, help="同時に実行する仮想クライアント数")
+    parser.add_argument("--surge-seconds", type=float, default=10.0, help="ログイン集中フェーズの秒数")
+    parser.add_argument("--duration", type=float, default=30.0, help="定常フェーズの秒数")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn のワーカー数")
+    parser.add_argument("--url", help="起動済みサーバーのURL（指定時はサーバーを起動しない）")
+    parser.add_argument("--generate", action="store_true", help="DATABASE_URL のDBにも負荷試験用データを作成する")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save-baseline", help="結果を保存するJSONファイル")
+    parser.add_argument("--baseline", help="比較するベースラインのJSONファイル")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="p95/p99 の許容悪化率")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        env = dict(os.environ)
+        generate = args.generate
+        if "DATABASE_URL" not in env:
+            env["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "load_test.db")
+            generate = True
+        if generate:
+            run_db_manager(env, "create")
+            run_db_manager(env, "migrate")
+            run_db_manager(env, "generate", "--users", str(args.users), "--shelters", str(args.shelters),
+                           "--seed", str(args.seed))
+
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+            cwd=BACKEND_DIR, env=env,
+        )
+
+    try:
+        if server is not None:
+            await wait_until_ready(url, server)
+        results = await run_load(url, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nベースラインを保存しました: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare_with_baseline(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
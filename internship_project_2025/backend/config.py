@@ -17,6 +17,70 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     
+    # 起動時のテーブル作成・マイグレーション適用・サンプルデータ挿入（db_manager.py setup で事前に作成する場合は無効にして起動を速くできる）
+    init_database_on_startup: bool = True
+    
+    # 認証済みプリンシパルキャッシュ設定（他ワーカーでの更新・削除はTTLで反映される）
+    principal_cache_ttl_seconds: int = 60
+    principal_cache_max_entries: int = 10000
+    
+    # パスワードハッシュ処理設定（bcrypt用スレッド数と、空きを待てる件数の上限）
+    password_hash_workers: int = min(4, os.cpu_count() or 1)
+    password_hash_queue_limit: int = 64
+    
+    # ユーザー位置インデックス設定（他ワーカーの更新を取り込むための全件再読み込み間隔、0で無効）
+    user_location_index_ttl_seconds: int = 300
+    
+    # 医薬品需要キャッシュ設定（他ワーカーの更新はTTLで反映される）
+    demand_cache_ttl_seconds: int = 60
+    demand_cache_max_entries: int = 4096
+    
+    # 医療情報キャッシュ設定（他ワーカーでの更新はTTLで反映される）
+    medical_info_cache_ttl_seconds: int = 60
+    medical_info_cache_max_entries: int = 10000
+    
+    # 医薬品カタログ設定（医薬品名 -> カタログIDのキャッシュ。別名の付け替えはTTLで反映される）
+    medication_catalog_cache_ttl_seconds: int = 300
+    medication_catalog_cache_max_entries: int = 10000
+    
+    # 在庫一覧設定（ページ分割時の既定件数、NDJSON送信時にカーソルから一度に読む件数）
+    inventory_page_size: int = 200
+    inventory_stream_batch_size: int = 500
+    
+    # 在庫変更の配信設定（購読者ごとに溜められる未送信の変更数、接続維持用コメントの送信間隔）
+    inventory_events_queue_size: int = 100
+    inventory_events_heartbeat_seconds: float = 15.0
+    
+    # 差分同期設定（削除記録の保持日数、古い削除記録を削除する間隔。保持期間より前のカーソルには全件を返す）
+    sync_tombstone_retention_days: int = 30
+    sync_tombstone_prune_seconds: float = 3600.0
+    
+    # 不足・余剰レポート設定（PostgreSQLのマテリアライズドビューの再集計が必要かを確認する間隔、返す最大件数）
+    shortage_report_refresh_seconds: float = 10.0
+    shortage_report_max_rows: int = 1000
+    
+    # 有効期限設定（期限日ごとの集計の対象日数、集計が古くなっていないかを確認する間隔、期限が近い在庫の最大件数）
+    expiry_horizon_days: int = 90
+    expiry_sweep_seconds: float = 60.0
+    expiring_inventory_max_rows: int = 1000
+    
+    # 一覧レスポンスの圧縮設定（このサイズ以上の本文を圧縮する）
+    response_compress_min_bytes: int = 1024
+    response_gzip_level: int = 6
+    response_brotli_quality: int = 5
+    
+    # QRコード画像キャッシュ設定（キーは医療情報のハッシュのため、TTLはメモリ解放のみに使う）
+    qr_image_cache_ttl_seconds: int = 3600
+    qr_image_cache_max_entries: int = 1024
+    
+    # QRカード一括出力設定（生成プロセス数、1回の生成依頼にまとめる枚数、氏名印字用TTFフォント）
+    qr_sheet_workers: int = min(4, os.cpu_count() or 1)
+    qr_sheet_batch_size: int = 24
+    qr_sheet_font_path: str = ""
+    
+    # SQL計測設定（この時間を超えたSQLをスロークエリとしてログに出力）
+    slow_query_ms: float = 200.0
+    
     # アプリケーション設定
     app_name: str = "災害時医薬品情報共有サービス"
     debug: bool = os.getenv("DEBUG", "False").lower() == "true"
@@ -1,25 +1,55 @@
 from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
 
-# データベースエンジンの作成
+# 非同期ドライバーの対応表（同期用URLのドライバー名 -> 非同期ドライバー名）
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# ON CONFLICT に対応したINSERT文（方言名 -> insert関数）
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def to_async_url(database_url: str):
+    """同期用のデータベースURLを非同期ドライバーのURLに変換"""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and url.drivername != ASYNC_DRIVERS[backend]:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    return url
+
+
+# データベースエンジンの作成（テーブル作成・db_manager.pyなどの同期処理用）
 engine = create_engine(settings.database_url)
 
 # セッションローカルクラスの作成
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# APIリクエスト用の非同期エンジンとセッション
+async_engine = create_async_engine(to_async_url(settings.database_url))
+
+# コミット後の属性アクセスで暗黙のI/Oが発生しないよう expire_on_commit=False とする
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 # ベースクラスの作成
 Base = declarative_base()
 
 
-def get_db():
+async def get_db():
     """データベースセッションを取得する依存関数"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 def create_tables():
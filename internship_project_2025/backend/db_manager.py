@@ -1,44 +1,121 @@
 """
 データベース管理スクリプト
 
-テーブルの作成・削除・再作成を行うためのスクリプト
+テーブルの作成・削除・再作成、稼働中のデータベースへのマイグレーション適用、
+主要クエリの実行計画の確認を行うためのスクリプト
 """
 
 import sys
 import os
-from sqlalchemy import text
+from typing import Callable, NamedTuple, Optional
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, String, Table, bindparam, func, inspect, select, text, update
+)
+from sqlalchemy.engine import Connection
 from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from passlib.context import CryptContext
+import argparse
 import random
+import time
+import uuid
 from datetime import date, timedelta
 
 # プロジェクトルートをPythonパスに追加
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database import Base, engine, SessionLocal
-from models import User, Medication, Shelter, ShelterAdmin, MedicationInventory
+from models import (
+    User, Medication, Shelter, ShelterAdmin, MedicationInventory, SyncState, SyncTombstone,
+    MedicationCatalog, MedicationAlias, BalanceViewState
+)
+from services.change_seq import ensure_sync_state
+from services.medication_catalog import resolve_catalog_ids
+from services.shortage_report import BALANCE_VIEW, ensure_balance_view
+from utils.geo_utils import KM_PER_DEGREE
 
 # パスワードハッシュ化用
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+# サンプルデータ・負荷試験用データの定数
+MEDICATION_NAMES = [
+    "フェノバール注射液100mg",
+    "デエビゴ錠5mg",
+    "イーケプラ錠静注500mg",
+    "ロキソニン錠60mg",
+    "PL配合顆粒",
+    "ボルタレンサポ50mg",
+    "カロナール錠200mg",
+    "アンヒバ坐剤小児用100mg",
+    "ブスコパン錠10mg",
+    "ムコスタ錠100mg"
+]
+
+# 医薬品の説明データ
+MEDICATION_DESCRIPTIONS = {
+    "フェノバール注射液100mg": "抗てんかん薬。けいれん発作の治療に使用。",
+    "デエビゴ錠5mg": "睡眠薬。不眠症の治療に使用。",
+    "イーケプラ錠静注500mg": "抗てんかん薬。てんかん発作の予防に使用。",
+    "ロキソニン錠60mg": "解熱鎮痛薬。頭痛、発熱、炎症の緩和に使用。",
+    "PL配合顆粒": "総合感冒薬。風邪の諸症状の緩和に使用。",
+    "ボルタレンサポ50mg": "解熱鎮痛薬。発熱、炎症、疼痛の緩和に使用。",
+    "カロナール錠200mg": "解熱鎮痛薬。発熱、頭痛の緩和に使用。",
+    "アンヒバ坐剤小児用100mg": "小児用解熱鎮痛薬。小児の発熱時に使用。",
+    "ブスコパン錠10mg": "鎮痙薬。腹痛、胃痛の緩和に使用。",
+    "ムコスタ錠100mg": "胃粘膜保護薬。胃炎、胃潰瘍の治療に使用。"
+}
+
+BLOOD_TYPES = ["A", "B", "AB", "O", "不明"]
+ALLERGIES = ["特になし", "ペニシリン", "卵", "そば", "エビ・カニ", "牛乳"]
+CONDITIONS = ["高血圧", "糖尿病", "高脂血症", "不整脈", "喘息", "関節炎", "不眠症", "胃炎", "頭痛", "腰痛"]
+DOSAGES = ["朝1錠", "朝夕各1錠", "毎食後1錠", "就寝前1錠", "頓服"]
+SCHEDULES = ["食後", "食前", "食間", "就寝前", "必要時"]
+
+
 def drop_all_tables():
-    """すべてのテーブルを削除"""
+    """
+    すべてのテーブルと不足・余剰レポートのビューを削除（マイグレーションの適用記録も削除し、次の migrate で作り直す）
+    
+    差分同期の sync_state だけは残して変更番号を引き継ぎ、これまでに返したカーソルをすべて
+    削除済みの範囲にする（再作成前のカーソルで同期した端末には全件を返し、古い行を消させる）
+    """
     print("すべてのテーブルを削除しています...")
     
     # 外部キー制約を一時的に無効化してテーブルを削除
     with engine.connect() as conn:
+        postgresql = conn.dialect.name == "postgresql"
+        cascade = " CASCADE" if postgresql else ""
+        if postgresql:
+            conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {BALANCE_VIEW}"))
+            print(f"  ✓ ビュー '{BALANCE_VIEW}' を削除しました")
+        
+        inspector = inspect(conn)
+        if inspector.has_table("sync_state") and "pruned_seq" in {
+            column["name"] for column in inspector.get_columns("sync_state")
+        }:
+            conn.execute(text("UPDATE sync_state SET last_seq = last_seq + 1, pruned_seq = last_seq + 1"))
+            print("  ✓ 差分同期の変更番号を引き継ぎ、再作成前のカーソルを全件同期にしました")
+        else:
+            conn.execute(text(f"DROP TABLE IF EXISTS sync_state{cascade};"))
+        
         tables_to_drop = [
             'medications',
             'medication_inventory', 
+            'medication_aliases',
+            'medication_catalog',
             'shelter_admins',
             'users',
-            'shelters'
+            'shelters',
+            'sync_tombstones',
+            'balance_view_state',
+            'schema_migrations'
         ]
         
         for table in tables_to_drop:
             try:
-                conn.execute(text(f"DROP TABLE IF EXISTS {table} CASCADE;"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {table}{cascade};"))
                 print(f"  ✓ テーブル '{table}' を削除しました")
             except ProgrammingError as e:
                 print(f"  - テーブル '{table}' の削除をスキップ: {e}")
@@ -54,10 +131,11 @@ def create_all_tables():
 
 
 def recreate_tables():
-    """テーブルを再作成"""
+    """テーブルを再作成し、マイグレーション（インデックス・ビュー）を適用"""
     print("=== データベーステーブル再作成 ===")
     drop_all_tables()
     create_all_tables()
+    migrate()
     print("=== 完了 ===")
 
 
@@ -85,20 +163,6 @@ def insert_sample_data():
     print("サンプルデータを挿入しています...")
     random.seed(42)
     
-    # 定数定義
-    MEDICATION_NAMES = [
-        "フェノバール注射液100mg",
-        "デエビゴ錠5mg",
-        "イーケプラ錠静注500mg",
-        "ロキソニン錠60mg",
-        "PL配合顆粒",
-        "ボルタレンサポ50mg",
-        "カロナール錠200mg",
-        "アンヒバ坐剤小児用100mg",
-        "ブスコパン錠10mg",
-        "ムコスタ錠100mg"
-    ]
-    
     SHELTERS_DATA = [
         {
             "name": "中央区避難所",
@@ -162,20 +226,6 @@ def insert_sample_data():
         # コミットして管理者IDを取得
         db.commit()
         
-        # 医薬品の説明データ
-        MEDICATION_DESCRIPTIONS = {
-            "フェノバール注射液100mg": "抗てんかん薬。けいれん発作の治療に使用。",
-            "デエビゴ錠5mg": "睡眠薬。不眠症の治療に使用。",
-            "イーケプラ錠静注500mg": "抗てんかん薬。てんかん発作の予防に使用。",
-            "ロキソニン錠60mg": "解熱鎮痛薬。頭痛、発熱、炎症の緩和に使用。",
-            "PL配合顆粒": "総合感冒薬。風邪の諸症状の緩和に使用。",
-            "ボルタレンサポ50mg": "解熱鎮痛薬。発熱、炎症、疼痛の緩和に使用。",
-            "カロナール錠200mg": "解熱鎮痛薬。発熱、頭痛の緩和に使用。",
-            "アンヒバ坐剤小児用100mg": "小児用解熱鎮痛薬。小児の発熱時に使用。",
-            "ブスコパン錠10mg": "鎮痙薬。腹痛、胃痛の緩和に使用。",
-            "ムコスタ錠100mg": "胃粘膜保護薬。胃炎、胃潰瘍の治療に使用。"
-        }
-        
         # 在庫数量の選択肢
         QUANTITY_OPTIONS = [0, 10, 20, 30]
         
@@ -199,9 +249,6 @@ def insert_sample_data():
         
         # ユーザーデータを作成（各避難所付近に10名ずつ）
         user_objects = []
-        blood_types = ["A", "B", "AB", "O", "不明"]
-        allergies = ["特になし", "ペニシリン", "卵", "そば", "エビ・カニ", "牛乳"]
-        conditions = ["高血圧", "糖尿病", "高脂血症", "不整脈", "喘息", "関節炎", "不眠症", "胃炎", "頭痛", "腰痛"]
         
         for i, shelter in enumerate(shelter_objects):
             for j in range(10):  # 各避難所付近に10名
@@ -220,9 +267,9 @@ def insert_sample_data():
                     password_hash=pwd_context.hash(user_password),
                     name=f"田中 太郎{i+1}-{j+1:02d}",
                     birthday=date(1960 + (j % 40), 1 + (j % 12), 1 + (j % 28)),
-                    blood_type=random.choice(blood_types),
-                    allergy_name=random.choice(allergies),
-                    condition_name=random.choice(conditions),
+                    blood_type=random.choice(BLOOD_TYPES),
+                    allergy_name=random.choice(ALLERGIES),
+                    condition_name=random.choice(CONDITIONS),
                     latitude=user_lat,
                     longitude=user_lng
                 )
@@ -236,15 +283,13 @@ def insert_sample_data():
         for user in user_objects:
             # ランダムに3つの医薬品を選択（重複なし）
             selected_meds = random.sample(MEDICATION_NAMES, 3)
-            dosages = ["朝1錠", "朝夕各1錠", "毎食後1錠", "就寝前1錠", "頓服"]
-            schedules = ["食後", "食前", "食間", "就寝前", "必要時"]
             
             for med_name in selected_meds:
                 medication = Medication(
                     user_id=user.user_id,
                     name=med_name,
-                    dosage=random.choice(dosages),
-                    schedule=random.choice(schedules)
+                    dosage=random.choice(DOSAGES),
+                    schedule=random.choice(SCHEDULES)
                 )
                 db.add(medication)
         
@@ -274,6 +319,182 @@ def insert_sample_data():
         db.close()
 
 
+# =========================
+# 負荷試験用データ生成
+# =========================
+
+# 生成範囲（東京都程度の広さ: 南端, 北端, 西端, 東端）
+LOAD_REGION = (35.50, 35.90, 139.00, 139.95)
+# 避難所を中心としたユーザー分布の標準偏差（km）
+LOAD_USER_SPREAD_KM = 1.2
+# 負荷試験用アカウントの共通パスワード
+LOAD_PASSWORD = "loadtest-pass"
+
+
+def _load_offsets(conn: Connection) -> tuple[int, int]:
+    """既存の負荷試験用データの件数（続きの番号から生成するため）"""
+    users = conn.execute(
+        select(func.count()).select_from(User).where(User.email.like("load-user%@example.com"))
+    ).scalar_one()
+    shelters = conn.execute(
+        select(func.count()).select_from(Shelter).where(Shelter.name.like("負荷試験避難所%"))
+    ).scalar_one()
+    return users, shelters
+
+
+def generate_load_data(n_users: int, n_shelters: int, n_medications: int = 50,
+                       batch_size: int = 10000, seed: int = 42):
+    """
+    負荷試験用の大規模データを生成
+
+    避難所を範囲内に配置し、ユーザーは人口の偏りを付けた避難所の周辺に正規分布で配置する。
+    パスワードハッシュは最小コストのbcryptで1回だけ計算して全アカウントで共有し、
+    行はバッチ単位の一括INSERTで挿入する。
+    """
+    import numpy as np
+    
+    print(f"=== 負荷試験用データ生成 (ユーザー {n_users:,} 名, 避難所 {n_shelters:,} 件) ===")
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    password_hash = pwd_context.handler("bcrypt").using(rounds=4).hash(LOAD_PASSWORD)
+    
+    # 医薬品カタログ（よく使われる薬ほど選ばれやすい）
+    catalog = MEDICATION_NAMES + [
+        f"負荷試験用医薬品{k:03d}" for k in range(max(0, n_medications - len(MEDICATION_NAMES)))
+    ]
+    popularity = 1.0 / np.arange(1, len(catalog) + 1)
+    popularity /= popularity.sum()
+    
+    # 一括INSERTはセッションを経由せず catalog_id が設定されないため、先にカタログIDに変換しておく
+    with engine.begin() as conn:
+        catalog_ids = resolve_catalog_ids(conn, catalog)
+    with engine.connect() as conn:
+        user_offset, shelter_offset = _load_offsets(conn)
+    
+    # 避難所・管理者・在庫
+    south, north, west, east = LOAD_REGION
+    shelter_lat = rng.uniform(south, north, n_shelters)
+    shelter_lon = rng.uniform(west, east, n_shelters)
+    shelter_ids = [uuid.uuid4() for _ in range(n_shelters)]
+    with engine.begin() as conn:
+        conn.execute(Shelter.__table__.insert(), [
+            {
+                "shelter_id": shelter_ids[i],
+                "name": f"負荷試験避難所{shelter_offset + i + 1:05d}",
+                "address": f"負荷試験市{shelter_offset + i + 1:05d}",
+                "latitude": round(float(shelter_lat[i]), 6),
+                "longitude": round(float(shelter_lon[i]), 6),
+                "aggregate_range": "3",
+            }
+            for i in range(n_shelters)
+        ])
+        conn.execute(ShelterAdmin.__table__.insert(), [
+            {
+                "admin_id": uuid.uuid4(),
+                "email": f"load-admin{shelter_offset + i + 1:05d}@example.com",
+                "password_hash": password_hash,
+                "name": f"負荷試験管理者{shelter_offset + i + 1:05d}",
+                "shelter_id": shelter_ids[i],
+            }
+            for i in range(n_shelters)
+        ])
+        quantities = rng.choice([0, 10, 20, 30, 50, 100], size=(n_shelters, len(catalog)))
+        expiry_days = rng.integers(-30, 1095, size=(n_shelters, len(catalog)))
+        for start in range(0, n_shelters, max(1, batch_size // len(catalog))):
+            end = min(n_shelters, start + max(1, batch_size // len(catalog)))
+            conn.execute(MedicationInventory.__table__.insert(), [
+                {
+                    "shelter_id": shelter_ids[i],
+                    "catalog_id": catalog_ids[name],
+                    "medication_name": name,
+                    "quantity": int(quantities[i, k]),
+                    "expiry_date": date.today() + timedelta(days=int(expiry_days[i, k])),
+                    "description": MEDICATION_DESCRIPTIONS.get(name, "医薬品の詳細情報"),
+                }
+                for i in range(start, end)
+                for k, name in enumerate(catalog)
+            ])
+    print(f"  ✓ 避難所・管理者・在庫を作成 ({time.perf_counter() - started:.1f}秒)")
+    
+    # ユーザーと医薬品（バッチごとに生成してコミットし、メモリ使用量を一定に保つ）
+    shelter_weights = rng.lognormal(0.0, 1.0, n_shelters)
+    shelter_weights /= shelter_weights.sum()
+    birthday_base = date(1930, 1, 1)
+    created_users = created_medications = 0
+    for start in range(0, n_users, batch_size):
+        size = min(batch_size, n_users - start)
+        home = rng.choice(n_shelters, size=size, p=shelter_weights)
+        lat = shelter_lat[home] + rng.normal(0.0, LOAD_USER_SPREAD_KM, size) / KM_PER_DEGREE
+        lon = shelter_lon[home] + rng.normal(0.0, LOAD_USER_SPREAD_KM, size) / (
+            KM_PER_DEGREE * np.cos(np.radians(shelter_lat[home]))
+        )
+        birthday_days = rng.integers(0, 90 * 365, size)
+        blood = rng.integers(0, len(BLOOD_TYPES), size)
+        allergy = rng.integers(0, len(ALLERGIES), size)
+        condition = rng.integers(0, len(CONDITIONS), size)
+        user_ids = [uuid.uuid4() for _ in range(size)]
+        
+        # 1人あたり0～6種類（同じ薬の重複は除く）
+        counts = np.minimum(rng.poisson(2.0, size), 6)
+        owners = np.repeat(np.arange(size), counts)
+        picks = rng.choice(len(catalog), size=len(owners), p=popularity)
+        codes = np.unique(owners * len(catalog) + picks)
+        owners, picks = np.divmod(codes, len(catalog))
+        dosage = rng.integers(0, len(DOSAGES), len(owners))
+        schedule = rng.integers(0, len(SCHEDULES), len(owners))
+        
+        with engine.begin() as conn:
+            conn.execute(User.__table__.insert(), [
+                {
+                    "user_id": user_ids[i],
+                    "email": f"load-user{user_offset + start + i + 1:07d}@example.com",
+                    "password_hash": password_hash,
+                    "name": f"負荷試験 利用者{user_offset + start + i + 1:07d}",
+                    "birthday": birthday_base + timedelta(days=int(birthday_days[i])),
+                    "blood_type": BLOOD_TYPES[blood[i]],
+                    "allergy_name": ALLERGIES[allergy[i]],
+                    "condition_name": CONDITIONS[condition[i]],
+                    "latitude": round(float(lat[i]), 6),
+                    "longitude": round(float(lon[i]), 6),
+                }
+                for i in range(size)
+            ])
+            if len(owners):
+                conn.execute(Medication.__table__.insert(), [
+                    {
+                        "user_id": user_ids[owners[j]],
+                        "name": catalog[picks[j]],
+                        "catalog_id": catalog_ids[catalog[picks[j]]],
+                        "dosage": DOSAGES[dosage[j]],
+                        "schedule": SCHEDULES[schedule[j]],
+                    }
+                    for j in range(len(owners))
+                ])
+        
+        created_users += size
+        created_medications += len(owners)
+        elapsed = time.perf_counter() - started
+        print(f"  ✓ ユーザー {created_users:,}/{n_users:,} 名, 医薬品 {created_medications:,} 件"
+              f" ({elapsed:.1f}秒, {created_users / elapsed:,.0f} 名/秒)")
+    
+    print(f"=== 完了 ({time.perf_counter() - started:.1f}秒) ===")
+    print(f"  ユーザー: load-user{user_offset + 1:07d}@example.com ～ "
+          f"load-user{user_offset + n_users:07d}@example.com")
+    print(f"  管理者: load-admin{shelter_offset + 1:05d}@example.com ～ "
+          f"load-admin{shelter_offset + n_shelters:05d}@example.com")
+    print(f"  パスワード（共通）: {LOAD_PASSWORD}")
+
+
+def _parse_generate_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="db_manager.py generate")
+    parser.add_argument("--users", type=int, required=True, help="ユーザー数")
+    parser.add_argument("--shelters", type=int, required=True, help="避難所数")
+    parser.add_argument("--medications", type=int, default=50, help="医薬品の種類数")
+    parser.add_argument("--batch-size", type=int, default=10000, help="1回のINSERTにまとめる行数")
+    parser.add_argument("--seed", type=int, default=42, help="乱数シード")
+    return parser.parse_args(argv)
+
+
 def show_table_structure(table_name: str):
     """指定されたテーブルの構造を表示"""
     print(f"=== テーブル '{table_name}' の構造 ===")
@@ -297,16 +518,364 @@ def show_table_structure(table_name: str):
             print(f"  テーブル '{table_name}' が存在しません")
 
 
+# =========================
+# マイグレーション
+# =========================
+
+# 適用済みマイグレーションの記録（アプリのモデルとは別に管理）
+migration_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    migration_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False, server_default=func.now()),
+)
+
+# 同時に複数の migrate が走らないようにするアドバイザリロックのキー（PostgreSQLのみ）
+MIGRATION_LOCK_KEY = 20250801
+
+
+class Migration(NamedTuple):
+    """バージョン付きのマイグレーション（apply は何度実行しても同じ結果になるように書く）"""
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def _create_index(
+    conn: Connection,
+    name: str,
+    table: str,
+    columns: list[str],
+    unique: bool = False,
+    where: Optional[str] = None,
+):
+    """
+    インデックスが無ければ作成（where を指定すると部分インデックス）
+
+    PostgreSQLでは CONCURRENTLY を使い、作成中も書き込みをブロックしない。
+    途中で失敗して無効（INVALID）のまま残ったインデックスは作り直す。
+    """
+    postgresql = conn.dialect.name == "postgresql"
+    if postgresql:
+        invalid = conn.execute(text("""
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name AND NOT i.indisvalid
+        """), {"name": name}).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    
+    conn.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX {'CONCURRENTLY ' if postgresql else ''}"
+        f"IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+        + (f" WHERE {where}" if where else "")
+    ))
+    print(f"  ✓ インデックス '{name}' ({table}: {', '.join(columns)}{f' WHERE {where}' if where else ''})")
+
+
+def _drop_index(conn: Connection, name: str):
+    """インデックスがあれば削除（PostgreSQLでは CONCURRENTLY）"""
+    concurrently = "CONCURRENTLY " if conn.dialect.name == "postgresql" else ""
+    conn.execute(text(f"DROP INDEX {concurrently}IF EXISTS {name}"))
+    print(f"  ✓ インデックス '{name}' を削除")
+
+
+def _migration_0001(conn: Connection):
+    # 重複があると一意インデックスを作れないため、データを消さずに中止して確認を促す
+    duplicates = conn.execute(text("""
+        SELECT shelter_id, medication_name, COUNT(*)
+        FROM medication_inventory
+        GROUP BY shelter_id, medication_name
+        HAVING COUNT(*) > 1
+    """)).fetchall()
+    if duplicates:
+        for shelter_id, medication_name, count in duplicates:
+            print(f"  - 重複: 避難所 {shelter_id} / {medication_name} ({count}件)")
+        raise RuntimeError("medication_inventory に重複があります。整理してから再実行してください")
+    
+    _create_index(
+        conn, "ux_medication_inventory_shelter_medication",
+        "medication_inventory", ["shelter_id", "medication_name"], unique=True
+    )
+
+
+def _migration_0002(conn: Connection):
+    # medication_inventory.shelter_id は 0001 の一意インデックスの先頭列で検索できる
+    _create_index(conn, "ix_medications_user_id", "medications", ["user_id"])
+    _create_index(conn, "ix_medications_name", "medications", ["name"])
+    _create_index(conn, "ix_shelter_admins_shelter_id", "shelter_admins", ["shelter_id"])
+    _create_index(conn, "ix_medication_inventory_expiry_date", "medication_inventory", ["expiry_date"])
+    _create_index(conn, "ix_users_latitude_longitude", "users", ["latitude", "longitude"])
+
+
+def _migration_0003(conn: Connection):
+    # 既存の行は変更番号0（全件同期でのみ返される）として追加する
+    columns = {
+        "shelters": ["change_seq", "demand_seq"],
+        "medication_inventory": ["change_seq"],
+    }
+    inspector = inspect(conn)
+    for table, names in columns.items():
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        for name in names:
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} BIGINT NOT NULL DEFAULT 0"))
+                print(f"  ✓ 列 '{table}.{name}'")
+    
+    SyncState.__table__.create(conn, checkfirst=True)
+    SyncTombstone.__table__.create(conn, checkfirst=True)
+    ensure_sync_state(conn)
+    _create_index(conn, "ix_shelters_change_seq", "shelters", ["change_seq"])
+    _create_index(conn, "ix_shelters_demand_seq", "shelters", ["demand_seq"])
+    _create_index(conn, "ix_medication_inventory_change_seq", "medication_inventory", ["change_seq"])
+
+
+def _has_catalog_ids(conn: Connection) -> bool:
+    """0006 の catalog_id 列が追加済みか（ビューの定義は最新のスキーマを前提とするため、未追加なら 0006 で作成する）"""
+    return "catalog_id" in {column["name"] for column in inspect(conn).get_columns("medication_inventory")}
+
+
+def _migration_0004(conn: Connection):
+    # SQLiteでは作成せず、レポートはその場で集計する
+    if _has_catalog_ids(conn):
+        ensure_balance_view(conn)
+
+
+
+def _migration_0005(conn: Connection):
+    # 期限日で範囲を読み、避難所で絞り込む（期限未設定の行は含めない）。先頭列が同じため単独のインデックスは削除する
+    _create_index(
+        conn, "ix_medication_inventory_expiry_shelter", "medication_inventory",
+        ["expiry_date", "shelter_id"], where="expiry_date IS NOT NULL"
+    )
+    _drop_index(conn, "ix_medication_inventory_expiry_date")
+    # 期限切れを使用可能な在庫数から除くよう、ビューを作り直す
+    if conn.dialect.name == "postgresql" and _has_catalog_ids(conn):
+        conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {BALANCE_VIEW}"))
+        ensure_balance_view(conn)
+
+
+def _migration_0006(conn: Connection):
+    # 名前の表記の揺れを吸収するため、医薬品・在庫をカタログIDで結び付ける（名前の列は表示用に残す）
+    MedicationCatalog.__table__.create(conn, checkfirst=True)
+    MedicationAlias.__table__.create(conn, checkfirst=True)
+    inspector = inspect(conn)
+    for table in ("medications", "medication_inventory"):
+        existing = {column["name"] for column in inspector.get_columns(table)}
+        if "catalog_id" not in existing:
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN catalog_id INTEGER REFERENCES medication_catalog(catalog_id)"
+            ))
+            print(f"  ✓ 列 '{table}.catalog_id'")
+    
+    # 既存の名前をカタログに登録し、名前ごとに catalog_id を設定する
+    medications = Medication.__table__
+    inventory = MedicationInventory.__table__
+    names = set(conn.execute(
+        select(medications.c.name).where(medications.c.catalog_id.is_(None)).distinct()
+    ).scalars())
+    names |= set(conn.execute(
+        select(inventory.c.medication_name).where(inventory.c.catalog_id.is_(None)).distinct()
+    ).scalars())
+    if names:
+        catalog_ids = resolve_catalog_ids(conn, names)
+        params = [{"b_name": name, "b_catalog_id": catalog_id} for name, catalog_id in catalog_ids.items()]
+        conn.execute(
+            update(medications)
+            .where(medications.c.name == bindparam("b_name"), medications.c.catalog_id.is_(None))
+            .values(catalog_id=bindparam("b_catalog_id")),
+            params
+        )
+        conn.execute(
+            update(inventory)
+            .where(inventory.c.medication_name == bindparam("b_name"), inventory.c.catalog_id.is_(None))
+            .values(catalog_id=bindparam("b_catalog_id")),
+            params
+        )
+        print(f"  ✓ 医薬品名 {len(names):,} 件をカタログに登録")
+    
+    # 表記の揺れで別々だった在庫が同じ医薬品になる場合は、データを消さずに中止して確認を促す
+    duplicates = conn.execute(text("""
+        SELECT shelter_id, catalog_id, COUNT(*)
+        FROM medication_inventory
+        GROUP BY shelter_id, catalog_id
+        HAVING COUNT(*) > 1
+    """)).fetchall()
+    if duplicates:
+        for shelter_id, catalog_id, count in duplicates:
+            print(f"  - 重複: 避難所 {shelter_id} / カタログID {catalog_id} ({count}件)")
+        raise RuntimeError("medication_inventory に同じ医薬品の在庫が複数あります。整理してから再実行してください")
+    
+    _create_index(
+        conn, "ux_medication_inventory_shelter_catalog",
+        "medication_inventory", ["shelter_id", "catalog_id"], unique=True
+    )
+    _create_index(conn, "ix_medications_catalog_id", "medications", ["catalog_id"])
+    _drop_index(conn, "ux_medication_inventory_shelter_medication")
+    _drop_index(conn, "ix_medications_name")
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE medications ALTER COLUMN catalog_id SET NOT NULL"))
+        conn.execute(text("ALTER TABLE medication_inventory ALTER COLUMN catalog_id SET NOT NULL"))
+        # 在庫と需要をカタログIDで結合するよう、ビューを作り直す
+        conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {BALANCE_VIEW}"))
+        ensure_balance_view(conn)
+
+
+def _migration_0007(conn: Connection):
+    # ビューの集計時点を別の表に記録する（ビューが0行でも集計済みと判定するため）。
+    # 既存のビューの集計時点は記録しないため、次の確認で1回だけ再集計される
+    BalanceViewState.__table__.create(conn, checkfirst=True)
+
+
+def _migration_0008(conn: Connection):
+    # 削除記録を保持期間で削除するため、削除済みの範囲を記録する（これより前のカーソルには全件を返す）
+    existing = {column["name"] for column in inspect(conn).get_columns("sync_state")}
+    if "pruned_seq" not in existing:
+        conn.execute(text("ALTER TABLE sync_state ADD COLUMN pruned_seq BIGINT NOT NULL DEFAULT 0"))
+        print("  ✓ 列 'sync_state.pruned_seq'")
+
+
+MIGRATIONS = [
+    Migration(1, "在庫の (shelter_id, medication_name) 一意インデックス", _migration_0001),
+    Migration(2, "外部キー・検索条件のインデックス", _migration_0002),
+    Migration(3, "差分同期の変更番号・削除記録", _migration_0003),
+    Migration(4, "不足・余剰レポートのマテリアライズドビュー（PostgreSQLのみ）", _migration_0004),
+    Migration(5, "有効期限の部分インデックス、期限切れを除いた不足・余剰レポート", _migration_0005),
+    Migration(6, "医薬品カタログ、在庫・需要のカタログIDでの突き合わせ", _migration_0006),
+    Migration(7, "不足・余剰レポートの集計時点の記録", _migration_0007),
+    Migration(8, "差分同期の削除記録の保持期間", _migration_0008),
+]
+
+
+def _applied_versions(conn: Connection) -> dict[int, object]:
+    schema_migrations.create(conn, checkfirst=True)
+    rows = conn.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at))
+    return dict(rows.all())
+
+
+def migrate():
+    """未適用のマイグレーションを順に適用（データは削除しない）"""
+    print("=== マイグレーション ===")
+    # CONCURRENTLY はトランザクション外でしか実行できないため自動コミットで接続する
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        postgresql = conn.dialect.name == "postgresql"
+        if postgresql:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            applied = _applied_versions(conn)
+            pending = [m for m in MIGRATIONS if m.version not in applied]
+            if not pending:
+                print("  適用が必要なマイグレーションはありません")
+                return
+            for migration in pending:
+                print(f"[{migration.version:04d}] {migration.description}")
+                migration.apply(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=migration.version, description=migration.description
+                ))
+            print("=== 完了 ===")
+        finally:
+            if postgresql:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+
+
+def show_migrations():
+    """マイグレーションの適用状況を表示"""
+    print("=== マイグレーション一覧 ===")
+    with engine.begin() as conn:
+        applied = _applied_versions(conn)
+    for migration in MIGRATIONS:
+        applied_at = applied.get(migration.version)
+        status = f"適用済み ({applied_at})" if applied_at else "未適用"
+        print(f"  [{migration.version:04d}] {migration.description}: {status}")
+
+
+# =========================
+# 実行計画の確認
+# =========================
+
+class Explain(Executable, ClauseElement):
+    """SELECT文を EXPLAIN ANALYZE（SQLiteでは EXPLAIN QUERY PLAN）で包む"""
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    if compiler.dialect.name == "postgresql":
+        prefix = "EXPLAIN (ANALYZE, BUFFERS) "
+    else:
+        prefix = "EXPLAIN QUERY PLAN "
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def _hot_queries(conn: Connection) -> Optional[list[tuple[str, object]]]:
+    """サービス層の主要クエリを、DB内の実データをパラメータにして組み立てる"""
+    from services.admin_auth import AdminAuthService
+    from services.expiry import ExpiryService
+    from services.user_auth import UserAuthService
+    
+    user = conn.execute(select(User.user_id, User.email)).first()
+    shelter = conn.execute(
+        select(Shelter.shelter_id, Shelter.latitude, Shelter.longitude, Shelter.aggregate_range)
+    ).first()
+    if user is None or shelter is None:
+        return None
+    
+    range_km = AdminAuthService._get_range_km(shelter)
+    inventory = AdminAuthService._inventory_with_shelter_query()
+    
+    queries = [
+        ("ログイン（メールアドレス検索）", select(User).where(User.email == user.email)),
+        ("QRコード用医療情報", UserAuthService._medical_info_query(user.user_id)),
+        ("避難所の在庫一覧", inventory.where(MedicationInventory.shelter_id == shelter.shelter_id)),
+        ("在庫一覧（キーセットページ）", inventory.where(MedicationInventory.inventory_id > 0).limit(200)),
+        ("避難所の管理者", select(ShelterAdmin).where(ShelterAdmin.shelter_id == shelter.shelter_id)),
+        ("有効期限が近い在庫", ExpiryService._expiring_query(date.today(), 30, None, False).limit(1000)),
+    ]
+    # 距離計算に三角関数を使うためPostgreSQLのみ
+    if conn.dialect.name == "postgresql":
+        queries.append((
+            "避難所の医薬品需要（SQL集計）",
+            AdminAuthService._medication_demand_query(
+                float(shelter.latitude), float(shelter.longitude), range_km
+            ),
+        ))
+    return queries
+
+
+def explain_hot_queries():
+    """主要クエリの実行計画を表示し、インデックスが使われているかを確認する"""
+    print("=== 主要クエリの実行計画 ===")
+    with engine.connect() as conn:
+        queries = _hot_queries(conn)
+        if queries is None:
+            print("  データがありません。先に seed を実行してください")
+            return
+        for label, statement in queries:
+            print(f"\n--- {label} ---")
+            for row in conn.execute(Explain(statement)):
+                # PostgreSQLは1列、SQLiteは (id, parent, notused, detail) の4列
+                print(f"  {row[-1]}")
+
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("使用方法:")
-        print("  python db_manager.py recreate    # テーブルを再作成")
+        print("  python db_manager.py recreate    # テーブルを再作成 + マイグレーション")
         print("  python db_manager.py create      # テーブルを作成")
-        print("  python db_manager.py drop        # テーブルを削除")
+        print("  python db_manager.py drop        # テーブル・ビューを削除")
         print("  python db_manager.py show        # テーブル一覧を表示")
         print("  python db_manager.py structure <table_name>  # テーブル構造を表示")
         print("  python db_manager.py seed        # サンプルデータを挿入")
-        print("  python db_manager.py setup       # テーブル作成 + サンプルデータ挿入")
+        print("  python db_manager.py setup       # テーブル作成 + マイグレーション + サンプルデータ挿入")
+        print("  python db_manager.py generate --users N --shelters M  # 負荷試験用の大規模データを生成")
+        print("  python db_manager.py migrate     # 未適用のマイグレーションを適用")
+        print("  python db_manager.py migrations  # マイグレーションの適用状況を表示")
+        print("  python db_manager.py explain     # 主要クエリの実行計画を表示")
         sys.exit(1)
     
     command = sys.argv[1].lower()
@@ -326,7 +895,17 @@ if __name__ == "__main__":
             insert_sample_data()
         elif command == "setup":
             create_all_tables()
+            migrate()
             insert_sample_data()
+        elif command == "generate":
+            args = _parse_generate_args(sys.argv[2:])
+            generate_load_data(args.users, args.shelters, args.medications, args.batch_size, args.seed)
+        elif command == "migrate":
+            migrate()
+        elif command == "migrations":
+            show_migrations()
+        elif command == "explain":
+            explain_hot_queries()
         else:
             print(f"不明なコマンド: {command}")
             sys.exit(1)
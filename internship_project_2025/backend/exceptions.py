@@ -5,6 +5,7 @@ APIで発生する例外を適切にハンドリングする
 """
 
 from fastapi import Request, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 import logging
@@ -35,7 +36,8 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={
             "error": True,
             "message": "入力データが正しくありません",
-            "details": exc.errors(),
+            # バリデーターが送出した例外オブジェクト（ctx.error）もJSONに変換する
+            "details": jsonable_encoder(exc.errors()),
             "status_code": 422
         }
     )
@@ -0,0 +1,135 @@
+"""
+SQL計測
+
+リクエストごとにSQLの実行回数・合計時間・最も遅いSQLを記録し、
+Server-Timing レスポンスヘッダーと構造化ログ（1行のJSON）に出力する。
+しきい値を超えたSQLはリクエスト外（起動時処理など）でもスロークエリとしてログに出力する
+"""
+
+import json
+import logging
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import settings
+
+logger = logging.getLogger("sql")
+
+# ログに出力するSQL文の最大長（パラメータは個人情報を含むため出力しない）
+MAX_STATEMENT_LENGTH = 500
+
+
+class QueryStats:
+    """1リクエスト分のSQL実行の集計"""
+
+    __slots__ = ("count", "total_ms", "slowest_ms", "slowest_statement")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_statement: Optional[str] = None
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest_statement = statement
+
+
+# 処理中のリクエストの集計（リクエスト外ではNone）
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("sql_query_stats", default=None)
+
+
+def _shorten(statement: str) -> str:
+    statement = " ".join(statement.split())
+    if len(statement) > MAX_STATEMENT_LENGTH:
+        statement = statement[:MAX_STATEMENT_LENGTH] + "..."
+    return statement
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["query_start_times"].pop()) * 1000
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(statement, elapsed_ms)
+    if elapsed_ms >= settings.slow_query_ms:
+        logger.warning(json.dumps({
+            "event": "slow_query",
+            "duration_ms": round(elapsed_ms, 2),
+            "executemany": executemany,
+            "statement": _shorten(statement),
+        }, ensure_ascii=False))
+
+
+def _handle_error(exception_context):
+    # 失敗したSQLでは after_cursor_execute が呼ばれないため、開始時刻をここで取り除く
+    conn = exception_context.connection
+    if conn is None or exception_context.execution_context is None:
+        return
+    start_times = conn.info.get("query_start_times")
+    if start_times:
+        start_times.pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """エンジンにSQL計測のイベントを登録（非同期エンジンは sync_engine を渡す）"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class QueryStatsMiddleware:
+    """
+    リクエストごとのSQL集計を行うASGIミドルウェア
+
+    集計値はレスポンスヘッダーの送信時点のもの。
+    ストリーミングレスポンスの送信中に実行されたSQLはログにのみ含まれる。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current_stats.set(stats)
+        status_code = None
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                timing = f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries"'
+                message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_stats.reset(token)
+            if stats.count:
+                # パスにはQRコードのトークンでもあるユーザーIDが含まれるため、ルートのテンプレートを出力する
+                route = scope.get("route")
+                logger.info(json.dumps({
+                    "event": "request_sql",
+                    "method": scope["method"],
+                    "path": getattr(route, "path", None) or scope["path"],
+                    "status": status_code,
+                    "query_count": stats.count,
+                    "db_ms": round(stats.total_ms, 2),
+                    "slowest_ms": round(stats.slowest_ms, 2),
+                    "slowest_statement": _shorten(stats.slowest_statement or ""),
+                }, ensure_ascii=False))
@@ -4,19 +4,109 @@
 個人の医療情報管理と避難所の医薬品在庫管理を統合したAPIサービス
 """
 
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
+from sqlalchemy import text
 
 from config import settings
-from database import create_tables, SessionLocal
+from database import create_tables, SessionLocal, engine, async_engine
 from routers import users, shelter_admins
 from exceptions import (
     http_exception_handler,
     validation_exception_handler,
     general_exception_handler
 )
+from instrumentation import QueryStatsMiddleware, instrument_engine
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, registry as metrics_registry
 from models import Shelter
+from services.change_seq import ensure_sync_state
+from services.expiry import refresh_expiry_summary, run_expiry_sweeper
+from services.password_hasher import password_hash_pool
+from services.qr_sheet import qr_render_pool
+from services.shortage_report import run_balance_view_refresher
+from services.sync import run_tombstone_pruner
+
+# 起動処理の排他に使うアドバイザリロックのキー（db_manager.py のマイグレーション用とは別の値）
+STARTUP_LOCK_KEY = 0x5EED_0001
+
+
+def init_sample_data():
+    """アプリ起動時にサンプルデータがない場合は自動挿入"""
+    db = SessionLocal()
+    try:
+        # 避難所データが存在するかチェック
+        existing_shelters = db.query(Shelter).count()
+        if existing_shelters == 0:
+            print("初期データが見つかりません。サンプルデータを自動挿入します...")
+            # db_manager.pyの関数を使用してサンプルデータを挿入
+            from db_manager import insert_sample_data
+            insert_sample_data()
+        else:
+            print(f"既存データが見つかりました (避難所数: {existing_shelters})")
+    finally:
+        db.close()
+
+
+def init_database():
+    """
+    テーブル作成、マイグレーションの適用とサンプルデータの初期化
+
+    create_all は既存のテーブルに列を追加しないため、続けて db_manager.py のマイグレーションを適用する
+    （適用済みのものは飛ばし、作成したばかりのテーブルでは適用済みとして記録するだけになる）。
+    PostgreSQLではアドバイザリロックで排他し、複数ワーカーの同時起動時も1つのワーカーだけが実行する。
+    後続のワーカーはロックの解放を待ち、作成済みのテーブルとデータを確認するだけになる
+    """
+    from db_manager import migrate
+    
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        postgresql = conn.dialect.name == "postgresql"
+        if postgresql:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": STARTUP_LOCK_KEY})
+        try:
+            create_tables()
+            migrate()
+            with engine.begin() as state_conn:
+                ensure_sync_state(state_conn)
+            # 不足・余剰レポートのビューはマイグレーションで作成し、サンプルデータは次の再集計で反映される
+            init_sample_data()
+        finally:
+            if postgresql:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": STARTUP_LOCK_KEY})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    起動時にデータベースを初期化して有効期限を集計し、有効期限の集計タスク、削除記録の削除タスクと、
+    PostgreSQLでは不足・余剰レポートの再集計タスクを開始する。
+    終了時にタスクを止め、非同期エンジンの接続プールと、bcrypt用・QRコード生成用のワーカープールを閉じる
+    """
+    if settings.init_database_on_startup:
+        await asyncio.to_thread(init_database)
+    await refresh_expiry_summary()
+    tasks = [
+        asyncio.create_task(run_expiry_sweeper(settings.expiry_sweep_seconds)),
+        asyncio.create_task(run_tombstone_pruner(
+            settings.sync_tombstone_retention_days, settings.sync_tombstone_prune_seconds
+        )),
+    ]
+    if async_engine.dialect.name == "postgresql":
+        tasks.append(asyncio.create_task(
+            run_balance_view_refresher(async_engine, settings.shortage_report_refresh_seconds)
+        ))
+    yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await async_engine.dispose()
+    password_hash_pool.shutdown()
+    qr_render_pool.shutdown()
+
 
 # FastAPIアプリケーションを作成
 app = FastAPI(
@@ -24,7 +114,8 @@ app = FastAPI(
     description="災害時における医薬品情報の安全かつ効率的な共有を実現するAPIサービス",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # 例外ハンドラーを追加
@@ -39,30 +130,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# データベーステーブルを作成
-create_tables()
-
-# 初期データが存在しない場合はサンプルデータを自動挿入
-def init_sample_data():
-    """アプリ起動時にサンプルデータがない場合は自動挿入"""
-    db = SessionLocal()
-    try:
-        # 避難所データが存在するかチェック
-        existing_shelters = db.query(Shelter).count()
-        if existing_shelters == 0:
-            print("初期データが見つかりません。サンプルデータを自動挿入します...")
-            # db_manager.pyの関数を使用してサンプルデータを挿入
-            from db_manager import insert_sample_data
-            insert_sample_data()
-        else:
-            print(f"既存データが見つかりました (避難所数: {existing_shelters})")
-    finally:
-        db.close()
+# リクエストごとのSQL計測（Server-Timing ヘッダーと構造化ログ）
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+app.add_middleware(QueryStatsMiddleware)
 
-# サンプルデータの初期化
-init_sample_data()
+# ルートごとのレイテンシ計測（/metrics で出力）
+app.add_middleware(MetricsMiddleware)
 
 # APIルーターを登録
 app.include_router(users.router, prefix="/api")
@@ -88,3 +165,10 @@ async def health_check():
     ヘルスチェックエンドポイント
     """
     return {"status": "healthy", "service": "disaster-medical-api"}
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    メトリクスエンドポイント（Prometheusのテキスト形式）
+    """
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
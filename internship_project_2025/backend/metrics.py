@@ -0,0 +1,266 @@
+"""
+メトリクス
+
+プロセス内のメトリクスレジストリと、ルートごとのレイテンシを記録するASGIミドルウェア。
+/metrics で Prometheus のテキスト形式として出力する。
+
+観測値の更新はすべてイベントループのスレッドで行うため、ロックは使わない。
+接続プールやキャッシュの状態は、出力時にコールバックで読み取る
+"""
+
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+from database import engine, async_engine
+from services.demand_cache import medication_demand_cache
+from services.expiry import expiry_sweeper
+from services.inventory_events import inventory_broadcaster
+from services.medical_info_cache import medical_info_cache
+from services.medication_catalog import catalog_id_cache
+from services.password_hasher import password_hash_pool
+from services.principal_cache import principal_cache
+from services.qr_image import qr_image_cache
+
+# レイテンシのバケット（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Samples = Iterable[tuple[tuple, float]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """単調増加するカウンター"""
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """増減する値"""
+
+    def dec(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class CallbackMetric:
+    """出力時にコールバックで値を読み取るメトリクス（gauge または counter）"""
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...],
+                 callback: Callable[[], Samples], metric_type: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.metric_type}"]
+        for labels, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    バケット付きのヒストグラム
+
+    系列ごとに [各バケットの件数..., +Infの件数, 合計値] を1つのリストで持ち、
+    累積値への変換は出力時に行う。
+    """
+
+    def __init__(self, name: str, help: str, label_names: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {series[-1]!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスの登録と出力"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, label_names: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, label_names, buckets))
+
+    def callback(self, name: str, help: str, label_names: tuple[str, ...],
+                 callback: Callable[[], Samples], metric_type: str = "gauge") -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, label_names, callback, metric_type))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTPリクエストの処理時間", ("method", "route", "status")
+)
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "処理中のHTTPリクエスト数"
+)
+
+
+class MetricsMiddleware:
+    """
+    ルートごとのレイテンシと処理中のリクエスト数を記録するASGIミドルウェア
+
+    route にはパスではなくルートのテンプレートを使い、系列数がユーザー数に比例して増えないようにする。
+    レイテンシはレスポンスの送信完了までの時間。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            http_request_duration.observe(
+                (scope["method"], getattr(route, "path", None) or "unmatched", status_code),
+                time.perf_counter() - start
+            )
+
+
+# =========================
+# 出力時に読み取るメトリクス
+# =========================
+
+CACHES = {
+    "medication_demand": medication_demand_cache,
+    "principal": principal_cache,
+    "medical_info": medical_info_cache,
+    "qr_image": qr_image_cache,
+    "medication_catalog": catalog_id_cache,
+}
+
+POOLS = {
+    "sync": engine.pool,
+    "async": async_engine.pool,
+}
+
+
+def _pool_samples(method: str) -> Samples:
+    for name, pool in POOLS.items():
+        # QueuePool 以外（SQLiteの一部のプールなど）は状態を持たない
+        if hasattr(pool, method):
+            yield (name,), getattr(pool, method)()
+
+
+def _cache_samples(key: str) -> Samples:
+    for name, cache in CACHES.items():
+        yield (name,), cache.stats()[key]
+
+
+registry.callback("db_pool_size", "接続プールの常設接続数", ("engine",), lambda: _pool_samples("size"))
+registry.callback("db_pool_checked_out", "使用中の接続数", ("engine",), lambda: _pool_samples("checkedout"))
+registry.callback("db_pool_checked_in", "待機中の接続数", ("engine",), lambda: _pool_samples("checkedin"))
+registry.callback("db_pool_overflow", "常設数を超えて作成された接続数", ("engine",), lambda: _pool_samples("overflow"))
+
+registry.callback("cache_hits_total", "キャッシュのヒット数", ("cache",), lambda: _cache_samples("hits"), "counter")
+registry.callback("cache_misses_total", "キャッシュのミス数", ("cache",), lambda: _cache_samples("misses"), "counter")
+registry.callback("cache_evictions_total", "件数上限による追い出し数", ("cache",), lambda: _cache_samples("evictions"), "counter")
+registry.callback("cache_entries", "キャッシュの件数", ("cache",), lambda: _cache_samples("size"))
+registry.callback("cache_hit_ratio", "キャッシュのヒット率", ("cache",), lambda: _cache_samples("hit_ratio"))
+
+registry.callback("password_hash_in_flight", "bcryptの実行中と待機中の合計", (),
+                  lambda: [((), password_hash_pool.in_flight)])
+registry.callback("password_hash_queue_depth", "bcryptのワーカーの空きを待っている件数", (),
+                  lambda: [((), password_hash_pool.queue_depth)])
+registry.callback("password_hash_rejected_total", "待ち行列の上限により拒否したbcrypt処理の数", (),
+                  lambda: [((), password_hash_pool.rejected)], "counter")
+
+registry.callback("inventory_event_subscribers", "在庫変更を購読中の接続数", (),
+                  lambda: [((), inventory_broadcaster.subscriber_count)])
+registry.callback("inventory_event_resyncs_total", "受信の遅れにより再取得を通知した購読の数", (),
+                  lambda: [((), inventory_broadcaster.dropped)], "counter")
+registry.callback("inventory_expiry_sweeps_total", "有効期限日ごとの集計を作り直した回数", (),
+                  lambda: [((), expiry_sweeper.sweeps)], "counter")
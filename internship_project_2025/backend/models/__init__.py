@@ -4,13 +4,20 @@
 すべてのSQLAlchemyモデルをインポートしてまとめて管理
 """
 
+from .catalog import MedicationCatalog, MedicationAlias
 from .user import User, Medication
 from .inventory import Shelter, ShelterAdmin, MedicationInventory
+from .sync import SyncState, SyncTombstone, BalanceViewState
 
 __all__ = [
     "User",
     "Medication", 
     "Shelter",
     "ShelterAdmin",
-    "MedicationInventory"
+    "MedicationInventory",
+    "SyncState",
+    "SyncTombstone",
+    "BalanceViewState",
+    "MedicationCatalog",
+    "MedicationAlias"
 ]
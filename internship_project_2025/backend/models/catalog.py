@@ -0,0 +1,21 @@
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer
+from sqlalchemy.sql import func
+from database import Base
+
+
+class MedicationCatalog(Base):
+    """医薬品カタログテーブル"""
+    __tablename__ = "medication_catalog"
+    
+    catalog_id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(255), unique=True, nullable=False)  # 正式名（最初に登録された表記）
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class MedicationAlias(Base):
+    """医薬品名の別名テーブル（正規化した表記 -> カタログID）"""
+    __tablename__ = "medication_aliases"
+    
+    normalized_name = Column(String(255), primary_key=True)  # utils/medication_names.py で正規化した表記
+    catalog_id = Column(Integer, ForeignKey("medication_catalog.catalog_id"), nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
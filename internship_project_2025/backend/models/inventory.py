@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Numeric, Date, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, BigInteger, Numeric, Date, Text, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -16,6 +16,8 @@ class Shelter(Base):
     latitude = Column(Numeric(9, 6), nullable=False)
     longitude = Column(Numeric(9, 6), nullable=False)
     aggregate_range = Column(String(255), nullable=False)  # 集計範囲
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)  # 差分同期の変更番号
+    demand_seq = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)  # 需要が変わった変更番号
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -33,7 +35,7 @@ class ShelterAdmin(Base):
     password_hash = Column(String, nullable=False)
     name = Column(String(255), nullable=False)
     phone = Column(String(20), nullable=True)
-    shelter_id = Column(UUID(as_uuid=True), ForeignKey("shelters.shelter_id"), nullable=False)
+    shelter_id = Column(UUID(as_uuid=True), ForeignKey("shelters.shelter_id"), nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
@@ -46,11 +48,24 @@ class MedicationInventory(Base):
     inventory_id = Column(Integer, primary_key=True, autoincrement=True)
     shelter_id = Column(UUID(as_uuid=True), ForeignKey("shelters.shelter_id"), nullable=False)
     medication_name = Column(String(255), nullable=False)
+    catalog_id = Column(Integer, ForeignKey("medication_catalog.catalog_id"), nullable=False)  # 医薬品カタログID（名前から自動で設定）
     quantity = Column(Integer, nullable=False, default=0)
     expiry_date = Column(Date, nullable=True)  # 有効期限
     description = Column(Text, nullable=True)  # 薬品の概要
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)  # 差分同期の変更番号
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # リレーションシップ
     shelter = relationship("Shelter", back_populates="inventory")
+    
+    __table_args__ = (
+        # 避難所ごとに医薬品1件（表記が違っても同じカタログIDなら同じ在庫。一括更新の ON CONFLICT の対象）
+        Index("ux_medication_inventory_shelter_catalog", "shelter_id", "catalog_id", unique=True),
+        # 期限切れ間近の在庫の検索・期限日ごとの集計（期限未設定の行は含めない）
+        Index(
+            "ix_medication_inventory_expiry_shelter", "expiry_date", "shelter_id",
+            postgresql_where=expiry_date.isnot(None),
+            sqlite_where=expiry_date.isnot(None),
+        ),
+    )
@@ -0,0 +1,32 @@
+from sqlalchemy import Column, String, Date, DateTime, Integer, BigInteger
+from sqlalchemy.sql import func
+from database import Base
+
+
+class SyncState(Base):
+    """差分同期の変更番号テーブル（1行のみ）"""
+    __tablename__ = "sync_state"
+    
+    id = Column(Integer, primary_key=True)
+    last_seq = Column(BigInteger, nullable=False, default=0)  # 最後にコミットされた変更番号
+    pruned_seq = Column(BigInteger, nullable=False, default=0)  # 削除した削除記録の最大の変更番号（これより前のカーソルは全件同期）
+
+
+class BalanceViewState(Base):
+    """不足・余剰レポートのビューの集計時点（1行のみ。ビューが空でも集計済みと判定できるようにビューとは別に記録）"""
+    __tablename__ = "balance_view_state"
+    
+    id = Column(Integer, primary_key=True)
+    source_seq = Column(BigInteger, nullable=False)  # 集計前に読んだコミット済みの変更番号
+    source_date = Column(Date, nullable=False)  # 集計した日付
+
+
+class SyncTombstone(Base):
+    """差分同期用の削除記録テーブル"""
+    __tablename__ = "sync_tombstones"
+    
+    tombstone_id = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String(50), nullable=False)  # 削除された行のテーブル名
+    entity_key = Column(String(255), nullable=False)  # 削除された行の主キー
+    change_seq = Column(BigInteger, nullable=False, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Date, ForeignKey, Integer, Numeric
+from sqlalchemy import Column, String, DateTime, Date, ForeignKey, Integer, Numeric, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -25,6 +25,11 @@ class User(Base):
     
     # リレーションシップ
     medications = relationship("Medication", back_populates="user", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        # 集約範囲のバウンディングボックス検索用
+        Index("ix_users_latitude_longitude", "latitude", "longitude"),
+    )
 
 
 class Medication(Base):
@@ -32,8 +37,9 @@ class Medication(Base):
     __tablename__ = "medications"
     
     medication_id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.user_id"), nullable=False, index=True)
     name = Column(String(255), nullable=False)
+    catalog_id = Column(Integer, ForeignKey("medication_catalog.catalog_id"), nullable=False, index=True)  # 医薬品カタログID（名前から自動で設定）
     dosage = Column(String(255), nullable=False)
     schedule = Column(String(255), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -4,15 +4,29 @@
 医薬品在庫情報の管理と閲覧機能に関連するエンドポイントを提供
 """
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from typing import Literal, Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import get_db
-from schemas import AdminLogin, InventoryInfo, InventoryUpdate, AdminLoginResponse
+from config import settings as app_settings
+from database import AsyncSessionLocal, get_db
+from schemas import (
+    AdminLogin, InventoryInfo, InventoryUpdate, InventoryBulkUpdate, AdminLoginResponse, SyncResponse, ShortageReport,
+    ExpiringInventory, ExpirySummary, MedicationCatalogEntry
+)
 from services.admin_auth import AdminAuthService
 from services.dependencies import get_current_admin_dep
+from services.expiry import ExpiryService, expiry_sweeper
+from services.inventory_events import format_event, inventory_broadcaster
+from services.medication_catalog import get_catalog_entries
+from services.qr_sheet import build_qr_sheet
+from services.shortage_report import ShortageReportService
+from services.sync import SyncService
+from utils.fast_json import dumps, fast_json_response
 from models import ShelterAdmin, Shelter
-from schemas.inventory import AdminSettings
+from schemas.inventory import AdminSettings, AdminSettingsUpdate
 import re
 
 # APIルーターを作成
@@ -28,7 +42,7 @@ router = APIRouter(
 # 管理者設定取得
 @router.get("/me/settings", response_model=AdminSettings)
 async def get_admin_settings(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_admin: ShelterAdmin = Depends(get_current_admin_dep)
 ):
     """
@@ -40,7 +54,7 @@ async def get_admin_settings(
     """
     try:
         # 管理者に関連する避難所情報を取得
-        shelter = db.query(Shelter).filter(Shelter.shelter_id == current_admin.shelter_id).first()
+        shelter = await db.get(Shelter, current_admin.shelter_id)
         
         return AdminSettings(
             name=current_admin.name,
@@ -57,13 +71,14 @@ async def get_admin_settings(
 # 管理者設定更新
 @router.put("/me/settings", response_model=AdminSettings)
 async def update_admin_settings(
-    settings: AdminSettings,
-    db: Session = Depends(get_db),
+    settings: AdminSettingsUpdate,
+    db: AsyncSession = Depends(get_db),
     current_admin: ShelterAdmin = Depends(get_current_admin_dep)
 ):
     """
     管理者設定情報の更新
     - 管理者名は全角スペースを半角スペース1つに自動変換
+    - 集約範囲は正の数（km）のみ受け付ける
     """
     # 全角スペースを半角スペース1つに変換(正規化)
     normalized_name = re.sub(r'\u3000+', ' ', settings.name)
@@ -71,23 +86,24 @@ async def update_admin_settings(
     current_admin.phone = settings.phone
     
     # 集計範囲はshelterテーブル側
-    if current_admin.shelter and settings.aggregate_range is not None:
-        current_admin.shelter.aggregate_range = settings.aggregate_range
+    shelter = await db.get(Shelter, current_admin.shelter_id)
+    if shelter and settings.aggregate_range is not None:
+        shelter.aggregate_range = settings.aggregate_range
     
-    db.commit()
-    db.refresh(current_admin)
+    await db.commit()
+    await db.refresh(current_admin)
     
     return AdminSettings(
         name=current_admin.name,
         phone=current_admin.phone,
-        aggregate_range=current_admin.shelter.aggregate_range if current_admin.shelter else None,
+        aggregate_range=shelter.aggregate_range if shelter else None,
     )
 
 
 @router.post("/login", response_model=AdminLoginResponse)
 async def login_admin(
     admin_login: AdminLogin,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     管理者認証とトークン発行
@@ -98,7 +114,7 @@ async def login_admin(
     成功時は JWT アクセストークンを返します
     """
     try:
-        return AdminAuthService.login_admin(db, admin_login)
+        return await AdminAuthService.login_admin(db, admin_login)
     except HTTPException:
         raise
     except Exception as e:
@@ -108,9 +124,49 @@ async def login_admin(
         )
 
 
+@router.get("/my-shelter/qr-sheet")
+async def export_my_shelter_qr_sheet(
+    db: AsyncSession = Depends(get_db),
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    担当避難所の集約範囲内の全ユーザーのQRカードをPDFで出力
+    
+    管理者JWT認証が必要です。
+    A4用紙1枚に6枚のカードを配置し、氏名順に並べます。
+    """
+    try:
+        shelter = await db.get(Shelter, current_admin.shelter_id)
+        if not shelter:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="担当避難所が見つかりません"
+            )
+        user_ids = await AdminAuthService.get_catchment_user_ids(db, shelter)
+        # 医療情報はPDFの生成中にバッチごとのセッションで読み込む。
+        # 生成の失敗を500で返せるよう、PDFを作成し終えてからレスポンスを返す
+        pdf = await build_qr_sheet(user_ids)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="QRカード出力中にエラーが発生しました"
+        )
+    
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'attachment; filename="qr-sheet.pdf"'}
+    )
+
+
 @router.get("/inventory", response_model=list[InventoryInfo])
 async def get_all_inventory(
-    db: Session = Depends(get_db),
+    request: Request,
+    cursor: Optional[int] = Query(None, ge=0, description="前ページの X-Next-Cursor の値"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="1ページの件数"),
+    db: AsyncSession = Depends(get_db),
     current_admin: ShelterAdmin = Depends(get_current_admin_dep)
 ):
     """
@@ -119,13 +175,24 @@ async def get_all_inventory(
     管理者JWT認証が必要です。
     全避難所の在庫状況を一覧で取得できます。
     
+    - **cursor** / **limit**: どちらかを指定するとページ単位で返します。
+      続きがある場合は X-Next-Cursor ヘッダーの値を次の cursor に指定してください。
+      どちらも指定しない場合は全件を返します。
+    
     レスポンス情報：
     - 在庫ID、避難所名、住所
     - 医薬品名、在庫数量
     - 避難所の位置情報（緯度・経度）
     """
     try:
-        return AdminAuthService.get_all_inventory_info(db)
+        if cursor is None and limit is None:
+            return await fast_json_response(request, await AdminAuthService.get_all_inventory_info(db))
+        
+        inventory_list, next_cursor = await AdminAuthService.get_inventory_page(
+            db, cursor, limit or app_settings.inventory_page_size
+        )
+        headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+        return await fast_json_response(request, inventory_list, headers)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -133,6 +200,168 @@ async def get_all_inventory(
         )
 
 
+@router.get("/inventory/stream")
+async def stream_all_inventory(
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    全避難所の医薬品在庫情報をNDJSON（1行に1件のJSON）で順次返す
+    
+    管理者JWT認証が必要です。
+    サーバーサイドカーソルで読み込んだ分から送信するため、
+    避難所数や在庫数が多くても最初の行がすぐに届きます。
+    """
+    async def generate():
+        # 依存関数のセッションはレスポンス送信前に閉じられるため、送信中に使うセッションを別に開く
+        async with AsyncSessionLocal() as db:
+            async for batch in AdminAuthService.stream_all_inventory_info(
+                db, app_settings.inventory_stream_batch_size
+            ):
+                yield b"".join(dumps(row) + b"\n" for row in batch)
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@router.get("/inventory/expiring", response_model=list[ExpiringInventory])
+async def get_expiring_inventory(
+    request: Request,
+    days: int = Query(30, ge=0, le=3650, description="今日から何日以内に有効期限を迎える在庫を返すか"),
+    shelter_id: Optional[UUID] = Query(None, description="避難所ID（省略時は全避難所）"),
+    include_expired: bool = Query(False, description="有効期限切れの在庫も含める"),
+    limit: Optional[int] = Query(None, ge=1, le=app_settings.expiring_inventory_max_rows, description="最大件数"),
+    db: AsyncSession = Depends(get_db),
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    有効期限が近い在庫を期限の近い順に取得
+    
+    管理者JWT認証が必要です。
+    有効期限が登録されていない在庫は含みません。
+    """
+    try:
+        inventory_list = await ExpiryService.get_expiring_inventory(
+            db, days, shelter_id, include_expired, limit or app_settings.expiring_inventory_max_rows
+        )
+        return await fast_json_response(request, inventory_list)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="有効期限が近い在庫の取得中にエラーが発生しました"
+        )
+
+
+@router.get("/inventory/expiry-summary", response_model=ExpirySummary)
+async def get_expiry_summary(
+    request: Request,
+    days: int = Query(30, ge=0, le=app_settings.expiry_horizon_days, description="今日から何日先までの期限日を返すか"),
+    shelter_id: Optional[UUID] = Query(None, description="避難所ID（省略時は全避難所の合計）"),
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    有効期限日ごとの在庫の件数・在庫数の合計と、期限切れの合計を取得
+    
+    管理者JWT認証が必要です。
+    バックグラウンドで作成済みの集計から返すため、ダッシュボードから頻繁に呼び出せます。
+    集計がまだ作成されていない場合は503を返します。
+    """
+    try:
+        summary = expiry_sweeper.get_summary(shelter_id, days)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="有効期限の集計の取得中にエラーが発生しました"
+        )
+    if summary is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="有効期限の集計を作成中です。しばらくしてから再度お試しください"
+        )
+    return await fast_json_response(request, summary)
+
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync_changes(
+    request: Request,
+    since: Optional[int] = Query(None, ge=0, description="前回のレスポンスの cursor の値"),
+    db: AsyncSession = Depends(get_db),
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    前回の同期以降に変更された避難所・在庫・需要を取得（差分同期）
+    
+    管理者JWT認証が必要です。
+    
+    - **since**: 前回のレスポンスの cursor の値。省略した場合は全件を返します（full=true）
+    
+    各表は columns の順に値を並べた rows で返します。
+    demand_shelters に含まれる避難所は、需要を demand の行で置き換えてください（行が無い医薬品は需要なし）。
+    削除された避難所・在庫のIDは deleted で返します。
+    full=true の場合は、端末側のデータを全件置き換えてください。
+    """
+    try:
+        return await fast_json_response(request, await SyncService.get_changes(db, since))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="差分同期中にエラーが発生しました"
+        )
+
+
+@router.get("/reports/shortages", response_model=ShortageReport)
+async def get_shortage_report(
+    request: Request,
+    kind: Literal["shortage", "surplus"] = Query("shortage", description="shortage: 不足 / surplus: 余剰"),
+    medication_name: Optional[str] = Query(None, description="医薬品名（表記の揺れは吸収されます）"),
+    region: Optional[str] = Query(None, description="避難所の住所の先頭部分（例: 東京都中央区）"),
+    limit: Optional[int] = Query(None, ge=1, le=app_settings.shortage_report_max_rows, description="最大件数"),
+    db: AsyncSession = Depends(get_db),
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    全避難所の医薬品の不足・余剰を取得
+    
+    管理者JWT認証が必要です。
+    使用可能な在庫数と集約範囲内の需要数の差（shortage = 需要数 - 在庫数）が大きい順に返します。
+    有効期限切れの在庫は使用可能な在庫数に含めず、expired_quantity で返します。
+    在庫が登録されていない医薬品は在庫数0として扱います。
+    
+    PostgreSQLでは定期的に再集計される集計結果から返すため、直近の更新が反映されるまで
+    数秒かかることがあります（source_seq は集計に反映済みの変更番号です）。
+    """
+    try:
+        report = await ShortageReportService.get_report(
+            db, kind, medication_name, region, limit or app_settings.shortage_report_max_rows
+        )
+        return await fast_json_response(request, report)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="不足・余剰レポート取得中にエラーが発生しました"
+        )
+
+
+@router.get("/medication-catalog", response_model=list[MedicationCatalogEntry])
+async def get_medication_catalog(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    医薬品カタログを取得
+    
+    管理者JWT認証が必要です。
+    カタログID（catalog_id）と正式名を正式名順に返します。
+    在庫・需要・不足レポートの catalog_id はこのIDです。
+    """
+    try:
+        return await fast_json_response(request, await get_catalog_entries(db))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="医薬品カタログ取得中にエラーが発生しました"
+        )
+
+
 # 在庫管理用のルーター（別prefix）
 inventory_router = APIRouter(
     prefix="/admins",
@@ -141,11 +370,11 @@ inventory_router = APIRouter(
 )
 
 
-@inventory_router.put("/inventory/{medication_name}", response_model=InventoryInfo)
+@inventory_router.put("/inventory/{medication_name}", response_model=InventoryInfo, deprecated=True)
 async def update_shelter_inventory(
     medication_name: str,
     inventory_update: InventoryUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_admin: ShelterAdmin = Depends(get_current_admin_dep)
 ):
     """
@@ -156,9 +385,11 @@ async def update_shelter_inventory(
     
     管理者JWT認証が必要です。
     管理者は自分が担当する避難所の在庫のみ更新可能です。
+    医薬品名は全角・半角、空白、大文字・小文字の違いを吸収してカタログIDに変換されます。
+    新しいクライアントは PUT /admins/my-shelter/inventory/{catalog_id} を使用してください。
     """
     try:
-        return AdminAuthService.update_shelter_inventory(
+        return await AdminAuthService.update_shelter_inventory(
             db, medication_name, inventory_update, current_admin
         )
     except HTTPException:
@@ -170,9 +401,69 @@ async def update_shelter_inventory(
         )
 
 
+@inventory_router.put("/my-shelter/inventory/{catalog_id}", response_model=InventoryInfo)
+async def update_shelter_inventory_by_catalog_id(
+    catalog_id: int,
+    inventory_update: InventoryUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    担当避難所の在庫をカタログIDで更新
+    
+    - **catalog_id**: 医薬品カタログID（GET /admins/medication-catalog で取得）
+    - **quantity**: 更新後の在庫数量
+    
+    管理者JWT認証が必要です。
+    管理者は自分が担当する避難所の在庫のみ更新可能です。
+    """
+    try:
+        return await AdminAuthService.update_shelter_inventory_by_catalog_id(
+            db, catalog_id, inventory_update, current_admin
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="在庫更新中にエラーが発生しました"
+        )
+
+
+@inventory_router.put("/my-shelter/inventory", response_model=list[InventoryInfo])
+async def bulk_update_shelter_inventory(
+    request: Request,
+    inventory_update: InventoryBulkUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    担当避難所の在庫を一括更新
+    
+    - **items**: 医薬品名と更新後の在庫数量の組（最大1000件）
+    
+    管理者JWT認証が必要です。
+    すべての項目を1つのトランザクションで反映し、更新後の在庫を医薬品名順に返します。
+    未登録の医薬品は新しい在庫として追加されます。
+    """
+    try:
+        inventory_list = await AdminAuthService.bulk_upsert_shelter_inventory(
+            db, inventory_update, current_admin
+        )
+        return await fast_json_response(request, inventory_list)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="在庫一括更新中にエラーが発生しました"
+        )
+
+
 @inventory_router.get("/my-shelter/inventory", response_model=list[InventoryInfo])
 async def get_my_shelter_inventory(
-    db: Session = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_db),
     current_admin: ShelterAdmin = Depends(get_current_admin_dep)
 ):
     """
@@ -182,9 +473,54 @@ async def get_my_shelter_inventory(
     自分が担当する避難所の全在庫情報を取得できます。
     """
     try:
-        return AdminAuthService.get_shelter_inventory_info(db, current_admin.shelter_id)
+        inventory_list = await AdminAuthService.get_shelter_inventory_info(db, current_admin.shelter_id)
+        return await fast_json_response(request, inventory_list)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="避難所在庫情報取得中にエラーが発生しました"
-        )
\ No newline at end of file
+        )
+
+@inventory_router.get("/my-shelter/inventory/events")
+async def stream_my_shelter_inventory_events(
+    current_admin: ShelterAdmin = Depends(get_current_admin_dep)
+):
+    """
+    担当避難所の在庫変更をServer-Sent Eventsで受信
+    
+    管理者JWT認証が必要です。
+    接続直後に現在の在庫一覧を snapshot イベントで送り、以降は在庫の更新がコミットされるたびに
+    変更された行だけを inventory イベントで送ります。
+    受信が追いつかず変更を送りきれなくなった場合は resync イベントを送って接続を閉じるため、
+    再接続して snapshot から取り直してください。
+    """
+    shelter_id = current_admin.shelter_id
+    
+    async def generate():
+        # 一覧の取得中に起きた変更を取りこぼさないよう、先に購読してから一覧を取得する
+        subscription = inventory_broadcaster.subscribe(shelter_id)
+        try:
+            # 依存関数のセッションはレスポンス送信前に閉じられるため、送信中に使うセッションを別に開く
+            async with AsyncSessionLocal() as db:
+                snapshot = await AdminAuthService.get_shelter_inventory_info(db, shelter_id)
+            yield format_event("snapshot", snapshot)
+            
+            while True:
+                try:
+                    rows = await subscription.get(app_settings.inventory_events_heartbeat_seconds)
+                except TimeoutError:
+                    # 接続維持用のコメント（プロキシのタイムアウトと切断の検出のため）
+                    yield b": keepalive\n\n"
+                    continue
+                if rows is None:
+                    yield format_event("resync", {})
+                    return
+                yield format_event("inventory", rows)
+        finally:
+            inventory_broadcaster.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -20,8 +20,25 @@ from .inventory import (
     AdminLoginResponse,
     ShelterAdmin,
     InventoryUpdate,
+    InventoryBulkItem,
+    InventoryBulkUpdate,
     MedicationInventory,
-    InventoryInfo
+    InventoryInfo,
+    ExpiringInventory,
+    ExpiryBucket,
+    ExpirySummary,
+    MedicationCatalogEntry
+)
+
+from .sync import (
+    SyncTable,
+    SyncDeleted,
+    SyncResponse
+)
+
+from .report import (
+    ShortageReportRow,
+    ShortageReport
 )
 
 __all__ = [
@@ -37,6 +54,17 @@ __all__ = [
     "AdminLoginResponse",
     "ShelterAdmin",
     "InventoryUpdate",
+    "InventoryBulkItem",
+    "InventoryBulkUpdate",
     "MedicationInventory",
-    "InventoryInfo"
+    "InventoryInfo",
+    "ExpiringInventory",
+    "ExpiryBucket",
+    "ExpirySummary",
+    "MedicationCatalogEntry",
+    "SyncTable",
+    "SyncDeleted",
+    "SyncResponse",
+    "ShortageReportRow",
+    "ShortageReport"
 ]
@@ -1,9 +1,11 @@
-from pydantic import Field
+from pydantic import Field, field_validator
 from datetime import datetime, date
 from uuid import UUID
 from typing import Optional
 from pydantic import BaseModel, EmailStr
 
+from utils.geo_utils import parse_range_km
+
 
 # 避難所関連スキーマ
 class Shelter(BaseModel):
@@ -59,16 +61,44 @@ class AdminSettings(BaseModel):
         from_attributes = True
 
 
+class AdminSettingsUpdate(AdminSettings):
+    """管理者設定の更新スキーマ（集約範囲は正の数のkmのみ受け付ける）"""
+    aggregate_range: Optional[str] = Field(None, description="集約範囲（半径km。例: 3, 2.5）")
+
+    @field_validator("aggregate_range")
+    @classmethod
+    def validate_aggregate_range(cls, value: Optional[str]) -> Optional[str]:
+        # 需要の集計（Python・SQLの両方）と同じ規則で検証し、解釈できない値は保存しない
+        if value is None:
+            return None
+        value = value.strip()
+        if parse_range_km(value) is None:
+            raise ValueError("集約範囲は正の数（km）で指定してください")
+        return value
+
+
 # 在庫関連スキーマ
 class InventoryUpdate(BaseModel):
     """在庫更新スキーマ"""
     quantity: int
 
 
+class InventoryBulkItem(BaseModel):
+    """在庫一括更新の1件分"""
+    medication_name: str = Field(..., min_length=1, max_length=255)
+    quantity: int
+
+
+class InventoryBulkUpdate(BaseModel):
+    """在庫一括更新スキーマ"""
+    items: list[InventoryBulkItem] = Field(..., min_length=1, max_length=1000)
+
+
 class MedicationInventory(BaseModel):
     """在庫レスポンススキーマ"""
     inventory_id: int
     shelter_id: UUID
+    catalog_id: Optional[int] = None
     medication_name: str
     quantity: int
     expiry_date: Optional[date] = None
@@ -83,11 +113,45 @@ class MedicationInventory(BaseModel):
 class InventoryInfo(BaseModel):
     """在庫情報スキーマ"""
     shelter_name: str
+    catalog_id: Optional[int] = Field(None, description="医薬品カタログID")
     medication_name: str
     quantity: int
+    usable_quantity: Optional[int] = Field(None, description="使用可能な在庫数（有効期限切れの場合は0。必要在庫数と比べる値）")
     expiry_date: Optional[date] = None
     description: Optional[str] = None
     required_quantity: Optional[int] = Field(None, description="必要在庫数（集約範囲内ユーザーの医薬品数）")
     
     class Config:
         from_attributes = True
+
+
+class ExpiringInventory(BaseModel):
+    """有効期限が近い在庫スキーマ"""
+    inventory_id: int
+    shelter_id: UUID
+    shelter_name: str
+    medication_name: str
+    quantity: int
+    expiry_date: date
+    days_left: int = Field(..., description="有効期限までの日数（期限切れは負の値）")
+
+
+class ExpiryBucket(BaseModel):
+    """有効期限日ごとの在庫の集計"""
+    expiry_date: date
+    item_count: int = Field(..., description="在庫の件数")
+    quantity: int = Field(..., description="在庫数の合計")
+
+
+class ExpirySummary(BaseModel):
+    """有効期限の集計スキーマ"""
+    as_of: date = Field(..., description="集計した日付")
+    expired_item_count: int = Field(..., description="期限切れの在庫の件数")
+    expired_quantity: int = Field(..., description="期限切れの在庫数の合計")
+    buckets: list[ExpiryBucket] = Field(..., description="今日から指定日数以内に期限を迎える在庫の、期限日ごとの集計")
+
+
+class MedicationCatalogEntry(BaseModel):
+    """医薬品カタログスキーマ"""
+    catalog_id: int
+    name: str = Field(..., description="正式名")
@@ -0,0 +1,23 @@
+from typing import Optional
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+
+# 不足・余剰レポート関連スキーマ
+class ShortageReportRow(BaseModel):
+    """避難所・医薬品ごとの在庫と需要の差"""
+    shelter_id: UUID
+    shelter_name: str
+    address: str
+    catalog_id: int
+    medication_name: str = Field(..., description="医薬品カタログの正式名")
+    quantity: int = Field(..., description="使用可能な在庫数（有効期限切れを除く。在庫が無い場合は0）")
+    expired_quantity: int = Field(..., description="有効期限切れの在庫数")
+    required_quantity: int = Field(..., description="集約範囲内の需要数")
+    shortage: int = Field(..., description="不足数（需要数 - 使用可能な在庫数。負の値は余剰）")
+
+
+class ShortageReport(BaseModel):
+    """不足・余剰レポートスキーマ"""
+    source_seq: Optional[int] = Field(None, description="集計に反映済みの変更番号（その場で集計した場合はnull）")
+    rows: list[ShortageReportRow]
@@ -0,0 +1,27 @@
+from typing import Any
+from uuid import UUID
+from pydantic import BaseModel, Field
+
+
+# 差分同期関連スキーマ
+class SyncTable(BaseModel):
+    """列名と、列の順に値を並べた行の配列（キー名を行ごとに繰り返さない）"""
+    columns: list[str]
+    rows: list[list[Any]]
+
+
+class SyncDeleted(BaseModel):
+    """前回の同期以降に削除された行"""
+    shelters: list[UUID] = Field(default_factory=list, description="削除された避難所ID")
+    inventory: list[int] = Field(default_factory=list, description="削除された在庫ID")
+
+
+class SyncResponse(BaseModel):
+    """差分同期レスポンススキーマ"""
+    cursor: int = Field(..., description="次回の since に指定する値")
+    full: bool = Field(..., description="全件を返した場合はtrue（端末側のデータを置き換える）")
+    shelters: SyncTable
+    inventory: SyncTable
+    demand_shelters: list[UUID] = Field(..., description="需要を置き換える避難所ID（demand に行が無ければ需要なし）")
+    demand: SyncTable
+    deleted: SyncDeleted
@@ -4,26 +4,38 @@
 避難所管理者の認証と在庫管理の業務ロジックを管理
 """
 
-from datetime import timedelta
-from collections import Counter
+from datetime import date, timedelta
+from collections import Counter, defaultdict
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import Float, Numeric, and_, case, cast, func, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import AsyncIterator, Optional
 from uuid import UUID
 
-from models import ShelterAdmin, Shelter, MedicationInventory, User, Medication
-from schemas import AdminLogin, InventoryInfo, InventoryUpdate, AdminLoginResponse
+from database import UPSERT_INSERTS
+from models import ShelterAdmin, Shelter, MedicationInventory, User, Medication, MedicationCatalog
+from schemas import AdminLogin, InventoryUpdate, InventoryBulkUpdate, AdminLoginResponse
 from services.auth import AuthService
-from utils.geo_utils import is_within_range
+from services.change_seq import allocate_change_seq
+from services.demand_cache import medication_demand_cache
+from services.inventory_events import inventory_broadcaster
+from services.location_index import user_location_index
+from services.medication_catalog import resolve_session_catalog_ids
+from services.user_auth import ID_CHUNK_SIZE, UserAuthService
+from utils.geo_utils import KM_PER_DEGREE, RANGE_KM_PATTERN, bounding_box, haversine_distance_sql, parse_range_km
+
+# 集約範囲が数値として解釈できない場合の既定値（km）
+DEFAULT_RANGE_KM = 3.0
 
 
 class AdminAuthService:
     """管理者認証サービス"""
     
     @staticmethod
-    def login_admin(db: Session, admin_login: AdminLogin) -> AdminLoginResponse:
+    async def login_admin(db: AsyncSession, admin_login: AdminLogin) -> AdminLoginResponse:
         """管理者ログイン"""
         # 管理者認証
-        admin = AuthService.authenticate_admin(db, admin_login.email, admin_login.password)
+        admin = await AuthService.authenticate_admin(db, admin_login.email, admin_login.password)
         if not admin:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -44,60 +56,142 @@ class AdminAuthService:
         )
     
     @staticmethod
-    def get_all_inventory_info(db: Session) -> list[InventoryInfo]:
-        """全避難所の在庫情報を取得"""
+    async def get_all_inventory_info(db: AsyncSession) -> list[dict]:
+        """全避難所の在庫情報を取得（InventoryInfo と同じキーの辞書）"""
         # 在庫情報と避難所情報を結合して取得
-        inventory_data = (
-            db.query(MedicationInventory, Shelter)
+        result = await db.execute(AdminAuthService._inventory_with_shelter_query())
+        return await AdminAuthService._to_inventory_rows(db, result.all())
+    
+    @staticmethod
+    async def get_inventory_page(
+        db: AsyncSession, after_id: Optional[int], limit: int
+    ) -> tuple[list[dict], Optional[int]]:
+        """在庫IDのキーセットで全避難所の在庫情報を1ページ分取得（次ページのカーソルも返す）"""
+        query = AdminAuthService._inventory_with_shelter_query().limit(limit)
+        if after_id is not None:
+            query = query.where(MedicationInventory.inventory_id > after_id)
+        result = await db.execute(query)
+        inventory_data = result.all()
+        
+        inventory_list = await AdminAuthService._to_inventory_rows(db, inventory_data)
+        next_cursor = inventory_data[-1][0].inventory_id if len(inventory_data) == limit else None
+        return inventory_list, next_cursor
+    
+    @staticmethod
+    async def stream_all_inventory_info(db: AsyncSession, batch_size: int) -> AsyncIterator[list[dict]]:
+        """全避難所の在庫情報をサーバーサイドカーソルで batch_size 件ずつ返す"""
+        # 需要は避難所単位のため、在庫より件数の少ない避難所を先にまとめて計算しておく
+        result = await db.execute(select(Shelter))
+        shelters = {shelter.shelter_id: shelter for shelter in result.scalars()}
+        demand_by_shelter = await AdminAuthService._get_demand_for_shelters(db, list(shelters.values()))
+        
+        result = await db.stream(
+            select(MedicationInventory)
+            .order_by(MedicationInventory.inventory_id)
+            .execution_options(yield_per=batch_size)
+        )
+        async for partition in result.scalars().partitions():
+            yield [
+                AdminAuthService._to_inventory_row(
+                    inventory, shelters[inventory.shelter_id].name,
+                    demand_by_shelter.get(inventory.shelter_id, {}).get(inventory.catalog_id, 0)
+                )
+                for inventory in partition
+            ]
+    
+    @staticmethod
+    def _inventory_with_shelter_query():
+        """在庫と避難所を結合し、在庫ID順に並べるクエリ"""
+        return (
+            select(MedicationInventory, Shelter)
             .join(Shelter, MedicationInventory.shelter_id == Shelter.shelter_id)
-            .all()
-        )
-        
-        # レスポンススキーマに変換
-        inventory_list = []
-        for inventory, shelter in inventory_data:
-            # 各避難所の集約範囲内のユーザーの医薬品需要を計算
-            try:
-                range_km = float(shelter.aggregate_range)
-            except (ValueError, TypeError):
-                range_km = 3.0  # デフォルト3km
-            
-            # 集約範囲内のユーザーの医薬品需要を計算
-            medication_demand = AdminAuthService._calculate_medication_demand(
-                db, float(shelter.latitude), float(shelter.longitude), range_km
-            )
-            
-            required_quantity = medication_demand.get(inventory.medication_name, 0)
-            
-            inventory_info = InventoryInfo(
-                shelter_name=shelter.name,
-                medication_name=inventory.medication_name,
-                quantity=inventory.quantity,
-                expiry_date=inventory.expiry_date,
-                description=inventory.description,
-                required_quantity=required_quantity
+            .order_by(MedicationInventory.inventory_id)
+        )
+    
+    @staticmethod
+    async def _to_inventory_rows(db: AsyncSession, inventory_data) -> list[dict]:
+        """(在庫, 避難所) の行をレスポンス用の辞書に変換（必要在庫数を含む）"""
+        # 在庫を持つ避難所ごとの医薬品需要を一括で計算
+        shelters = {shelter.shelter_id: shelter for _, shelter in inventory_data}
+        demand_by_shelter = await AdminAuthService._get_demand_for_shelters(
+            db, list(shelters.values())
+        )
+        
+        return [
+            AdminAuthService._to_inventory_row(
+                inventory, shelter.name,
+                demand_by_shelter.get(shelter.shelter_id, {}).get(inventory.catalog_id, 0)
             )
-            inventory_list.append(inventory_info)
+            for inventory, shelter in inventory_data
+        ]
+    
+    @staticmethod
+    def _to_inventory_row(
+        inventory: MedicationInventory, shelter_name: str, required_quantity: Optional[int] = None
+    ) -> dict:
+        """
+        在庫をレスポンス用の辞書（InventoryInfo と同じキー）に変換
         
-        return inventory_list
+        値はデータベースの型制約を満たしているため、一覧ではPydanticの検証を省いてそのまま出力する。
+        必要在庫数と比べる使用可能な在庫数は、有効期限切れの場合は0にする（不足・余剰レポートと同じ扱い）
+        """
+        expired = inventory.expiry_date is not None and inventory.expiry_date < date.today()
+        return {
+            "shelter_name": shelter_name,
+            "catalog_id": inventory.catalog_id,
+            "medication_name": inventory.medication_name,
+            "quantity": inventory.quantity,
+            "usable_quantity": 0 if expired else inventory.quantity,
+            "expiry_date": inventory.expiry_date,
+            "description": inventory.description,
+            "required_quantity": required_quantity,
+        }
     
     @staticmethod
-    def get_shelter_inventory_info(db: Session, shelter_id: UUID) -> list[InventoryInfo]:
+    async def get_shelter_inventory_info(db: AsyncSession, shelter_id: UUID) -> list[dict]:
         """指定された避難所の在庫情報を取得（医薬品需要を含む）"""
-        return AdminAuthService.get_shelter_inventory_with_demand(db, shelter_id)
+        return await AdminAuthService.get_shelter_inventory_with_demand(db, shelter_id)
     
     @staticmethod
-    def update_shelter_inventory(
-        db: Session, 
+    async def update_shelter_inventory(
+        db: AsyncSession, 
         medication_name: str,
         inventory_update: InventoryUpdate,
         admin: ShelterAdmin
-    ) -> InventoryInfo:
-        """担当避難所の在庫を更新"""
+    ) -> dict:
+        """担当避難所の在庫を医薬品名で更新（表記の揺れはカタログで吸収し、未登録の名前はカタログに追加）"""
+        ids = await db.run_sync(resolve_session_catalog_ids, [medication_name])
+        return await AdminAuthService._update_inventory(
+            db, admin, ids[medication_name], medication_name, inventory_update.quantity
+        )
+
+    @staticmethod
+    async def update_shelter_inventory_by_catalog_id(
+        db: AsyncSession,
+        catalog_id: int,
+        inventory_update: InventoryUpdate,
+        admin: ShelterAdmin
+    ) -> dict:
+        """担当避難所の在庫をカタログIDで更新"""
+        catalog = await db.get(MedicationCatalog, catalog_id)
+        if not catalog:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="医薬品カタログに登録されていない医薬品です"
+            )
+        return await AdminAuthService._update_inventory(
+            db, admin, catalog_id, catalog.name, inventory_update.quantity
+        )
+
+    @staticmethod
+    async def _update_inventory(
+        db: AsyncSession, admin: ShelterAdmin, catalog_id: int, medication_name: str, quantity: int
+    ) -> dict:
+        """担当避難所の在庫数を更新（在庫が無ければ medication_name の表記で作成）"""
         shelter_id = admin.shelter_id
         
         # 避難所の存在確認
-        shelter = db.query(Shelter).filter(Shelter.shelter_id == shelter_id).first()
+        shelter = await db.get(Shelter, shelter_id)
         if not shelter:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -105,113 +199,375 @@ class AdminAuthService:
             )
         
         # 在庫情報を取得または作成
-        inventory = db.query(MedicationInventory).filter(
-            MedicationInventory.shelter_id == shelter_id,
-            MedicationInventory.medication_name == medication_name
-        ).first()
+        result = await db.execute(
+            select(MedicationInventory).where(
+                MedicationInventory.shelter_id == shelter_id,
+                MedicationInventory.catalog_id == catalog_id
+            )
+        )
+        inventory = result.scalars().first()
         
         if inventory:
             # 既存の在庫を更新（在庫数のみ）
-            inventory.quantity = inventory_update.quantity
+            inventory.quantity = quantity
         else:
             # 新しい在庫レコードを作成
             inventory = MedicationInventory(
                 shelter_id=shelter_id,
                 medication_name=medication_name,
-                quantity=inventory_update.quantity
+                catalog_id=catalog_id,
+                quantity=quantity
             )
             db.add(inventory)
         
-        db.commit()
-        db.refresh(inventory)
+        await db.commit()
+        await db.refresh(inventory)
+        await AdminAuthService._publish_inventory_changes(db, shelter, [inventory])
         
-        # レスポンススキーマに変換して返す
-        return InventoryInfo(
-            shelter_name=shelter.name,
-            medication_name=inventory.medication_name,
-            quantity=inventory.quantity,
-            expiry_date=inventory.expiry_date,
-            description=inventory.description
+        # 一覧・配信と同じ形（使用可能な在庫数・必要在庫数を含む）で返す
+        medication_demand = await AdminAuthService._get_shelter_demand(db, shelter)
+        return AdminAuthService._to_inventory_row(
+            inventory, shelter.name, medication_demand.get(inventory.catalog_id, 0)
         )
 
     @staticmethod
-    def get_shelter_inventory_with_demand(db: Session, shelter_id: UUID) -> list[InventoryInfo]:
+    async def bulk_upsert_shelter_inventory(
+        db: AsyncSession,
+        inventory_update: InventoryBulkUpdate,
+        admin: ShelterAdmin
+    ) -> list[dict]:
+        """担当避難所の在庫を1回の INSERT ... ON CONFLICT DO UPDATE で一括更新"""
+        shelter_id = admin.shelter_id
+        
+        # 避難所の存在確認
+        shelter = await db.get(Shelter, shelter_id)
+        if not shelter:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="担当避難所が見つかりません"
+            )
+        
+        # ORMのフラッシュを経由しないため、カタログIDと差分同期の変更番号はここで取得する
+        ids = await db.run_sync(
+            resolve_session_catalog_ids, [item.medication_name for item in inventory_update.items]
+        )
+        change_seq = await db.run_sync(allocate_change_seq)
+        
+        # 同じ医薬品（表記違いを含む）が複数回指定された場合は後の値を採用（1文の中で同じ行は2回更新できない）
+        items = {ids[item.medication_name]: item for item in inventory_update.items}
+        
+        insert = UPSERT_INSERTS[db.get_bind().dialect.name]
+        stmt = insert(MedicationInventory).values([
+            {
+                "shelter_id": shelter_id,
+                "medication_name": item.medication_name,
+                "catalog_id": catalog_id,
+                "quantity": item.quantity,
+                "change_seq": change_seq,
+            }
+            for catalog_id, item in items.items()
+        ])
+        # 既存の在庫は在庫数のみ更新し、名前は登録済みの表記のまま（onupdate はON CONFLICT側には適用されないため更新日時も明示する）
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[MedicationInventory.shelter_id, MedicationInventory.catalog_id],
+            set_={
+                "quantity": stmt.excluded.quantity,
+                "updated_at": func.now(),
+                "change_seq": stmt.excluded.change_seq,
+            }
+        ).returning(MedicationInventory)
+        
+        result = await db.execute(stmt, execution_options={"populate_existing": True})
+        inventories = sorted(result.scalars().all(), key=lambda inventory: inventory.medication_name)
+        await db.commit()
+        await AdminAuthService._publish_inventory_changes(db, shelter, inventories)
+        
+        # 他の在庫の行と同じく必要在庫数を含めて返す（需要は1回だけ取得）
+        medication_demand = await AdminAuthService._get_shelter_demand(db, shelter)
+        return [
+            AdminAuthService._to_inventory_row(
+                inventory, shelter.name, medication_demand.get(inventory.catalog_id, 0)
+            )
+            for inventory in inventories
+        ]
+
+    @staticmethod
+    async def _publish_inventory_changes(
+        db: AsyncSession, shelter: Shelter, inventories: list[MedicationInventory]
+    ) -> None:
+        """コミット済みの在庫変更を購読中の管理者画面に配信（購読者がいなければ需要も計算しない）"""
+        if not inventory_broadcaster.has_subscribers(shelter.shelter_id):
+            return
+        medication_demand = await AdminAuthService._get_shelter_demand(db, shelter)
+        inventory_broadcaster.publish(shelter.shelter_id, [
+            AdminAuthService._to_inventory_row(
+                inventory, shelter.name, medication_demand.get(inventory.catalog_id, 0)
+            )
+            for inventory in inventories
+        ])
+
+    @staticmethod
+    async def get_shelter_inventory_with_demand(db: AsyncSession, shelter_id: UUID) -> list[dict]:
         """避難所の在庫情報に必要在庫数を含めて取得"""
         # 避難所情報を取得
-        shelter = db.query(Shelter).filter(Shelter.shelter_id == shelter_id).first()
+        shelter = await db.get(Shelter, shelter_id)
         if not shelter:
             raise HTTPException(status_code=404, detail="避難所が見つかりません")
         
-        # aggregate_rangeをkmに変換（"3"などの文字列から数値へ）
-        try:
-            range_km = float(shelter.aggregate_range)
-        except (ValueError, TypeError):
-            range_km = 3.0  # デフォルト3km
-        
         # 避難所の在庫情報を取得
-        inventory_data = (
-            db.query(MedicationInventory, Shelter)
+        result = await db.execute(
+            select(MedicationInventory, Shelter)
             .join(Shelter, MedicationInventory.shelter_id == Shelter.shelter_id)
-            .filter(MedicationInventory.shelter_id == shelter_id)
-            .all()
+            .where(MedicationInventory.shelter_id == shelter_id)
         )
+        inventory_data = result.all()
         
-        # 集約範囲内のユーザーの医薬品需要を計算
-        medication_demand = AdminAuthService._calculate_medication_demand(
-            db, float(shelter.latitude), float(shelter.longitude), range_km
-        )
+        # 集約範囲内のユーザーの医薬品需要を取得
+        medication_demand = await AdminAuthService._get_shelter_demand(db, shelter)
         
-        # レスポンススキーマに変換
-        inventory_list = []
-        for inventory, shelter_info in inventory_data:
-            required_quantity = medication_demand.get(inventory.medication_name, 0)
-            
-            inventory_info = InventoryInfo(
-                shelter_name=shelter_info.name,
-                medication_name=inventory.medication_name,
-                quantity=inventory.quantity,
-                expiry_date=inventory.expiry_date,
-                description=inventory.description,
-                required_quantity=required_quantity
+        # レスポンス用の辞書に変換
+        return [
+            AdminAuthService._to_inventory_row(
+                inventory, shelter_info.name, medication_demand.get(inventory.catalog_id, 0)
             )
-            inventory_list.append(inventory_info)
-        
-        return inventory_list
+            for inventory, shelter_info in inventory_data
+        ]
+
+    @staticmethod
+    async def get_catchment_user_ids(db: AsyncSession, shelter: Shelter) -> list[UUID]:
+        """避難所の集約範囲内の全ユーザーのIDを氏名順に取得（QRカード一括出力用）"""
+        shelter_lat, shelter_lon = float(shelter.latitude), float(shelter.longitude)
+        range_km = AdminAuthService._get_range_km(shelter)
+        if AdminAuthService._supports_sql_geo(db):
+            # 全ユーザーをワーカーのメモリに読み込まず、インデックスとSQLの距離計算で絞り込む
+            result = await db.execute(
+                select(User.user_id).where(*AdminAuthService._user_in_range_conditions(shelter_lat, shelter_lon, range_km))
+            )
+            user_ids = list(result.scalars())
+        else:
+            user_ids = await user_location_index.users_in_range(db, shelter_lat, shelter_lon, range_km)
+        return await UserAuthService.get_user_ids_by_name(db, user_ids)
+
+    @staticmethod
+    def _get_range_km(shelter: Shelter) -> float:
+        """避難所の集約範囲（文字列）をkmの数値に変換（正の数でなければ既定値）"""
+        range_km = parse_range_km(shelter.aggregate_range)
+        return DEFAULT_RANGE_KM if range_km is None else range_km
 
     @staticmethod
-    def _get_users_in_range(db: Session, shelter_lat: float, shelter_lon: float, range_km: float) -> list[User]:
-        """集約範囲内のユーザーを取得"""
-        # 全ユーザーを取得して距離でフィルタリング
-        all_users = db.query(User).all()
-        users_in_range = []
+    async def _get_shelter_demand(db: AsyncSession, shelter: Shelter) -> dict[int, int]:
+        """避難所の医薬品需要をキャッシュ経由で取得"""
+        # 計算中に無効化された場合は古い結果を保存しないよう、先に世代を取得
+        generation = medication_demand_cache.generation
+        demand = medication_demand_cache.get(shelter)
+        if demand is None:
+            range_km = AdminAuthService._get_range_km(shelter)
+            demand = await AdminAuthService._calculate_medication_demand(
+                db, float(shelter.latitude), float(shelter.longitude), range_km
+            )
+            medication_demand_cache.set(shelter, range_km, demand, generation)
+        return demand
+
+    @staticmethod
+    async def _get_demand_for_shelters(db: AsyncSession, shelters: list[Shelter]) -> dict[UUID, dict[int, int]]:
+        """複数避難所の医薬品需要をキャッシュ経由で取得（未キャッシュ分のみ一括計算）"""
+        generation = medication_demand_cache.generation
+        demand_by_shelter = {}
+        missing = []
+        for shelter in shelters:
+            demand = medication_demand_cache.get(shelter)
+            if demand is None:
+                missing.append(shelter)
+            else:
+                demand_by_shelter[shelter.shelter_id] = demand
         
-        for user in all_users:
-            if is_within_range(
-                float(user.latitude), float(user.longitude),
-                shelter_lat, shelter_lon, range_km
-            ):
-                users_in_range.append(user)
+        if missing:
+            computed = await AdminAuthService._calculate_demand_for_shelters(db, missing)
+            for shelter in missing:
+                demand = computed.get(shelter.shelter_id, {})
+                medication_demand_cache.set(
+                    shelter, AdminAuthService._get_range_km(shelter), demand, generation
+                )
+                demand_by_shelter[shelter.shelter_id] = demand
         
-        return users_in_range
+        return demand_by_shelter
 
     @staticmethod
-    def _calculate_medication_demand(db: Session, shelter_lat: float, shelter_lon: float, range_km: float) -> dict[str, int]:
+    def _supports_sql_geo(db: AsyncSession) -> bool:
+        """距離計算をSQL側で実行できるDBか（三角関数を持つPostgreSQLのみ）"""
+        return db.get_bind().dialect.name == "postgresql"
+
+    @staticmethod
+    async def _calculate_medication_demand(db: AsyncSession, shelter_lat: float, shelter_lon: float, range_km: float) -> dict[int, int]:
         """集約範囲内のユーザーの医薬品需要を計算"""
-        # 集約範囲内のユーザーを取得
-        users_in_range = AdminAuthService._get_users_in_range(db, shelter_lat, shelter_lon, range_km)
+        if AdminAuthService._supports_sql_geo(db):
+            return await AdminAuthService._calculate_medication_demand_sql(db, shelter_lat, shelter_lon, range_km)
         
-        if not users_in_range:
-            return {}
+        # 集約範囲内のユーザーIDを取得
+        user_ids = await user_location_index.users_in_range(db, shelter_lat, shelter_lon, range_km)
         
-        # ユーザーIDのリストを作成
-        user_ids = [user.user_id for user in users_in_range]
-        
-        # これらのユーザーの医薬品情報を取得
-        medications = db.query(Medication).filter(Medication.user_id.in_(user_ids)).all()
+        if not user_ids:
+            return {}
         
-        # 医薬品名ごとにカウント
+        # これらのユーザーの医薬品をカタログIDごとにカウント（ID_CHUNK_SIZE 件ずつ取得）
         medication_counter = Counter()
-        for medication in medications:
-            medication_counter[medication.name] += 1
+        for start in range(0, len(user_ids), ID_CHUNK_SIZE):
+            result = await db.execute(
+                select(Medication.catalog_id)
+                .where(Medication.user_id.in_(user_ids[start:start + ID_CHUNK_SIZE]))
+            )
+            medication_counter.update(result.scalars())
         
         return dict(medication_counter)
+
+    @staticmethod
+    async def _calculate_medication_demand_sql(db: AsyncSession, shelter_lat: float, shelter_lon: float, range_km: float) -> dict[int, int]:
+        """集約範囲内のユーザーの医薬品需要をSQLの集計だけで計算"""
+        result = await db.execute(
+            AdminAuthService._medication_demand_query(shelter_lat, shelter_lon, range_km)
+        )
+        return dict(result.all())
+
+    @staticmethod
+    def _user_in_range_conditions(shelter_lat: float, shelter_lon: float, range_km: float) -> tuple:
+        """ユーザーが集約範囲内にいる条件（PostgreSQLのみ）"""
+        # (latitude, longitude) インデックスで絞り込めるようにバウンディングボックスを付ける
+        min_lat, max_lat, min_lon, max_lon = bounding_box(shelter_lat, shelter_lon, range_km)
+        distance = haversine_distance_sql(User.latitude, User.longitude, shelter_lat, shelter_lon)
+        return (
+            User.latitude.between(min_lat, max_lat),
+            User.longitude.between(min_lon, max_lon),
+            distance <= range_km
+        )
+
+    @staticmethod
+    def _medication_demand_query(shelter_lat: float, shelter_lon: float, range_km: float):
+        """集約範囲内のユーザーのカタログIDごとの医薬品数を集計するクエリ"""
+        return (
+            select(Medication.catalog_id, func.count(Medication.medication_id))
+            .join(User, Medication.user_id == User.user_id)
+            .where(*AdminAuthService._user_in_range_conditions(shelter_lat, shelter_lon, range_km))
+            .group_by(Medication.catalog_id)
+        )
+
+    @staticmethod
+    async def _calculate_demand_for_shelters(db: AsyncSession, shelters: list[Shelter]) -> dict[UUID, dict[int, int]]:
+        """複数避難所の医薬品需要を一括で計算（避難所ID -> カタログID -> 需要数）"""
+        if AdminAuthService._supports_sql_geo(db):
+            return await AdminAuthService._calculate_demand_for_shelters_sql(db, shelters)
+        
+        # 各避難所の集約範囲内のユーザーIDを空間インデックスで取得
+        users_by_shelter = {}
+        for shelter in shelters:
+            users_by_shelter[shelter.shelter_id] = await user_location_index.users_in_range(
+                db, float(shelter.latitude), float(shelter.longitude),
+                AdminAuthService._get_range_km(shelter)
+            )
+        
+        if not any(users_by_shelter.values()):
+            return {shelter_id: {} for shelter_id in users_by_shelter}
+        
+        # いずれかの避難所の範囲内にいるユーザーの医薬品だけを ID_CHUNK_SIZE 件ずつ取得し、
+        # ユーザーごとのカタログIDリストにまとめる
+        medications_by_user = defaultdict(list)
+        user_ids = list({user_id for ids in users_by_shelter.values() for user_id in ids})
+        for start in range(0, len(user_ids), ID_CHUNK_SIZE):
+            result = await db.execute(
+                select(Medication.user_id, Medication.catalog_id)
+                .where(Medication.user_id.in_(user_ids[start:start + ID_CHUNK_SIZE]))
+            )
+            for user_id, catalog_id in result:
+                medications_by_user[user_id].append(catalog_id)
+        
+        # 避難所ごとに範囲内ユーザーのカタログIDをカウント
+        demand_by_shelter = {}
+        for shelter_id, user_ids in users_by_shelter.items():
+            medication_counter = Counter()
+            for user_id in user_ids:
+                medication_counter.update(medications_by_user.get(user_id, ()))
+            demand_by_shelter[shelter_id] = dict(medication_counter)
+        
+        return demand_by_shelter
+
+    @staticmethod
+    def _range_km_sql():
+        """_get_range_km と同じ変換をSQL式として組み立てる"""
+        # 正規表現に一致しない値は数値に変換しないよう、CASE を入れ子にして判定する
+        range_km = cast(Shelter.aggregate_range, Float)
+        return case(
+            (
+                Shelter.aggregate_range.regexp_match(RANGE_KM_PATTERN),
+                case((range_km > 0, range_km), else_=DEFAULT_RANGE_KM)
+            ),
+            else_=DEFAULT_RANGE_KM
+        )
+
+    @staticmethod
+    def _range_bounds_sql():
+        """避難所ごとの (集約範囲km, バウンディングボックスの緯度幅, 経度幅) をSQL式として組み立てる（bounding_box と同じ式）"""
+        range_km = AdminAuthService._range_km_sql()
+        shelter_lat = cast(Shelter.latitude, Float)
+        dlat = range_km / KM_PER_DEGREE
+        cos_lat = func.cos(func.radians(func.least(func.abs(shelter_lat) + dlat, 89.9)))
+        dlon = range_km / (KM_PER_DEGREE * cos_lat)
+        return range_km, dlat, dlon
+
+    @staticmethod
+    def _shelters_covering_query(points: set[tuple[float, float]]):
+        """いずれかの地点を集約範囲に含む避難所のIDを取得するクエリ（PostgreSQLのみ）"""
+        range_km, dlat, dlon = AdminAuthService._range_bounds_sql()
+        shelter_lat = cast(Shelter.latitude, Float)
+        shelter_lon = cast(Shelter.longitude, Float)
+        # バウンディングボックスで候補を絞ってから距離を計算する
+        return select(Shelter.shelter_id).where(or_(*(
+            and_(
+                literal(lat, Float).between(shelter_lat - dlat, shelter_lat + dlat),
+                literal(lon, Float).between(shelter_lon - dlon, shelter_lon + dlon),
+                haversine_distance_sql(lat, lon, Shelter.latitude, Shelter.longitude) <= range_km
+            )
+            for lat, lon in points
+        )))
+
+    @staticmethod
+    def _shelter_demand_query():
+        """全避難所の (避難所ID, カタログID, 需要数) を1回のGROUP BYで集計するクエリ（PostgreSQLのみ）"""
+        # 避難所ごとのバウンディングボックスをSQL側で計算
+        range_km, dlat, dlon = AdminAuthService._range_bounds_sql()
+        distance = haversine_distance_sql(User.latitude, User.longitude, Shelter.latitude, Shelter.longitude)
+        
+        # インデックスを使えるよう、境界値はカラムと同じnumeric型に揃える
+        return (
+            select(
+                Shelter.shelter_id,
+                Medication.catalog_id,
+                func.count(Medication.medication_id).label("required_quantity")
+            )
+            .join(User, and_(
+                User.latitude.between(
+                    cast(Shelter.latitude - dlat, Numeric), cast(Shelter.latitude + dlat, Numeric)
+                ),
+                User.longitude.between(
+                    cast(Shelter.longitude - dlon, Numeric), cast(Shelter.longitude + dlon, Numeric)
+                )
+            ))
+            .join(Medication, Medication.user_id == User.user_id)
+            .where(distance <= range_km)
+            .group_by(Shelter.shelter_id, Medication.catalog_id)
+        )
+
+    @staticmethod
+    async def _calculate_demand_for_shelters_sql(db: AsyncSession, shelters: list[Shelter]) -> dict[UUID, dict[int, int]]:
+        """複数避難所の医薬品需要を1回のGROUP BYクエリで計算"""
+        demand_by_shelter = {shelter.shelter_id: {} for shelter in shelters}
+        if not shelters:
+            return demand_by_shelter
+        
+        result = await db.execute(
+            AdminAuthService._shelter_demand_query()
+            .where(Shelter.shelter_id.in_(list(demand_by_shelter)))
+        )
+        
+        for shelter_id, catalog_id, count in result:
+            demand_by_shelter[shelter_id][catalog_id] = count
+        
+        return demand_by_shelter
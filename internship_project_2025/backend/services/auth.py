@@ -3,13 +3,15 @@ from typing import Optional
 from uuid import UUID
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from config import settings
 from models import User, ShelterAdmin
 from schemas import TokenData
+from services.password_hasher import password_hash_pool
 
 # パスワードハッシュ化のコンテキスト
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -31,6 +33,16 @@ class AuthService:
         """パスワードをハッシュ化"""
         return pwd_context.hash(password)
     
+    @staticmethod
+    async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+        """verify_password をイベントループ外で実行"""
+        return await password_hash_pool.run(pwd_context.verify, plain_password, hashed_password)
+    
+    @staticmethod
+    async def get_password_hash_async(password: str) -> str:
+        """get_password_hash をイベントループ外で実行"""
+        return await password_hash_pool.run(pwd_context.hash, password)
+    
     @staticmethod
     def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         """アクセストークンを作成"""
@@ -60,27 +72,33 @@ class AuthService:
             return None
     
     @staticmethod
-    def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+    async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
         """ユーザーを認証"""
-        user = db.query(User).filter(User.email == email).first()
+        result = await db.execute(select(User).where(User.email == email))
+        user = result.scalars().first()
         if not user:
             return None
-        if not AuthService.verify_password(password, user.password_hash):
+        # bcryptの実行中にDB接続を保持しないよう、先に読み取りトランザクションを終える
+        await db.commit()
+        if not await AuthService.verify_password_async(password, user.password_hash):
             return None
         return user
     
     @staticmethod
-    def authenticate_admin(db: Session, email: str, password: str) -> Optional[ShelterAdmin]:
+    async def authenticate_admin(db: AsyncSession, email: str, password: str) -> Optional[ShelterAdmin]:
         """管理者を認証"""
-        admin = db.query(ShelterAdmin).filter(ShelterAdmin.email == email).first()
+        result = await db.execute(select(ShelterAdmin).where(ShelterAdmin.email == email))
+        admin = result.scalars().first()
         if not admin:
             return None
-        if not AuthService.verify_password(password, admin.password_hash):
+        # bcryptの実行中にDB接続を保持しないよう、先に読み取りトランザクションを終える
+        await db.commit()
+        if not await AuthService.verify_password_async(password, admin.password_hash):
             return None
         return admin
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials, db: Session) -> User:
+async def get_current_user(credentials: HTTPAuthorizationCredentials, db: AsyncSession) -> User:
     """現在のユーザーを取得（依存性注入用）"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -98,13 +116,13 @@ def get_current_user(credentials: HTTPAuthorizationCredentials, db: Session) ->
             detail="ユーザー権限が必要です"
         )
     
-    user = db.query(User).filter(User.user_id == token_data.user_id).first()
+    user = await db.get(User, token_data.user_id)
     if user is None:
         raise credentials_exception
     return user
 
 
-def get_current_admin(credentials: HTTPAuthorizationCredentials, db: Session) -> ShelterAdmin:
+async def get_current_admin(credentials: HTTPAuthorizationCredentials, db: AsyncSession) -> ShelterAdmin:
     """現在の管理者を取得（依存性注入用）"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -122,7 +140,7 @@ def get_current_admin(credentials: HTTPAuthorizationCredentials, db: Session) ->
             detail="管理者権限が必要です"
         )
     
-    admin = db.query(ShelterAdmin).filter(ShelterAdmin.admin_id == token_data.user_id).first()
+    admin = await db.get(ShelterAdmin, token_data.user_id)
     if admin is None:
         raise credentials_exception
     return admin
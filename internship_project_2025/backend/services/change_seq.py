@@ -0,0 +1,103 @@
+"""
+差分同期の変更番号
+
+避難所・在庫を変更するトランザクションごとに単調増加の変更番号を採番し、変更した行の change_seq に記録する。
+削除した行は sync_tombstones に記録する。
+
+採番は sync_state の1行を UPDATE して行うため、その行ロックはコミットまで保持され、
+同時に書き込むトランザクションは採番順にコミットされる。そのため、コミット済みの last_seq 以下の番号を
+持つ変更はすべて読み取り可能になっている（updated_at は採番とコミットの順序が一致しないため使わない）
+"""
+
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from models import Shelter, MedicationInventory, SyncState, SyncTombstone
+
+# sync_state の行ID
+SYNC_STATE_ID = 1
+
+# 変更番号を記録するモデル
+SYNCED_MODELS = (Shelter, MedicationInventory)
+
+# セッションに保持する、このトランザクションの変更番号
+_SEQ_KEY = "sync_change_seq"
+
+
+def ensure_sync_state(conn: Connection) -> None:
+    """sync_state の行が無ければ作成"""
+    exists = conn.execute(select(SyncState.id).where(SyncState.id == SYNC_STATE_ID)).first()
+    if not exists:
+        conn.execute(insert(SyncState).values(id=SYNC_STATE_ID, last_seq=0))
+
+
+def current_seq_statement():
+    """コミット済みの最新の変更番号を取得するSELECT文"""
+    return select(SyncState.last_seq).where(SyncState.id == SYNC_STATE_ID)
+
+
+def allocate_change_seq(session: Session) -> int:
+    """
+    このトランザクションの変更番号を取得
+
+    最初の呼び出しで採番し、以降はコミットまたはロールバックまで同じ番号を返す。
+    非同期セッションからは run_sync() 経由で呼び出す
+    """
+    seq = session.info.get(_SEQ_KEY)
+    if seq is not None:
+        return seq
+
+    conn = session.connection()
+    stmt = (
+        update(SyncState)
+        .where(SyncState.id == SYNC_STATE_ID)
+        .values(last_seq=SyncState.last_seq + 1)
+        .returning(SyncState.last_seq)
+    )
+    seq = conn.execute(stmt).scalar()
+    if seq is None:
+        # 起動時・マイグレーションで作成済みのはずだが、無い場合はここで作成する
+        ensure_sync_state(conn)
+        seq = conn.execute(stmt).scalar()
+
+    session.info[_SEQ_KEY] = seq
+    return seq
+
+
+def _entity_key(obj) -> str:
+    if isinstance(obj, Shelter):
+        return str(obj.shelter_id)
+    return str(obj.inventory_id)
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_change_seq(session: Session, flush_context, instances) -> None:
+    """避難所・在庫の追加・変更に変更番号を記録し、削除を sync_tombstones に記録"""
+    changed = [obj for obj in session.new if isinstance(obj, SYNCED_MODELS)]
+    changed += [
+        obj for obj in session.dirty
+        if isinstance(obj, SYNCED_MODELS) and session.is_modified(obj, include_collections=False)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, SYNCED_MODELS)]
+    if not (changed or deleted):
+        return
+
+    seq = allocate_change_seq(session)
+    for obj in changed:
+        obj.change_seq = seq
+        if isinstance(obj, Shelter) and obj in session.new:
+            # 新しい避難所は需要も同期対象にする（既存の避難所の需要の変化は services/sync.py で記録）
+            obj.demand_seq = seq
+    for obj in deleted:
+        session.add(SyncTombstone(entity=obj.__tablename__, entity_key=_entity_key(obj), change_seq=seq))
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_change_seq(session: Session) -> None:
+    session.info.pop(_SEQ_KEY, None)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_change_seq(session: Session, previous_transaction) -> None:
+    session.info.pop(_SEQ_KEY, None)
@@ -0,0 +1,175 @@
+"""
+医薬品需要キャッシュ
+
+避難所ごとの医薬品需要（カタログID -> 集約範囲内ユーザーの医薬品数）を (shelter_id, aggregate_range) 単位で保持し、
+需要に影響する書き込みのコミット時に該当する避難所のエントリだけを無効化する
+"""
+
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import User, Medication, Shelter
+from services.location_index import user_location_index
+from utils.geo_utils import haversine_distance
+from utils.ttl_cache import TTLCache
+
+# セッションに溜めておく未コミットの無効化対象
+_PENDING_KEY = "demand_cache_invalidations"
+
+
+class MedicationDemandCache:
+    """避難所ごとの医薬品需要キャッシュ"""
+
+    def __init__(self):
+        self._cache = TTLCache(settings.demand_cache_max_entries, settings.demand_cache_ttl_seconds)
+
+    @property
+    def generation(self) -> int:
+        """計算開始前に取得し、set() に渡す"""
+        return self._cache.generation
+
+    def get(self, shelter: Shelter) -> Optional[dict[int, int]]:
+        """キャッシュ済みの需要を取得（未キャッシュの場合はNone）"""
+        entry = self._cache.get((shelter.shelter_id, shelter.aggregate_range))
+        return entry[3] if entry is not None else None
+
+    def set(self, shelter: Shelter, range_km: float, demand: dict[int, int], generation: int) -> None:
+        """計算済みの需要を保存"""
+        self._cache.set(
+            (shelter.shelter_id, shelter.aggregate_range),
+            (float(shelter.latitude), float(shelter.longitude), range_km, demand),
+            generation
+        )
+
+    def invalidate_location(self, lat: float, lon: float) -> None:
+        """指定地点を集約範囲に含む避難所のエントリを無効化"""
+        self._cache.pop_where(
+            lambda key, entry: haversine_distance(lat, lon, entry[0], entry[1]) <= entry[2]
+        )
+
+    def invalidate_shelter(self, shelter_id: UUID) -> None:
+        """指定避難所のエントリを無効化"""
+        self._cache.pop_where(lambda key, entry: key[0] == shelter_id)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+medication_demand_cache = MedicationDemandCache()
+
+
+def _history_value(state, attr: str):
+    """属性の変更前の値（未ロードの場合はNone）"""
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return None
+
+
+def _point(lat, lon) -> Optional[tuple[float, float]]:
+    if lat is None or lon is None:
+        return None
+    return (float(lat), float(lon))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_demand_invalidations(session: Session, flush_context) -> None:
+    """需要に影響する変更をコミットまでセッションに保持"""
+    points = set()
+    shelter_ids = set()
+    # 位置が変わったユーザー（変更前後の地点は points に追加済み）
+    moved_user_ids = set()
+    # 医薬品が変わったユーザー（地点は後でまとめて解決）
+    medication_user_ids = set()
+
+    # ユーザーの登録・削除・移動（移動は変更前後の両方の地点）
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, User):
+            moved_user_ids.add(obj.user_id)
+            points.add(_point(obj.latitude, obj.longitude))
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if (state.attrs.latitude.history.has_changes()
+                    or state.attrs.longitude.history.has_changes()):
+                moved_user_ids.add(obj.user_id)
+                points.add(_point(obj.latitude, obj.longitude))
+                points.add(_point(_history_value(state, "latitude"), _history_value(state, "longitude")))
+                points.add(user_location_index.location_of(obj.user_id))
+
+    # 医薬品の追加・削除・変更（服用者の地点）
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, Medication):
+            medication_user_ids.add(obj.user_id)
+    for obj in session.dirty:
+        if isinstance(obj, Medication):
+            state = inspect(obj)
+            if (state.attrs.catalog_id.history.has_changes()
+                    or state.attrs.user_id.history.has_changes()):
+                medication_user_ids.add(obj.user_id)
+                medication_user_ids.add(_history_value(state, "user_id"))
+
+    # 避難所の集約範囲・位置の変更、削除
+    for obj in session.deleted:
+        if isinstance(obj, Shelter):
+            shelter_ids.add(obj.shelter_id)
+    for obj in session.dirty:
+        if isinstance(obj, Shelter):
+            state = inspect(obj)
+            if any(state.attrs[attr].history.has_changes()
+                   for attr in ("aggregate_range", "latitude", "longitude")):
+                shelter_ids.add(obj.shelter_id)
+
+    # 医薬品の服用者の地点を、位置インデックス → DB の順に解決
+    unresolved = set()
+    for user_id in medication_user_ids - moved_user_ids - {None}:
+        location = user_location_index.location_of(user_id)
+        if location is not None:
+            points.add(location)
+        else:
+            unresolved.add(user_id)
+    if unresolved:
+        rows = session.connection().execute(
+            select(User.latitude, User.longitude).where(User.user_id.in_(unresolved))
+        )
+        points.update(_point(lat, lon) for lat, lon in rows)
+
+    points.discard(None)
+    if not (points or shelter_ids):
+        return
+    pending = session.info.setdefault(_PENDING_KEY, {"points": set(), "shelter_ids": set()})
+    pending["points"] |= points
+    pending["shelter_ids"] |= shelter_ids
+
+
+def pending_demand_changes(session: Session) -> tuple[set[tuple[float, float]], set[UUID]]:
+    """フラッシュ済みで未コミットの、需要に影響する変更（地点の集合, 避難所IDの集合）"""
+    pending = session.info.get(_PENDING_KEY)
+    if not pending:
+        return set(), set()
+    return set(pending["points"]), set(pending["shelter_ids"])
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_demand_invalidations(session: Session) -> None:
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for lat, lon in pending["points"]:
+        medication_demand_cache.invalidate_location(lat, lon)
+    for shelter_id in pending["shelter_ids"]:
+        medication_demand_cache.invalidate_shelter(shelter_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_demand_invalidations(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
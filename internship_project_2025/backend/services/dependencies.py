@@ -6,17 +6,18 @@ FastAPIの依存性注入で使用する認証関連の依存関数を定義
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
 
 from database import get_db
 from models import User, ShelterAdmin
 from services.auth import security, AuthService
+from services.principal_cache import principal_cache
 
 
-def get_current_user_dep(
+async def get_current_user_dep(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """現在のユーザーを取得（依存性注入用）"""
     credentials_exception = HTTPException(
@@ -35,15 +36,15 @@ def get_current_user_dep(
             detail="ユーザー権限が必要です"
         )
     
-    user = db.query(User).filter(User.user_id == token_data.user_id).first()
+    user = await principal_cache.get(db, User, "user", token_data.user_id)
     if user is None:
         raise credentials_exception
     return user
 
 
-def get_current_admin_dep(
+async def get_current_admin_dep(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> ShelterAdmin:
     """現在の管理者を取得（依存性注入用）"""
     credentials_exception = HTTPException(
@@ -62,7 +63,7 @@ def get_current_admin_dep(
             detail="管理者権限が必要です"
         )
     
-    admin = db.query(ShelterAdmin).filter(ShelterAdmin.admin_id == token_data.user_id).first()
+    admin = await principal_cache.get(db, ShelterAdmin, "admin", token_data.user_id)
     if admin is None:
         raise credentials_exception
     return admin
@@ -70,7 +71,7 @@ def get_current_admin_dep(
 
 def verify_shelter_permission_dep(shelter_id: UUID):
     """指定された避難所の管理権限を確認する依存関数を生成"""
-    def _verify_permission(
+    async def _verify_permission(
         admin: ShelterAdmin = Depends(get_current_admin_dep)
     ) -> ShelterAdmin:
         if admin.shelter_id != shelter_id:
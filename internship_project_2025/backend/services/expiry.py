@@ -0,0 +1,180 @@
+"""
+医薬品在庫の有効期限
+
+有効期限が近い在庫の検索と、有効期限日ごとの在庫の集計を行う。
+どちらも (expiry_date, shelter_id) の部分インデックス（期限未設定の行を含まない）で期限の範囲だけを読む。
+集計は ExpirySweeper がメモリに保持する。起動時に一度集計し、その後はバックグラウンドで定期的に確認して、
+日付が変わったか差分同期の変更番号（sync_state.last_seq）が進んでいた場合だけ集計し直す。
+ダッシュボードからの集計の取得はメモリ上の集計を返すだけで、データベースを読まない
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Shelter, MedicationInventory
+from services.change_seq import current_seq_statement
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryService:
+    """有効期限が近い在庫の検索サービス"""
+
+    @staticmethod
+    async def get_expiring_inventory(
+        db: AsyncSession,
+        days: int,
+        shelter_id: Optional[UUID],
+        include_expired: bool,
+        limit: int
+    ) -> list[dict]:
+        """今日から days 日以内に有効期限を迎える在庫を期限の近い順に取得（ExpiringInventory と同じキーの辞書）"""
+        today = date.today()
+        query = ExpiryService._expiring_query(today, days, shelter_id, include_expired).limit(limit)
+        result = await db.execute(query)
+        return [
+            {
+                "inventory_id": inventory_id,
+                "shelter_id": row_shelter_id,
+                "shelter_name": shelter_name,
+                "medication_name": medication_name,
+                "quantity": quantity,
+                "expiry_date": expiry_date,
+                "days_left": (expiry_date - today).days,
+            }
+            for inventory_id, row_shelter_id, shelter_name, medication_name, quantity, expiry_date in result
+        ]
+
+    @staticmethod
+    def _expiring_query(today: date, days: int, shelter_id: Optional[UUID], include_expired: bool):
+        """有効期限が today から days 日以内の在庫を期限の近い順に並べるクエリ"""
+        # 期限切れを含める場合も、期限未設定の行は部分インデックスの条件で除く
+        lower = MedicationInventory.expiry_date.isnot(None) if include_expired else MedicationInventory.expiry_date >= today
+        query = (
+            select(
+                MedicationInventory.inventory_id, MedicationInventory.shelter_id, Shelter.name,
+                MedicationInventory.medication_name, MedicationInventory.quantity, MedicationInventory.expiry_date
+            )
+            .join(Shelter, MedicationInventory.shelter_id == Shelter.shelter_id)
+            .where(lower, MedicationInventory.expiry_date <= today + timedelta(days=days))
+            .order_by(MedicationInventory.expiry_date, MedicationInventory.shelter_id, MedicationInventory.inventory_id)
+        )
+        if shelter_id is not None:
+            query = query.where(MedicationInventory.shelter_id == shelter_id)
+        return query
+
+
+class ExpirySnapshot:
+    """ある日付・変更番号の時点での有効期限日ごとの集計"""
+
+    def __init__(self, as_of: date, source_seq: int):
+        self.as_of = as_of
+        self.source_seq = source_seq
+        # 避難所ID -> 期限日 -> [件数, 在庫数]（期限切れの行は期限日のまま含む）
+        self.by_shelter: dict[UUID, dict[date, list[int]]] = defaultdict(dict)
+        # 全避難所の合計（期限日 -> [件数, 在庫数]）
+        self.fleet: dict[date, list[int]] = {}
+
+    def add(self, shelter_id: UUID, expiry_date: date, item_count: int, quantity: int) -> None:
+        self.by_shelter[shelter_id][expiry_date] = [item_count, quantity]
+        total = self.fleet.setdefault(expiry_date, [0, 0])
+        total[0] += item_count
+        total[1] += quantity
+
+
+class ExpirySweeper:
+    """有効期限日ごとの在庫の集計を保持し、日付の変更・在庫の変更時に集計し直す"""
+
+    def __init__(self, horizon_days: int):
+        self.horizon_days = horizon_days
+        self._snapshot: Optional[ExpirySnapshot] = None
+        self._lock = asyncio.Lock()
+        self.sweeps = 0
+
+    def _is_current(self, today: date, seq: int) -> bool:
+        snapshot = self._snapshot
+        return snapshot is not None and snapshot.as_of == today and snapshot.source_seq >= seq
+
+    async def refresh(self, db: AsyncSession) -> bool:
+        """集計が古ければ集計し直す（集計し直した場合はTrue）"""
+        today = date.today()
+        # 集計より先に変更番号を読むため、集計中にコミットされた変更は次回の確認で集計し直される
+        seq = (await db.execute(current_seq_statement())).scalar() or 0
+        if self._is_current(today, seq):
+            return False
+        async with self._lock:
+            if self._is_current(today, seq):
+                return False
+            result = await db.execute(
+                select(
+                    MedicationInventory.shelter_id, MedicationInventory.expiry_date,
+                    func.count(MedicationInventory.inventory_id), func.sum(MedicationInventory.quantity)
+                )
+                .where(
+                    MedicationInventory.expiry_date.isnot(None),
+                    MedicationInventory.expiry_date <= today + timedelta(days=self.horizon_days)
+                )
+                .group_by(MedicationInventory.shelter_id, MedicationInventory.expiry_date)
+            )
+            snapshot = ExpirySnapshot(today, seq)
+            for shelter_id, expiry_date, item_count, quantity in result:
+                snapshot.add(shelter_id, expiry_date, item_count, quantity or 0)
+            self._snapshot = snapshot
+            self.sweeps += 1
+            return True
+
+    def get_summary(self, shelter_id: Optional[UUID], days: int) -> Optional[dict]:
+        """
+        今日から days 日以内の期限日ごとの集計と、期限切れの合計を取得（ExpirySummary と同じキーの辞書）
+
+        shelter_id を省略した場合は全避難所の合計を返す。days は horizon_days 以下で指定する。
+        集計し直すのはバックグラウンドのタスクだけで、ここでは現在の集計を返す（未集計の場合はNone）
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        buckets = snapshot.fleet if shelter_id is None else snapshot.by_shelter.get(shelter_id, {})
+        end = snapshot.as_of + timedelta(days=days)
+
+        expired_item_count = expired_quantity = 0
+        rows = []
+        for expiry_date, (item_count, quantity) in sorted(buckets.items()):
+            if expiry_date < snapshot.as_of:
+                expired_item_count += item_count
+                expired_quantity += quantity
+            elif expiry_date <= end:
+                rows.append({"expiry_date": expiry_date, "item_count": item_count, "quantity": quantity})
+        return {
+            "as_of": snapshot.as_of,
+            "expired_item_count": expired_item_count,
+            "expired_quantity": expired_quantity,
+            "buckets": rows,
+        }
+
+
+expiry_sweeper = ExpirySweeper(settings.expiry_horizon_days)
+
+
+async def refresh_expiry_summary() -> None:
+    """有効期限の集計が古ければ集計し直す（失敗はログに記録し、現在の集計を残す）"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await expiry_sweeper.refresh(db)
+    except Exception:
+        logger.exception("有効期限の集計に失敗しました")
+
+
+async def run_expiry_sweeper(interval: float) -> None:
+    """interval 秒ごとに有効期限の集計が古くなっていないかを確認（lifespan のタスクとして実行。初回の集計は起動時に行う）"""
+    while True:
+        await asyncio.sleep(interval)
+        await refresh_expiry_summary()
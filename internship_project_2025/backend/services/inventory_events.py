@@ -0,0 +1,79 @@
+"""
+在庫変更の配信
+
+避難所ごとのトピックに購読中の管理者画面を登録し、在庫の更新がコミットされたときに
+変更された行だけを配信する（同じプロセス内のみ。他ワーカーでの更新は届かない）。
+購読者ごとのキューには上限があり、受信が追いつかない購読者には未送信の変更を破棄して
+再取得（resync）を通知する
+"""
+
+import asyncio
+from typing import Optional
+from uuid import UUID
+
+from config import settings
+from utils.fast_json import dumps
+
+
+class InventorySubscription:
+    """1接続分の購読（キューの None は再取得が必要なことを表す）"""
+
+    def __init__(self, shelter_id: UUID, maxsize: int):
+        self.shelter_id = shelter_id
+        self.queue: asyncio.Queue[Optional[list[dict]]] = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    async def get(self, timeout: float) -> Optional[list[dict]]:
+        """変更された行を待つ（timeout 秒以内に届かない場合は TimeoutError）"""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class InventoryBroadcaster:
+    """避難所ごとの在庫変更の配信"""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._topics: dict[UUID, set[InventorySubscription]] = {}
+        self.dropped = 0
+
+    def subscribe(self, shelter_id: UUID) -> InventorySubscription:
+        subscription = InventorySubscription(shelter_id, self.queue_size)
+        self._topics.setdefault(shelter_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: InventorySubscription) -> None:
+        subscribers = self._topics.get(subscription.shelter_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.shelter_id]
+
+    def has_subscribers(self, shelter_id: UUID) -> bool:
+        return shelter_id in self._topics
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._topics.values())
+
+    def publish(self, shelter_id: UUID, rows: list[dict]) -> None:
+        """変更された行を避難所の購読者に配信（イベントループのスレッドから呼び出す）"""
+        for subscription in self._topics.get(shelter_id, ()):
+            if subscription.overflowed:
+                continue
+            try:
+                subscription.queue.put_nowait(rows)
+            except asyncio.QueueFull:
+                # 受信が遅い購読者: 溜まった変更を捨て、再取得を通知する
+                while not subscription.queue.empty():
+                    subscription.queue.get_nowait()
+                subscription.queue.put_nowait(None)
+                subscription.overflowed = True
+                self.dropped += 1
+
+
+inventory_broadcaster = InventoryBroadcaster(settings.inventory_events_queue_size)
+
+
+def format_event(event: str, data) -> bytes:
+    """Server-Sent Events の1イベント分の形式に変換"""
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
@@ -0,0 +1,130 @@
+"""
+ユーザー位置インデックス
+
+全ユーザーの緯度経度をプロセス内の空間インデックスに保持し、
+ユーザーの登録・移動・削除のコミットに合わせて差分更新する。
+全件の読み直しはプロセス内で同時に1つだけ行い、読み直し中の検索は読み込み済みのインデックスを使う
+"""
+
+import asyncio
+import threading
+import time
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import User
+from utils.spatial_index import GridIndex
+
+# セッションに溜めておく未コミットの位置変更（user_id -> (緯度, 経度) または削除時None）
+_PENDING_KEY = "user_location_changes"
+
+
+class UserLocationIndex:
+    """ユーザー位置の空間インデックス"""
+
+    def __init__(self, cell_size_deg: float = 0.02):
+        self._index = GridIndex(cell_size_deg)
+        self._lock = threading.Lock()
+        self._reload_lock = asyncio.Lock()
+        self._loaded_at: Optional[float] = None
+
+    def _is_stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        ttl = settings.user_location_index_ttl_seconds
+        # 他ワーカーでの更新を取り込むため、一定時間ごとに全件を読み直す
+        return ttl > 0 and time.monotonic() - self._loaded_at > ttl
+
+    async def ensure_loaded(self, db: AsyncSession) -> None:
+        """未読み込み（または期限切れ）の場合はDBから全ユーザーの位置を読み込む"""
+        if not self._is_stale():
+            return
+        if self._loaded_at is not None and self._reload_lock.locked():
+            # 期限切れの読み直しは他のリクエストが実行中のため、待たずに現在のインデックスを使う
+            return
+        async with self._reload_lock:
+            # 待っている間に他のリクエストが読み込んだ場合は読み直さない
+            if not self._is_stale():
+                return
+            result = await db.execute(select(User.user_id, User.latitude, User.longitude))
+            rows = result.all()
+            with self._lock:
+                self._index.bulk_load(
+                    (user_id, float(lat), float(lon)) for user_id, lat, lon in rows
+                )
+                self._loaded_at = time.monotonic()
+
+    async def users_in_range(self, db: AsyncSession, lat: float, lon: float, range_km: float) -> list[UUID]:
+        """指定地点から range_km 以内にいるユーザーIDを返す"""
+        await self.ensure_loaded(db)
+        with self._lock:
+            return self._index.query(lat, lon, range_km)
+
+    def location_of(self, user_id: UUID) -> Optional[tuple[float, float]]:
+        """インデックス上のユーザー位置を取得（未読み込み・未登録の場合はNone）"""
+        with self._lock:
+            return self._index.get(user_id)
+
+    def apply_changes(self, changes: dict[UUID, Optional[tuple[float, float]]]) -> None:
+        """コミット済みの位置変更を反映"""
+        if self._loaded_at is None:
+            # 未読み込みなら次回の検索時に全件読み込むので何もしない
+            return
+        with self._lock:
+            for user_id, location in changes.items():
+                if location is None:
+                    self._index.remove(user_id)
+                else:
+                    self._index.upsert(user_id, *location)
+
+    def reset(self) -> None:
+        """インデックスを破棄（次回検索時に再読み込み）"""
+        with self._lock:
+            self._index.clear()
+            self._loaded_at = None
+
+
+user_location_index = UserLocationIndex()
+
+
+def _location_of(user: User) -> Optional[tuple[float, float]]:
+    if user.latitude is None or user.longitude is None:
+        return None
+    return (float(user.latitude), float(user.longitude))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_location_changes(session: Session, flush_context) -> None:
+    """フラッシュされたユーザーの位置変更をコミットまでセッションに保持"""
+    changes = {}
+    for obj in session.new:
+        if isinstance(obj, User):
+            changes[obj.user_id] = _location_of(obj)
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if (state.attrs.latitude.history.has_changes()
+                    or state.attrs.longitude.history.has_changes()):
+                changes[obj.user_id] = _location_of(obj)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            changes[obj.user_id] = None
+    if changes:
+        session.info.setdefault(_PENDING_KEY, {}).update(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_user_location_changes(session: Session) -> None:
+    changes = session.info.pop(_PENDING_KEY, None)
+    if changes:
+        user_location_index.apply_changes(changes)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_user_location_changes(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,93 @@
+"""
+医療情報キャッシュ
+
+QRコード用の医療情報をユーザーごとにシリアライズ済みのJSONとETagで保持し、
+ユーザーまたは医薬品の書き込みのコミット時に該当ユーザーのエントリを無効化する
+"""
+
+import hashlib
+from typing import NamedTuple, Optional
+from uuid import UUID
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import User, Medication
+from schemas import MedicalInfo
+from utils.ttl_cache import TTLCache
+
+# セッションに溜めておく未コミットの無効化対象
+_PENDING_KEY = "medical_info_cache_invalidations"
+
+
+class CachedMedicalInfo(NamedTuple):
+    """キャッシュ済みの医療情報"""
+    info: MedicalInfo
+    body: bytes
+    etag: str
+
+
+class MedicalInfoCache:
+    """ユーザーごとの医療情報キャッシュ"""
+
+    def __init__(self):
+        self._cache = TTLCache(settings.medical_info_cache_max_entries, settings.medical_info_cache_ttl_seconds)
+
+    @property
+    def generation(self) -> int:
+        """読み込み開始前に取得し、set() に渡す"""
+        return self._cache.generation
+
+    def get(self, user_id: UUID) -> Optional[CachedMedicalInfo]:
+        return self._cache.get(user_id)
+
+    def set(self, user_id: UUID, info: MedicalInfo, generation: int) -> CachedMedicalInfo:
+        """医療情報をシリアライズして保存"""
+        body = info.model_dump_json().encode("utf-8")
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        entry = CachedMedicalInfo(info, body, etag)
+        self._cache.set(user_id, entry, generation)
+        return entry
+
+    def invalidate(self, user_id: UUID) -> None:
+        self._cache.pop(user_id)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+medical_info_cache = MedicalInfoCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_medical_info_invalidations(session: Session, flush_context) -> None:
+    """医療情報に影響する変更をコミットまでセッションに保持"""
+    user_ids = set()
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            user_ids.add(obj.user_id)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Medication):
+            user_ids.add(obj.user_id)
+            # 服用者が変わった場合は変更前のユーザーも対象
+            history = inspect(obj).attrs.user_id.history
+            user_ids.update(history.deleted)
+
+    user_ids.discard(None)
+    if user_ids:
+        session.info.setdefault(_PENDING_KEY, set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_medical_info_invalidations(session: Session) -> None:
+    for user_id in session.info.pop(_PENDING_KEY, ()):
+        medical_info_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_medical_info_invalidations(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
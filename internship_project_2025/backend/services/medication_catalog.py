@@ -0,0 +1,166 @@
+"""
+医薬品カタログ
+
+医薬品名を正規化した表記で別名テーブルと照合し、整数のカタログIDに変換する。
+利用者の医薬品・避難所の在庫は追加・名前の変更時に catalog_id が自動で設定され、
+需要の集計・在庫との突き合わせは名前ではなく catalog_id で行う。
+未登録の名前は最初に現れた表記を正式名としてカタログに追加する。
+
+正規化した表記 -> カタログID の対応はキャッシュする（別名の付け替えは db_manager.py から行うため、
+稼働中のワーカーにはキャッシュの有効期限後に反映される）。
+このトランザクションで追加した対応は、ロールバックで消える可能性があるためコミット後にキャッシュする
+"""
+
+from typing import Iterable, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, attributes
+
+from config import settings
+from database import UPSERT_INSERTS
+from models import Medication, MedicationInventory, MedicationCatalog, MedicationAlias
+from utils.medication_names import normalize_medication_name
+from utils.ttl_cache import TTLCache
+
+# セッションに保持する、このトランザクションで追加した対応（正規化した表記 -> カタログID）
+_CREATED_KEY = "medication_catalog_created"
+
+# catalog_id を設定するモデルと、名前の属性
+CATALOGED_MODELS = {Medication: "name", MedicationInventory: "medication_name"}
+
+catalog_id_cache = TTLCache(settings.medication_catalog_cache_max_entries, settings.medication_catalog_cache_ttl_seconds)
+
+
+def lookup_catalog_ids(conn: Connection, names: Iterable[str]) -> dict[str, int]:
+    """医薬品名 -> カタログID（カタログに無い名前は結果に含めない）"""
+    normalized = {name: normalize_medication_name(name) for name in names}
+    ids = {}
+    missing = set()
+    for key in set(normalized.values()):
+        catalog_id = catalog_id_cache.get(key)
+        if catalog_id is None:
+            missing.add(key)
+        else:
+            ids[key] = catalog_id
+    if missing:
+        result = conn.execute(
+            select(MedicationAlias.normalized_name, MedicationAlias.catalog_id)
+            .where(MedicationAlias.normalized_name.in_(missing))
+        )
+        for key, catalog_id in result:
+            catalog_id_cache.set(key, catalog_id)
+            ids[key] = catalog_id
+    return {name: ids[key] for name, key in normalized.items() if key in ids}
+
+
+def resolve_catalog_ids(conn: Connection, names: Iterable[str], created: Optional[dict[str, int]] = None) -> dict[str, int]:
+    """
+    医薬品名 -> カタログID（未登録の名前はカタログと別名に追加）
+
+    同時に同じ名前を追加しても重複しないよう ON CONFLICT DO NOTHING で追加してから読み直す。
+    created を渡すと、追加した対応をキャッシュせずに created に記録する
+    """
+    names = set(names)
+    ids = lookup_catalog_ids(conn, names)
+    new_names = {}
+    for name in names - ids.keys():
+        # 正規化すると同じになる名前が複数ある場合は、最初に現れた表記を正式名にする
+        new_names.setdefault(normalize_medication_name(name), name.strip())
+    if not new_names:
+        return ids
+
+    insert = UPSERT_INSERTS[conn.dialect.name]
+    conn.execute(
+        insert(MedicationCatalog)
+        .values([{"name": name} for name in new_names.values()])
+        .on_conflict_do_nothing(index_elements=[MedicationCatalog.name])
+    )
+    catalog_ids = dict(conn.execute(
+        select(MedicationCatalog.name, MedicationCatalog.catalog_id)
+        .where(MedicationCatalog.name.in_(list(new_names.values())))
+    ).all())
+    conn.execute(
+        insert(MedicationAlias)
+        .values([
+            {"normalized_name": key, "catalog_id": catalog_ids[name]}
+            for key, name in new_names.items()
+        ])
+        .on_conflict_do_nothing(index_elements=[MedicationAlias.normalized_name])
+    )
+    # 他のトランザクションが先に別名を追加していた場合はそちらのIDになる
+    result = conn.execute(
+        select(MedicationAlias.normalized_name, MedicationAlias.catalog_id)
+        .where(MedicationAlias.normalized_name.in_(list(new_names)))
+    )
+    added = dict(result.all())
+    if created is not None:
+        created.update(added)
+    else:
+        for key, catalog_id in added.items():
+            catalog_id_cache.set(key, catalog_id)
+    for name in names - ids.keys():
+        ids[name] = added[normalize_medication_name(name)]
+    return ids
+
+
+async def get_catalog_names(db: AsyncSession, catalog_ids: Iterable[int]) -> dict[int, str]:
+    """カタログID -> 正式名"""
+    catalog_ids = set(catalog_ids)
+    if not catalog_ids:
+        return {}
+    result = await db.execute(
+        select(MedicationCatalog.catalog_id, MedicationCatalog.name)
+        .where(MedicationCatalog.catalog_id.in_(catalog_ids))
+    )
+    return dict(result.all())
+
+
+async def get_catalog_entries(db: AsyncSession) -> list[dict]:
+    """カタログの全件を正式名順に取得（MedicationCatalogEntry と同じキーの辞書）"""
+    result = await db.execute(
+        select(MedicationCatalog.catalog_id, MedicationCatalog.name).order_by(MedicationCatalog.name)
+    )
+    return [{"catalog_id": catalog_id, "name": name} for catalog_id, name in result]
+
+
+def resolve_session_catalog_ids(session: Session, names: Iterable[str]) -> dict[str, int]:
+    """セッションのトランザクションで医薬品名をカタログIDに変換（非同期セッションからは run_sync() 経由で呼び出す）"""
+    created = session.info.setdefault(_CREATED_KEY, {})
+    names = set(names)
+    # このトランザクションで追加した対応はキャッシュに無いため先に使う
+    ids = {name: created[key] for name in names if (key := normalize_medication_name(name)) in created}
+    ids.update(resolve_catalog_ids(session.connection(), names - ids.keys(), created))
+    return ids
+
+
+@event.listens_for(Session, "before_flush")
+def _assign_catalog_ids(session: Session, flush_context, instances) -> None:
+    """追加・名前を変更した医薬品・在庫に catalog_id を設定"""
+    targets = []
+    for obj in session.new:
+        attr = CATALOGED_MODELS.get(type(obj))
+        if attr is not None and getattr(obj, attr) is not None:
+            targets.append((obj, getattr(obj, attr)))
+    for obj in session.dirty:
+        attr = CATALOGED_MODELS.get(type(obj))
+        if attr is not None and attributes.get_history(obj, attr).has_changes():
+            targets.append((obj, getattr(obj, attr)))
+    if not targets:
+        return
+
+    ids = resolve_session_catalog_ids(session, {name for _, name in targets})
+    for obj, name in targets:
+        obj.catalog_id = ids[name]
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_created_catalog_ids(session: Session) -> None:
+    for key, catalog_id in session.info.pop(_CREATED_KEY, {}).items():
+        catalog_id_cache.set(key, catalog_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_created_catalog_ids(session: Session, previous_transaction) -> None:
+    session.info.pop(_CREATED_KEY, None)
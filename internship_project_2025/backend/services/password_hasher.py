@@ -0,0 +1,68 @@
+"""
+パスワードハッシュ処理プール
+
+bcryptの検証・ハッシュ化をイベントループ外のスレッドプールで実行し、
+ログイン集中時も他のエンドポイントの応答が止まらないようにする
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+from config import settings
+
+
+class PasswordHashPool:
+    """
+    待ち行列の上限付きのbcrypt用スレッドプール
+
+    bcryptは計算中にGILを解放するため、スレッドでも複数コアを使って並列に処理できる。
+    実行中と待機中の合計が上限に達した場合は、待たせずに503を返す。
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        # イベントループのスレッドからのみ増減するためロックは不要
+        self._in_flight = 0
+        self.rejected = 0
+
+    @property
+    def in_flight(self) -> int:
+        """実行中と待機中の合計"""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """ワーカーの空きを待っている件数"""
+        return max(0, self._in_flight - self.max_workers)
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """func(*args) をプールで実行して結果を返す"""
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="ログインが集中しています。しばらくしてから再度お試しください",
+                headers={"Retry-After": "1"},
+            )
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(func, *args))
+        finally:
+            self._in_flight -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hash_pool = PasswordHashPool(
+    max_workers=settings.password_hash_workers,
+    max_queue=settings.password_hash_queue_limit,
+)
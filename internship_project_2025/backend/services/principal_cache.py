@@ -0,0 +1,94 @@
+"""
+認証済みプリンシパルキャッシュ
+
+JWTで認証したユーザー・管理者を (種別, ID) 単位で短時間保持し、
+認証のたびに users / shelter_admins を読み直さないようにする。
+該当する行の更新・削除のコミット時にエントリを無効化する
+"""
+
+from typing import Optional, Type, TypeVar, Union
+from uuid import UUID
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import User, ShelterAdmin
+from utils.ttl_cache import TTLCache
+
+# セッションに溜めておく未コミットの無効化対象
+_PENDING_KEY = "principal_cache_invalidations"
+
+Principal = TypeVar("Principal", User, ShelterAdmin)
+
+
+def _key_of(obj: Union[User, ShelterAdmin]) -> tuple[str, UUID]:
+    if isinstance(obj, User):
+        return ("user", obj.user_id)
+    return ("admin", obj.admin_id)
+
+
+class PrincipalCache:
+    """
+    認証済みのユーザー・管理者のキャッシュ
+
+    キャッシュにはどのセッションにも属さないインスタンスを保持し、
+    取得時は load=False の merge でリクエストのセッションに複製を取り込む（SQLは発行しない）。
+    ルート側で属性を変更してもキャッシュ上のインスタンスには影響しない。
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(settings.principal_cache_max_entries, settings.principal_cache_ttl_seconds)
+
+    async def get(
+        self, db: AsyncSession, model: Type[Principal], user_type: str, principal_id: UUID
+    ) -> Optional[Principal]:
+        """プリンシパルを取得（キャッシュにない場合はDBから読み込んで保存）"""
+        key = (user_type, principal_id)
+        cached = self._cache.get(key)
+        if cached is None:
+            generation = self._cache.generation
+            principal = await db.get(model, principal_id)
+            if principal is None:
+                return None
+            db.expunge(principal)
+            self._cache.set(key, principal, generation)
+            cached = principal
+        return await db.merge(cached, load=False)
+
+    def invalidate(self, user_type: str, principal_id: UUID) -> None:
+        """指定プリンシパルのエントリを無効化"""
+        self._cache.pop((user_type, principal_id))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_invalidations(session: Session, flush_context) -> None:
+    """更新・削除されたユーザー・管理者をコミットまでセッションに保持"""
+    keys = {
+        _key_of(obj)
+        for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, (User, ShelterAdmin))
+    }
+    if keys:
+        session.info.setdefault(_PENDING_KEY, set()).update(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_principal_invalidations(session: Session) -> None:
+    for user_type, principal_id in session.info.pop(_PENDING_KEY, ()):
+        principal_cache.invalidate(user_type, principal_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_principal_invalidations(session: Session, previous_transaction) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,108 @@
+"""
+QRコード画像キャッシュ
+
+医療情報を埋め込んだビューアURLのハッシュをキーにPNGを保持し、
+医療情報が変わったときだけ画像を生成し直す。生成はイベントループ外で行う
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import urllib.parse
+from typing import Optional
+
+from config import settings
+from schemas import MedicalInfo
+from utils.ttl_cache import TTLCache
+
+# QRコードに埋め込むWebビューアのURL（localhostでアクセス可能なURL）
+VIEWER_BASE_URL = "http://localhost:3000/medical-info-viewer?data="
+
+
+def build_qr_payload(medical_info: MedicalInfo) -> str:
+    """医療情報をJSON化し、URLエンコードしてビューアURLに埋め込む"""
+    json_str = json.dumps(medical_info.model_dump(), ensure_ascii=False, default=str)
+    return VIEWER_BASE_URL + urllib.parse.quote(json_str)
+
+
+def render_qr_png(payload: str) -> bytes:
+    """QRコードを生成してPNGのバイト列を返す"""
+    # qrcode（とPIL）は初回の生成時に読み込み、ワーカーの起動を速くする
+    import qrcode
+
+    img = qrcode.make(payload)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class QRImageCache:
+    """
+    ペイロードのハッシュをキーにしたQRコード画像キャッシュ
+
+    同じペイロードの生成が同時に要求された場合は、最初の生成結果を共有する。
+    """
+
+    def __init__(self):
+        self._cache = TTLCache(settings.qr_image_cache_max_entries, settings.qr_image_cache_ttl_seconds)
+        # 生成中のペイロード（イベントループのスレッドからのみ操作する）
+        self._rendering: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def etag_for(payload: str) -> str:
+        """ペイロードのETag（強いバリデータ）"""
+        return '"' + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32] + '"'
+
+    def get_cached(self, payload: str) -> Optional[bytes]:
+        """キャッシュ済みのPNGを取得（未キャッシュの場合はNone）"""
+        return self._cache.get(self.etag_for(payload))
+
+    async def get_png(self, payload: str, etag: Optional[str] = None) -> bytes:
+        """PNGを取得（キャッシュにない場合はスレッドで生成して保存）"""
+        key = etag or self.etag_for(payload)
+        png = self._cache.get(key)
+        if png is not None:
+            return png
+
+        rendering = self._rendering.get(key)
+        if rendering is not None:
+            return await asyncio.shield(rendering)
+
+        future = asyncio.get_running_loop().create_future()
+        self._rendering[key] = future
+        try:
+            png = await asyncio.to_thread(render_qr_png, payload)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 待機者がいない場合に「未取得の例外」警告を出さない
+            future.exception()
+            raise
+        finally:
+            del self._rendering[key]
+        self._cache.set(key, png)
+        future.set_result(png)
+        return png
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+qr_image_cache = QRImageCache()
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match ヘッダーが ETag に一致するか（弱い比較）"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
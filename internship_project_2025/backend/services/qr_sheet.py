@@ -0,0 +1,180 @@
+"""
+QRカード一括出力
+
+避難所の集約範囲内の全ユーザーのQRカードを複数ページのPDFにまとめる。
+医療情報はバッチごとに読み込み、QRコード画像はプロセスプールでバッチごとに並列生成して、
+生成が終わったバッチから順にページへ配置する（集約範囲の全員分の医療情報を同時には保持しない）
+"""
+
+import asyncio
+import io
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, NamedTuple, Optional
+from uuid import UUID
+
+from config import settings
+from database import AsyncSessionLocal
+from schemas import MedicalInfo
+from services.qr_image import build_qr_payload, qr_image_cache, render_qr_png
+from services.user_auth import UserAuthService
+
+# fpdf2 はインポートに時間がかかるため、ワーカーの起動を遅らせないよう初回のPDF作成時に読み込む
+if TYPE_CHECKING:
+    from fpdf import FPDF
+
+# A4縦に 2列 x 3行 でカードを配置（単位はmm）
+CARD_COLUMNS = 2
+CARD_ROWS = 3
+CARDS_PER_PAGE = CARD_COLUMNS * CARD_ROWS
+PAGE_MARGIN = 10
+CARD_WIDTH = (210 - PAGE_MARGIN * 2) / CARD_COLUMNS
+CARD_HEIGHT = (297 - PAGE_MARGIN * 2) / CARD_ROWS
+QR_SIZE = 70
+LINE_HEIGHT = 5
+
+class QRCard(NamedTuple):
+    """1枚分のQRカード"""
+    user_id: UUID
+    name: str
+    birthday: str
+    payload: str
+
+
+def build_qr_cards(user_ids: list[UUID], medical_info_by_user: dict[UUID, MedicalInfo]) -> list[QRCard]:
+    """医療情報からQRカードを作成（user_ids の順。医療情報が無いユーザーは除く）"""
+    return [
+        QRCard(user_id, info.name, info.birthday.isoformat(), build_qr_payload(info))
+        for user_id in user_ids
+        if (info := medical_info_by_user.get(user_id)) is not None
+    ]
+
+
+async def _load_cards(user_ids: list[UUID]) -> list[QRCard]:
+    """1バッチ分のユーザーの医療情報を読み込んでQRカードを作成"""
+    # PDFの生成中に接続を保持し続けないよう、バッチごとにセッションを開く
+    async with AsyncSessionLocal() as db:
+        medical_info = await UserAuthService.get_medical_info_for_users(db, user_ids)
+    return build_qr_cards(user_ids, medical_info)
+
+
+def render_qr_batch(payloads: list[str]) -> list[bytes]:
+    """ワーカープロセスで複数のQRコードをまとめて生成"""
+    return [render_qr_png(payload) for payload in payloads]
+
+
+class QRRenderPool:
+    """
+    QRコード生成用のプロセスプール（初回使用時に起動）
+
+    APIプロセスはスレッドを持つため、ワーカーは fork ではなく spawn で起動する。
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+qr_render_pool = QRRenderPool(max_workers=settings.qr_sheet_workers)
+
+
+async def _render_batch(cards: list[QRCard]) -> list[bytes]:
+    """
+    カードのQRコード画像を取得（キャッシュにない分だけプロセスプールで生成）
+
+    一括出力で生成した画像はキャッシュに保存しない（/users/qr-image 用のキャッシュを追い出さないため）
+    """
+    pngs = [qr_image_cache.get_cached(card.payload) for card in cards]
+    missing = [i for i, png in enumerate(pngs) if png is None]
+    if missing:
+        rendered = await asyncio.get_running_loop().run_in_executor(
+            qr_render_pool.executor, render_qr_batch, [cards[i].payload for i in missing]
+        )
+        for i, png in zip(missing, rendered):
+            pngs[i] = png
+    return pngs
+
+
+def _new_pdf() -> "FPDF":
+    from fpdf import FPDF
+
+    pdf = FPDF(orientation="P", unit="mm", format="A4")
+    pdf.set_auto_page_break(False)
+    pdf.set_margins(PAGE_MARGIN, PAGE_MARGIN)
+    if settings.qr_sheet_font_path:
+        # 日本語の氏名を印字するにはTTFフォントが必要
+        pdf.add_font("label", fname=settings.qr_sheet_font_path)
+        pdf.set_font("label", size=10)
+    else:
+        pdf.set_font("helvetica", size=10)
+    return pdf
+
+
+def _add_cards(pdf: "FPDF", cards: list[QRCard], pngs: list[bytes], start: int) -> None:
+    """start 番目以降の位置にカードを配置（ページが埋まったら改ページ）"""
+    from fpdf.enums import XPos, YPos
+
+    for offset, (card, png) in enumerate(zip(cards, pngs)):
+        slot = (start + offset) % CARDS_PER_PAGE
+        if slot == 0:
+            pdf.add_page()
+        x = PAGE_MARGIN + (slot % CARD_COLUMNS) * CARD_WIDTH
+        y = PAGE_MARGIN + (slot // CARD_COLUMNS) * CARD_HEIGHT
+
+        # 切り取り線
+        pdf.rect(x, y, CARD_WIDTH, CARD_HEIGHT)
+        pdf.image(io.BytesIO(png), x=x + (CARD_WIDTH - QR_SIZE) / 2, y=y + 4, w=QR_SIZE, h=QR_SIZE)
+
+        # フォント未設定の場合、氏名の代わりにユーザーIDを印字
+        label = card.name if settings.qr_sheet_font_path else str(card.user_id)
+        pdf.set_xy(x, y + 6 + QR_SIZE)
+        for line in (label, card.birthday):
+            pdf.cell(CARD_WIDTH, LINE_HEIGHT, line, align="C", new_x=XPos.LEFT, new_y=YPos.NEXT)
+
+
+async def build_qr_sheet(user_ids: list[UUID]) -> bytes:
+    """
+    氏名順に並べたユーザーIDのQRカードのPDFを作成
+
+    qr_sheet_batch_size 件ずつ医療情報を読み込み、先のバッチを配置している間も、
+    後続のバッチ（最大でワーカー数分）を並列に生成する。
+    PDFの組み立てもイベントループ外のスレッドで行う。
+    """
+    batch_size = settings.qr_sheet_batch_size
+    batches = deque(user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size))
+    pdf = await asyncio.to_thread(_new_pdf)
+
+    in_flight: deque[tuple[list[QRCard], asyncio.Task]] = deque()
+    try:
+        placed = 0
+        while batches or in_flight:
+            while batches and len(in_flight) < qr_render_pool.max_workers:
+                batch = await _load_cards(batches.popleft())
+                in_flight.append((batch, asyncio.create_task(_render_batch(batch))))
+            batch, task = in_flight.popleft()
+            pngs = await task
+            await asyncio.to_thread(_add_cards, pdf, batch, pngs, placed)
+            placed += len(batch)
+    finally:
+        # クライアントの切断などで中断された場合は残りの生成を取り消す
+        for _, task in in_flight:
+            task.cancel()
+
+    if not placed:
+        await asyncio.to_thread(pdf.add_page)
+    return bytes(await asyncio.to_thread(pdf.output))
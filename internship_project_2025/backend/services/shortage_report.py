@@ -0,0 +1,305 @@
+"""
+医薬品の不足・余剰レポート
+
+避難所・医薬品（カタログID）ごとの使用可能な在庫数（有効期限切れを除く）と需要数（集約範囲内の利用者の服用数）の差を返す。
+PostgreSQLでは、在庫と避難所ごとの需要を結合した結果をマテリアライズドビューに保持し、
+レポートはビューへの1回の検索で返す。ビューはバックグラウンドで定期的に確認し、
+差分同期の変更番号（sync_state.last_seq）が進んでいたか日付が変わっていた場合だけ CONCURRENTLY で再集計する
+（再集計中も検索はブロックされない）。集計時点は balance_view_state に記録するため、結果が0行でも再集計を繰り返さない。
+ビューはマイグレーションで作成する（定義が最新のスキーマを前提とするため）。
+三角関数を持たないSQLiteでは、需要キャッシュを使ってその場で集計する
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import BigInteger, Date, Integer, String, Uuid, and_, case, column, func, select, table, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from models import Shelter, MedicationInventory, MedicationCatalog, BalanceViewState
+from services.admin_auth import AdminAuthService
+from services.change_seq import current_seq_statement
+from services.medication_catalog import get_catalog_names, lookup_catalog_ids
+
+logger = logging.getLogger(__name__)
+
+# 在庫と需要を結合したマテリアライズドビュー（定義を変える場合はマイグレーションで作り直す）
+BALANCE_VIEW = "shelter_medication_balance"
+
+# 再集計を1つのワーカーだけで行うためのアドバイザリロックのキー
+REFRESH_LOCK_KEY = 0x5EED_0002
+
+# balance_view_state の行ID
+VIEW_STATE_ID = 1
+
+balance_view = table(
+    BALANCE_VIEW,
+    column("shelter_id", Uuid),
+    column("catalog_id", Integer),
+    column("medication_name", String),
+    column("quantity", Integer),
+    column("expired_quantity", Integer),
+    column("required_quantity", Integer),
+    column("shortage", Integer),
+    column("source_seq", BigInteger),
+    column("source_date", Date),
+)
+
+
+def _balance_view_query():
+    """在庫と避難所ごとの需要を完全外部結合し、不足数を計算するクエリ（ビューの定義）"""
+    demand = AdminAuthService._shelter_demand_query().subquery("demand")
+    # 有効期限切れの在庫は使用可能な在庫数に含めない（日付が変わると結果が変わるため、日付も記録する）
+    expired = MedicationInventory.expiry_date < func.current_date()
+    inventory = select(
+        MedicationInventory.shelter_id,
+        MedicationInventory.catalog_id,
+        case((expired, 0), else_=MedicationInventory.quantity).label("quantity"),
+        case((expired, MedicationInventory.quantity), else_=0).label("expired_quantity"),
+    ).subquery("inventory")
+
+    quantity = func.coalesce(inventory.c.quantity, 0)
+    required_quantity = func.coalesce(demand.c.required_quantity, 0)
+    catalog_id = func.coalesce(inventory.c.catalog_id, demand.c.catalog_id)
+    return (
+        select(
+            func.coalesce(inventory.c.shelter_id, demand.c.shelter_id).label("shelter_id"),
+            catalog_id.label("catalog_id"),
+            # 表示用の名前はカタログの正式名
+            MedicationCatalog.name.label("medication_name"),
+            quantity.label("quantity"),
+            func.coalesce(inventory.c.expired_quantity, 0).label("expired_quantity"),
+            required_quantity.label("required_quantity"),
+            (required_quantity - quantity).label("shortage"),
+            # 集計時点でコミット済みの変更番号と日付（レポートの source_seq として返す）
+            current_seq_statement().scalar_subquery().label("source_seq"),
+            func.current_date().label("source_date"),
+        )
+        .select_from(
+            inventory.join(
+                demand,
+                and_(
+                    inventory.c.shelter_id == demand.c.shelter_id,
+                    inventory.c.catalog_id == demand.c.catalog_id
+                ),
+                full=True
+            )
+            .join(MedicationCatalog, MedicationCatalog.catalog_id == catalog_id)
+        )
+    )
+
+
+def _source_statement():
+    """コミット済みの最新の変更番号と今日の日付を取得するSELECT文（集計の前に読む）"""
+    return select(func.coalesce(current_seq_statement().scalar_subquery(), 0), func.current_date())
+
+
+def _record_source_statement(source_seq: int, source_date: date):
+    """集計時点を balance_view_state に記録するINSERT文"""
+    stmt = insert(BalanceViewState).values(id=VIEW_STATE_ID, source_seq=source_seq, source_date=source_date)
+    return stmt.on_conflict_do_update(
+        index_elements=[BalanceViewState.id],
+        set_={"source_seq": stmt.excluded.source_seq, "source_date": stmt.excluded.source_date}
+    )
+
+
+def ensure_balance_view(conn: Connection) -> None:
+    """
+    マテリアライズドビューとインデックスが無ければ作成（PostgreSQLのみ、マイグレーションから呼び出す）
+
+    作成時点のデータで集計されるため、作成前に読んだ変更番号と日付を集計時点として記録する
+    """
+    if conn.dialect.name != "postgresql":
+        return
+    BalanceViewState.__table__.create(conn, checkfirst=True)
+    exists = conn.execute(
+        text("SELECT 1 FROM pg_matviews WHERE matviewname = :name"), {"name": BALANCE_VIEW}
+    ).first()
+    if not exists:
+        source_seq, source_date = conn.execute(_source_statement()).one()
+        # 文字列リテラルのエスケープを接続先の設定（standard_conforming_strings）に合わせるため、接続の方言でコンパイル
+        definition = _balance_view_query().compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+        conn.execute(text(f"CREATE MATERIALIZED VIEW {BALANCE_VIEW} AS {definition}"))
+        conn.execute(_record_source_statement(source_seq, source_date))
+    # CONCURRENTLY での再集計には一意インデックスが必要
+    conn.execute(text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{BALANCE_VIEW} ON {BALANCE_VIEW} (shelter_id, catalog_id)"
+    ))
+    conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{BALANCE_VIEW}_shortage ON {BALANCE_VIEW} (shortage)"))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS ix_{BALANCE_VIEW}_catalog_id ON {BALANCE_VIEW} (catalog_id)"
+    ))
+
+
+async def refresh_balance_view(engine: AsyncEngine) -> bool:
+    """前回の集計以降に変更があったか日付が変わっていればビューを再集計（再集計した場合はTrue）"""
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        # 再集計の前に読むため、再集計中にコミットされた変更は次回の確認で再集計される
+        current_seq, today = (await conn.execute(_source_statement())).one()
+        recorded = (await conn.execute(
+            select(BalanceViewState.source_seq, BalanceViewState.source_date)
+            .where(BalanceViewState.id == VIEW_STATE_ID)
+        )).first()
+        if recorded is not None and recorded.source_seq >= current_seq and recorded.source_date == today:
+            return False
+
+        # 他のワーカーが再集計中なら、その結果を使う
+        locked = (await conn.execute(
+            text("SELECT pg_try_advisory_lock(:key)"), {"key": REFRESH_LOCK_KEY}
+        )).scalar()
+        if not locked:
+            return False
+        try:
+            await conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {BALANCE_VIEW}"))
+            await conn.execute(_record_source_statement(current_seq, today))
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": REFRESH_LOCK_KEY})
+        return True
+
+
+async def run_balance_view_refresher(engine: AsyncEngine, interval: float) -> None:
+    """interval 秒ごとにビューの再集計が必要かを確認（lifespan のタスクとして実行）"""
+    while True:
+        try:
+            await refresh_balance_view(engine)
+        except Exception:
+            logger.exception("不足・余剰レポートの再集計に失敗しました")
+        await asyncio.sleep(interval)
+
+
+class ShortageReportService:
+    """不足・余剰レポートサービス"""
+
+    @staticmethod
+    async def get_report(
+        db: AsyncSession,
+        kind: str,
+        medication_name: Optional[str],
+        region: Optional[str],
+        limit: int
+    ) -> dict:
+        """
+        不足（kind="shortage"）または余剰（kind="surplus"）の行を、差の大きい順に返す
+
+        - medication_name: 医薬品名で絞り込み（表記の揺れはカタログの別名で吸収する）
+        - region: 住所の前方一致で絞り込み（例: "東京都", "東京都中央区"）
+        """
+        catalog_id = None
+        if medication_name is not None:
+            catalog_ids = await db.run_sync(lambda session: lookup_catalog_ids(session.connection(), [medication_name]))
+            # カタログに無い医薬品は在庫・需要のどちらにも無い
+            if medication_name not in catalog_ids:
+                return {"source_seq": None, "rows": []}
+            catalog_id = catalog_ids[medication_name]
+        if db.get_bind().dialect.name == "postgresql":
+            return await ShortageReportService._get_report_from_view(db, kind, catalog_id, region, limit)
+        return await ShortageReportService._get_report_live(db, kind, catalog_id, region, limit)
+
+    @staticmethod
+    async def _get_report_from_view(
+        db: AsyncSession, kind: str, catalog_id: Optional[int], region: Optional[str], limit: int
+    ) -> dict:
+        """マテリアライズドビューから取得（shortage のインデックスで差の大きい順に読む）"""
+        shortage = balance_view.c.shortage
+        query = (
+            select(
+                balance_view.c.shelter_id, Shelter.name, Shelter.address,
+                balance_view.c.catalog_id, balance_view.c.medication_name,
+                balance_view.c.quantity, balance_view.c.expired_quantity, balance_view.c.required_quantity,
+                shortage, balance_view.c.source_seq
+            )
+            .select_from(balance_view)
+            .join(Shelter, Shelter.shelter_id == balance_view.c.shelter_id)
+            .where(shortage > 0 if kind == "shortage" else shortage < 0)
+            .order_by(shortage.desc() if kind == "shortage" else shortage.asc(), balance_view.c.medication_name)
+            .limit(limit)
+        )
+        if catalog_id is not None:
+            query = query.where(balance_view.c.catalog_id == catalog_id)
+        if region is not None:
+            query = query.where(Shelter.address.startswith(region, autoescape=True))
+
+        result = await db.execute(query)
+        rows = result.all()
+        source_seq = rows[0].source_seq if rows else (
+            await db.execute(select(BalanceViewState.source_seq).where(BalanceViewState.id == VIEW_STATE_ID))
+        ).scalar()
+        return {
+            "source_seq": source_seq,
+            "rows": [ShortageReportService._to_report_row(*row[:9]) for row in rows],
+        }
+
+    @staticmethod
+    async def _get_report_live(
+        db: AsyncSession, kind: str, catalog_id: Optional[int], region: Optional[str], limit: int
+    ) -> dict:
+        """需要キャッシュと在庫からその場で集計（SQLite用）"""
+        shelter_query = select(Shelter)
+        if region is not None:
+            shelter_query = shelter_query.where(Shelter.address.startswith(region, autoescape=True))
+        shelters = list((await db.execute(shelter_query)).scalars())
+        if not shelters:
+            return {"source_seq": None, "rows": []}
+        demand_by_shelter = await AdminAuthService._get_demand_for_shelters(db, shelters)
+
+        inventory_query = select(
+            MedicationInventory.shelter_id, MedicationInventory.catalog_id,
+            MedicationInventory.quantity, MedicationInventory.expiry_date
+        ).where(MedicationInventory.shelter_id.in_([shelter.shelter_id for shelter in shelters]))
+        if catalog_id is not None:
+            inventory_query = inventory_query.where(MedicationInventory.catalog_id == catalog_id)
+        # 避難所ID -> カタログID -> (使用可能な在庫数, 期限切れの在庫数)
+        today = date.today()
+        quantities_by_shelter = defaultdict(dict)
+        for shelter_id, row_catalog_id, quantity, expiry_date in await db.execute(inventory_query):
+            expired = expiry_date is not None and expiry_date < today
+            quantities_by_shelter[shelter_id][row_catalog_id] = (0, quantity) if expired else (quantity, 0)
+
+        matches = []
+        for shelter in shelters:
+            demand = demand_by_shelter.get(shelter.shelter_id, {})
+            quantities = quantities_by_shelter.get(shelter.shelter_id, {})
+            catalog_ids = set(quantities) | set(demand)
+            if catalog_id is not None:
+                catalog_ids &= {catalog_id}
+            for row_catalog_id in catalog_ids:
+                quantity, expired_quantity = quantities.get(row_catalog_id, (0, 0))
+                required_quantity = demand.get(row_catalog_id, 0)
+                if (required_quantity > quantity) if kind == "shortage" else (required_quantity < quantity):
+                    matches.append((shelter, row_catalog_id, quantity, expired_quantity, required_quantity))
+
+        catalog_names = await get_catalog_names(db, {match[1] for match in matches})
+        rows = [
+            ShortageReportService._to_report_row(
+                shelter.shelter_id, shelter.name, shelter.address, row_catalog_id, catalog_names[row_catalog_id],
+                quantity, expired_quantity, required_quantity, required_quantity - quantity
+            )
+            for shelter, row_catalog_id, quantity, expired_quantity, required_quantity in matches
+        ]
+
+        rows.sort(key=lambda row: (-row["shortage"] if kind == "shortage" else row["shortage"], row["medication_name"]))
+        return {"source_seq": None, "rows": rows[:limit]}
+
+    @staticmethod
+    def _to_report_row(
+        shelter_id, shelter_name, address, catalog_id, medication_name,
+        quantity, expired_quantity, required_quantity, shortage
+    ) -> dict:
+        """ShortageReportRow と同じキーの辞書に変換"""
+        return {
+            "shelter_id": shelter_id,
+            "shelter_name": shelter_name,
+            "address": address,
+            "catalog_id": catalog_id,
+            "medication_name": medication_name,
+            "quantity": quantity,
+            "expired_quantity": expired_quantity,
+            "required_quantity": required_quantity,
+            "shortage": shortage,
+        }
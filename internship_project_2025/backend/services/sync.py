@@ -0,0 +1,191 @@
+"""
+差分同期サービス
+
+避難所端末向けに、カーソル（変更番号）以降に変更された避難所・在庫・需要と、削除された行だけを返す。
+需要は利用者・医薬品の変更から影響する避難所を求め、その避難所の demand_seq に変更番号を記録しておき、
+同期時には demand_seq が進んだ避難所の需要だけを返す。
+削除記録は保持期間を過ぎたものを定期的に削除し、削除済みの範囲より前のカーソルには全件を返す
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import and_, delete, event, func, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import settings
+from database import AsyncSessionLocal
+from models import Shelter, MedicationInventory, SyncState, SyncTombstone
+from services.admin_auth import AdminAuthService
+from services.change_seq import SYNC_STATE_ID, allocate_change_seq
+from services.demand_cache import pending_demand_changes
+from services.medication_catalog import get_catalog_names
+from utils.geo_utils import haversine_distance
+
+SHELTER_COLUMNS = ["shelter_id", "name", "address", "latitude", "longitude", "aggregate_range"]
+INVENTORY_COLUMNS = [
+    "inventory_id", "shelter_id", "catalog_id", "medication_name", "quantity", "expiry_date", "description"
+]
+DEMAND_COLUMNS = ["shelter_id", "catalog_id", "medication_name", "required_quantity"]
+
+logger = logging.getLogger(__name__)
+
+
+class SyncService:
+    """差分同期サービス"""
+
+    @staticmethod
+    async def get_changes(db: AsyncSession, since: Optional[int]) -> dict:
+        """
+        since より後に変更された行を返す（since が None の場合は全件）
+
+        先にコミット済みの最新の変更番号を読み、その番号までの変更だけを返す。
+        それより後の番号の変更は、次回の同期で返される
+        """
+        cursor, pruned_seq = await SyncService._read_state(db)
+        # 変更番号が戻った場合（sync_state ごと作り直された場合）と、削除記録が削除済みの範囲のカーソルは全件を返す。
+        # db_manager の drop/recreate は変更番号を引き継ぎ、それまでのカーソルをすべて削除済みの範囲にする
+        full = since is None or since > cursor or since < pruned_seq
+        lower = -1 if full else since
+
+        def changed(column):
+            return and_(column > lower, column <= cursor)
+
+        result = await db.execute(
+            select(
+                Shelter.shelter_id, Shelter.name, Shelter.address,
+                Shelter.latitude, Shelter.longitude, Shelter.aggregate_range
+            ).where(changed(Shelter.change_seq)).order_by(Shelter.change_seq)
+        )
+        shelter_rows = [
+            [shelter_id, name, address, float(latitude), float(longitude), aggregate_range]
+            for shelter_id, name, address, latitude, longitude, aggregate_range in result
+        ]
+
+        result = await db.execute(
+            select(
+                MedicationInventory.inventory_id, MedicationInventory.shelter_id,
+                MedicationInventory.catalog_id, MedicationInventory.medication_name, MedicationInventory.quantity,
+                MedicationInventory.expiry_date, MedicationInventory.description
+            ).where(changed(MedicationInventory.change_seq)).order_by(MedicationInventory.change_seq)
+        )
+        inventory_rows = [list(row) for row in result]
+
+        # 需要が変わった避難所の需要を、キャッシュ経由でまとめて取得
+        result = await db.execute(select(Shelter).where(changed(Shelter.demand_seq)))
+        demand_shelters = list(result.scalars())
+        demand_by_shelter = await AdminAuthService._get_demand_for_shelters(db, demand_shelters)
+        catalog_names = await get_catalog_names(
+            db, {catalog_id for demand in demand_by_shelter.values() for catalog_id in demand}
+        )
+        demand_rows = [
+            [shelter.shelter_id, catalog_id, catalog_names.get(catalog_id), required_quantity]
+            for shelter in demand_shelters
+            for catalog_id, required_quantity in sorted(demand_by_shelter.get(shelter.shelter_id, {}).items())
+        ]
+
+        deleted = {"shelters": [], "inventory": []}
+        if not full:
+            result = await db.execute(
+                select(SyncTombstone.entity, SyncTombstone.entity_key)
+                .where(changed(SyncTombstone.change_seq))
+                .order_by(SyncTombstone.change_seq)
+            )
+            for entity, entity_key in result:
+                if entity == Shelter.__tablename__:
+                    deleted["shelters"].append(entity_key)
+                else:
+                    deleted["inventory"].append(int(entity_key))
+            # 読み込み中に必要な削除記録が削除された場合は全件を返す
+            if since < (await SyncService._read_state(db))[1]:
+                return await SyncService.get_changes(db, None)
+
+        return {
+            "cursor": cursor,
+            "full": full,
+            "shelters": {"columns": SHELTER_COLUMNS, "rows": shelter_rows},
+            "inventory": {"columns": INVENTORY_COLUMNS, "rows": inventory_rows},
+            "demand_shelters": [shelter.shelter_id for shelter in demand_shelters],
+            "demand": {"columns": DEMAND_COLUMNS, "rows": demand_rows},
+            "deleted": deleted,
+        }
+
+    @staticmethod
+    async def _read_state(db: AsyncSession) -> tuple[int, int]:
+        """コミット済みの最新の変更番号と、削除記録を削除済みの変更番号"""
+        row = (await db.execute(
+            select(SyncState.last_seq, SyncState.pruned_seq).where(SyncState.id == SYNC_STATE_ID)
+        )).first()
+        return (row.last_seq, row.pruned_seq) if row is not None else (0, 0)
+
+
+async def prune_tombstones(db: AsyncSession, retention_days: int) -> int:
+    """保持期間を過ぎた削除記録を削除し、削除した最大の変更番号を記録（削除した件数を返す）"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    pruned_seq = (await db.execute(
+        select(func.max(SyncTombstone.change_seq)).where(SyncTombstone.created_at < cutoff)
+    )).scalar()
+    if pruned_seq is None:
+        return 0
+    # pruned_seq の更新と削除は同時にコミットする（同期中のリクエストは削除記録を読んだ後に pruned_seq を確認する）
+    await db.execute(
+        update(SyncState)
+        .where(SyncState.id == SYNC_STATE_ID, SyncState.pruned_seq < pruned_seq)
+        .values(pruned_seq=pruned_seq)
+    )
+    result = await db.execute(delete(SyncTombstone).where(SyncTombstone.change_seq <= pruned_seq))
+    await db.commit()
+    return result.rowcount
+
+
+async def run_tombstone_pruner(retention_days: int, interval: float) -> None:
+    """interval 秒ごとに保持期間を過ぎた削除記録を削除（lifespan のタスクとして実行）"""
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await prune_tombstones(db, retention_days)
+        except Exception:
+            logger.exception("削除記録の削除に失敗しました")
+        await asyncio.sleep(interval)
+
+
+def _shelters_covering(conn: Connection, points: set[tuple[float, float]]) -> set[UUID]:
+    """いずれかの地点を集約範囲に含む避難所のID"""
+    if conn.dialect.name == "postgresql":
+        return set(conn.execute(AdminAuthService._shelters_covering_query(points)).scalars())
+    # 三角関数を持たないSQLiteでは避難所を読み込んで判定する
+    shelter_ids = set()
+    rows = conn.execute(select(
+        Shelter.shelter_id, Shelter.latitude, Shelter.longitude, Shelter.aggregate_range
+    ))
+    for row in rows:
+        range_km = AdminAuthService._get_range_km(row)
+        if any(haversine_distance(lat, lon, float(row.latitude), float(row.longitude)) <= range_km
+               for lat, lon in points):
+            shelter_ids.add(row.shelter_id)
+    return shelter_ids
+
+
+@event.listens_for(Session, "before_commit")
+def _stamp_demand_seq(session: Session) -> None:
+    """需要に影響する変更があった場合、影響する避難所の demand_seq に変更番号を記録"""
+    # コミット時の自動フラッシュはこのイベントの後に行われるため、先にフラッシュして変更を確定させる
+    session.flush()
+    points, shelter_ids = pending_demand_changes(session)
+    if not (points or shelter_ids):
+        return
+
+    conn = session.connection()
+    if points:
+        shelter_ids |= _shelters_covering(conn, points)
+    # 影響する避難所が無ければ採番しない（sync_state の行ロックを取らない）
+    if not shelter_ids:
+        return
+
+    seq = allocate_change_seq(session)
+    conn.execute(update(Shelter).where(Shelter.shelter_id.in_(shelter_ids)).values(demand_seq=seq))
@@ -4,24 +4,32 @@
 ユーザーの登録、ログイン、医療情報取得の業務ロジックを管理
 """
 
+from collections import defaultdict
 from datetime import timedelta
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from uuid import UUID
 
 from models import User, Medication
 from schemas import UserCreate, UserLogin, Token, User as UserSchema, MedicalInfo
 from services.auth import AuthService
+from services.medical_info_cache import CachedMedicalInfo, medical_info_cache
+
+# IN句1回あたりのID数（asyncpgはバインド変数が32767個を超えるクエリを実行できないため分割する）
+ID_CHUNK_SIZE = 10000
 
 
 class UserAuthService:
     """ユーザー認証サービス"""
     
     @staticmethod
-    def register_user(db: Session, user_create: UserCreate) -> UserSchema:
+    async def register_user(db: AsyncSession, user_create: UserCreate) -> UserSchema:
         """新規ユーザー登録"""
         # メールアドレスの重複チェック
-        db_user = db.query(User).filter(User.email == user_create.email).first()
+        result = await db.execute(select(User).where(User.email == user_create.email))
+        db_user = result.scalars().first()
         if db_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -29,7 +37,7 @@ class UserAuthService:
             )
         
         # パスワードをハッシュ化
-        hashed_password = AuthService.get_password_hash(user_create.password)
+        hashed_password = await AuthService.get_password_hash_async(user_create.password)
         
         # 新しいユーザーを作成
         db_user = User(
@@ -43,16 +51,16 @@ class UserAuthService:
         )
         
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         
         return UserSchema.from_orm(db_user)
     
     @staticmethod
-    def login_user(db: Session, user_login: UserLogin) -> Token:
+    async def login_user(db: AsyncSession, user_login: UserLogin) -> Token:
         """ユーザーログイン"""
         # ユーザー認証
-        user = AuthService.authenticate_user(db, user_login.email, user_login.password)
+        user = await AuthService.authenticate_user(db, user_login.email, user_login.password)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -70,19 +78,86 @@ class UserAuthService:
         return Token(access_token=access_token)
     
     @staticmethod
-    def get_medical_info_by_user_id(db: Session, user_id: UUID) -> MedicalInfo:
+    async def get_medical_info_by_user_id(db: AsyncSession, user_id: UUID) -> MedicalInfo:
         """ユーザーIDから医療情報を取得（QRコード用）"""
-        # ユーザー情報を取得
-        user = db.query(User).filter(User.user_id == user_id).first()
+        entry = await UserAuthService.get_cached_medical_info(db, user_id)
+        return entry.info
+    
+    @staticmethod
+    async def get_cached_medical_info(db: AsyncSession, user_id: UUID) -> CachedMedicalInfo:
+        """医療情報をシリアライズ済みのJSON・ETagとともにキャッシュ経由で取得"""
+        entry = medical_info_cache.get(user_id)
+        if entry is not None:
+            return entry
+        
+        # 読み込み中に無効化された場合は古い結果を保存しないよう、先に世代を取得
+        generation = medical_info_cache.generation
+        
+        # ユーザーと医薬品情報を1回のクエリで取得
+        result = await db.execute(UserAuthService._medical_info_query(user_id))
+        user = result.unique().scalars().first()
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="ユーザーが見つかりません"
             )
         
-        # ユーザーの医薬品情報を取得
-        medications = db.query(Medication).filter(Medication.user_id == user_id).all()
+        medications = sorted(user.medications, key=lambda med: med.medication_id)
+        info = UserAuthService._to_medical_info(user, medications)
+        return medical_info_cache.set(user_id, info, generation)
+    
+    @staticmethod
+    async def get_user_ids_by_name(db: AsyncSession, user_ids: list[UUID]) -> list[UUID]:
+        """ユーザーIDを氏名順に並べ替え（存在しないIDは除く。氏名とIDだけを ID_CHUNK_SIZE 件ずつ取得）"""
+        rows = []
+        for start in range(0, len(user_ids), ID_CHUNK_SIZE):
+            result = await db.execute(
+                select(User.name, User.user_id)
+                .where(User.user_id.in_(user_ids[start:start + ID_CHUNK_SIZE]))
+            )
+            rows.extend(result.all())
+        rows.sort(key=lambda row: (row.name, str(row.user_id)))
+        return [row.user_id for row in rows]
+    
+    @staticmethod
+    async def get_medical_info_for_users(db: AsyncSession, user_ids: list[UUID]) -> dict[UUID, MedicalInfo]:
+        """
+        複数ユーザーの医療情報をまとめて取得（存在しないIDは含まない）
+
+        ID_CHUNK_SIZE 件ごとに、ユーザーと医薬品の2回のクエリで取得する
+        """
+        users = []
+        medications_by_user = defaultdict(list)
+        for start in range(0, len(user_ids), ID_CHUNK_SIZE):
+            chunk = user_ids[start:start + ID_CHUNK_SIZE]
+            result = await db.execute(select(User).where(User.user_id.in_(chunk)))
+            users.extend(result.scalars().all())
+            
+            result = await db.execute(
+                select(Medication)
+                .where(Medication.user_id.in_(chunk))
+                .order_by(Medication.medication_id)
+            )
+            for med in result.scalars():
+                medications_by_user[med.user_id].append(med)
         
+        return {
+            user.user_id: UserAuthService._to_medical_info(user, medications_by_user[user.user_id])
+            for user in users
+        }
+    
+    @staticmethod
+    def _medical_info_query(user_id: UUID):
+        """ユーザーと医薬品情報を結合して取得するクエリ"""
+        return (
+            select(User)
+            .options(joinedload(User.medications))
+            .where(User.user_id == user_id)
+        )
+    
+    @staticmethod
+    def _to_medical_info(user: User, medications: list[Medication]) -> MedicalInfo:
+        """ユーザーと医薬品から医療情報レスポンスを作成（個人特定情報を除外）"""
         # 医薬品情報をdictに変換
         medication_list = [
             {
@@ -93,7 +168,6 @@ class UserAuthService:
             for med in medications
         ]
         
-        # 医療情報レスポンスを作成（個人特定情報を除外）
         return MedicalInfo(
             name=user.name,
             birthday=user.birthday,
@@ -0,0 +1,71 @@
+"""
+一覧レスポンス用の高速JSON出力
+
+ORMの値から組み立てた行（レスポンススキーマと同じキーを持つ辞書）を
+Pydanticで再検証せずにorjsonでシリアライズし、一定サイズ以上の本文は圧縮して返す。
+brotli がインストールされている場合は br を優先し、なければ gzip を使う
+"""
+
+import asyncio
+import gzip
+from typing import Any, Callable, Optional
+
+import orjson
+from fastapi import Request, Response
+
+from config import settings
+
+try:
+    import brotli
+except ImportError:  # brotli は任意の依存
+    brotli = None
+
+# 対応する圧縮方式（優先順）
+COMPRESSORS: dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=settings.response_brotli_quality)
+COMPRESSORS["gzip"] = lambda body: gzip.compress(body, compresslevel=settings.response_gzip_level)
+
+
+def dumps(content: Any) -> bytes:
+    """orjsonでシリアライズ（日付はISO形式、UUIDは文字列になる）"""
+    return orjson.dumps(content)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Accept-Encoding ヘッダーから使用する圧縮方式を選ぶ（q=0 は除外）"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.partition(";")
+        _, _, q = params.replace(" ", "").partition("q=")
+        try:
+            if q and float(q) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(coding.strip())
+    for encoding in COMPRESSORS:
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+async def fast_json_response(
+    request: Request, content: Any, headers: Optional[dict[str, str]] = None
+) -> Response:
+    """
+    JSONレスポンスを作成
+
+    response_model による検証とシリアライズは Response を直接返すと行われないため、
+    content にはレスポンススキーマと同じ形の検証済みの値を渡すこと。
+    圧縮はイベントループを塞がないようスレッドで行う。
+    """
+    body = dumps(content)
+    headers = dict(headers or {})
+    if len(body) >= settings.response_compress_min_bytes:
+        headers["Vary"] = "Accept-Encoding"
+        encoding = choose_encoding(request.headers.get("accept-encoding", ""))
+        if encoding is not None:
+            body = await asyncio.to_thread(COMPRESSORS[encoding], body)
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
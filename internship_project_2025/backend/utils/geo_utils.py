@@ -5,6 +5,28 @@
 """
 
 import math
+import re
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import func
+
+# 地球の半径（km）
+EARTH_RADIUS_KM = 6371.0
+
+# 緯度1度あたりの距離（km）
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180.0
+
+# 集約範囲（km）として受け付ける表記。SQL側の変換でも同じ正規表現を使う
+RANGE_KM_PATTERN = r"^[0-9]+(\.[0-9]+)?$"
+
+
+def parse_range_km(value) -> Optional[float]:
+    """集約範囲の文字列をkmの数値に変換（RANGE_KM_PATTERN に一致する正の数でなければNone）"""
+    if not isinstance(value, str) or re.fullmatch(RANGE_KM_PATTERN, value) is None:
+        return None
+    range_km = float(value)
+    return range_km if range_km > 0 else None
 
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -18,9 +40,6 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     Returns:
         距離（km）
     """
-    # 地球の半径（km）
-    R = 6371.0
-    
     # 度をラジアンに変換
     lat1_rad = math.radians(lat1)
     lon1_rad = math.radians(lon1)
@@ -36,7 +55,7 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     c = 2 * math.asin(math.sqrt(a))
     
     # 距離を計算
-    distance = R * c
+    distance = EARTH_RADIUS_KM * c
     
     return distance
 
@@ -57,3 +76,113 @@ def is_within_range(user_lat: float, user_lon: float,
     """
     distance = haversine_distance(user_lat, user_lon, shelter_lat, shelter_lon)
     return distance <= range_km
+
+
+def haversine_many(lat_array, lon_array, lat0: float, lon0: float) -> np.ndarray:
+    """
+    複数地点から1地点までの距離をまとめてhaversine公式で計算（km単位）
+    
+    Args:
+        lat_array, lon_array: 地点群の緯度、経度（配列またはリスト）
+        lat0, lon0: 基準地点の緯度、経度
+        
+    Returns:
+        各地点の距離（km）の配列
+    """
+    lat_rad = np.radians(np.asarray(lat_array, dtype=np.float64))
+    lon_rad = np.radians(np.asarray(lon_array, dtype=np.float64))
+    lat0_rad = math.radians(lat0)
+    lon0_rad = math.radians(lon0)
+    
+    a = (
+        np.sin((lat0_rad - lat_rad) / 2) ** 2
+        + np.cos(lat_rad) * math.cos(lat0_rad) * np.sin((lon0_rad - lon_rad) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def within_range_mask(lat_array, lon_array, lat0: float, lon0: float, range_km: float) -> np.ndarray:
+    """
+    複数地点が基準地点の集約範囲内にあるかをまとめて判定
+    
+    Args:
+        lat_array, lon_array: 地点群の緯度、経度
+        lat0, lon0: 基準地点（避難所）の緯度、経度
+        range_km: 集約範囲（km）
+        
+    Returns:
+        範囲内かどうかの真偽値配列
+    """
+    return haversine_many(lat_array, lon_array, lat0, lon0) <= range_km
+
+
+def distance_matrix(lat_a, lon_a, lat_b, lon_b) -> np.ndarray:
+    """
+    地点群A×地点群Bの距離行列を計算（km単位）
+    
+    避難所×ユーザーの組み合わせなど、オフラインの集約範囲の検討にも使う。
+    大きさは len(A) × len(B) になるため、Bが大きい場合は分割して呼び出すこと。
+    
+    Args:
+        lat_a, lon_a: 地点群A（行）の緯度、経度
+        lat_b, lon_b: 地点群B（列）の緯度、経度
+        
+    Returns:
+        距離（km）の2次元配列（行: A, 列: B）
+    """
+    lat_a_rad = np.radians(np.asarray(lat_a, dtype=np.float64))[:, np.newaxis]
+    lon_a_rad = np.radians(np.asarray(lon_a, dtype=np.float64))[:, np.newaxis]
+    lat_b_rad = np.radians(np.asarray(lat_b, dtype=np.float64))[np.newaxis, :]
+    lon_b_rad = np.radians(np.asarray(lon_b, dtype=np.float64))[np.newaxis, :]
+    
+    a = (
+        np.sin((lat_b_rad - lat_a_rad) / 2) ** 2
+        + np.cos(lat_a_rad) * np.cos(lat_b_rad) * np.sin((lon_b_rad - lon_a_rad) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bounding_box(lat: float, lon: float, range_km: float) -> tuple[float, float, float, float]:
+    """
+    指定地点から range_km 以内を必ず含む緯度経度のボックスを計算
+    
+    Args:
+        lat, lon: 中心の緯度、経度
+        range_km: 半径（km）
+        
+    Returns:
+        (最小緯度, 最大緯度, 最小経度, 最大経度)
+    """
+    dlat = range_km / KM_PER_DEGREE
+    # 経度方向は高緯度ほど1度が短くなるため、ボックス内で最も極に近い緯度で幅を決める
+    max_abs_lat = min(abs(lat) + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max_abs_lat))
+    if cos_lat < 1e-6:
+        dlon = 180.0
+    else:
+        dlon = min(range_km / (KM_PER_DEGREE * cos_lat), 180.0)
+    
+    return (lat - dlat, lat + dlat, lon - dlon, lon + dlon)
+
+
+def haversine_distance_sql(lat1, lon1, lat2, lon2):
+    """
+    haversine_distance と同じ計算をSQL式として組み立てる（km単位）
+    
+    Args:
+        lat1, lon1, lat2, lon2: 緯度経度のカラムまたは値
+        
+    Returns:
+        距離（km）を表すSQLAlchemyの式
+    """
+    lat1_rad = func.radians(lat1)
+    lat2_rad = func.radians(lat2)
+    dlat = func.radians(lat2) - lat1_rad
+    dlon = func.radians(lon2) - func.radians(lon1)
+    
+    a = (
+        func.power(func.sin(dlat / 2), 2)
+        + func.cos(lat1_rad) * func.cos(lat2_rad) * func.power(func.sin(dlon / 2), 2)
+    )
+    # 丸め誤差で1をわずかに超えるとasinがエラーになるため上限を抑える
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(a, 1.0)))
@@ -0,0 +1,20 @@
+"""
+医薬品名の正規化
+
+表記の揺れ（全角・半角、空白、大文字・小文字）を吸収し、医薬品カタログの別名の照合に使う
+"""
+
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_medication_name(name: str) -> str:
+    """
+    照合用に医薬品名を正規化
+
+    NFKC で全角英数字・記号を半角に、半角カナを全角に揃え、空白を除いて小文字にする
+    （例: "ロキソニン錠 ６０ＭＧ" -> "ロキソニン錠60mg"）
+    """
+    return _WHITESPACE.sub("", unicodedata.normalize("NFKC", name)).casefold()
@@ -0,0 +1,108 @@
+"""
+空間インデックスユーティリティ
+
+緯度経度をグリッドセル（バケット）に分割して保持し、
+指定地点の周辺にある点の候補だけを高速に取り出す
+"""
+
+import math
+from collections import defaultdict
+from typing import Hashable, Iterable, Iterator, Optional
+
+from utils.geo_utils import bounding_box, within_range_mask
+
+
+class GridIndex:
+    """
+    緯度経度グリッドによるバケット索引
+
+    各点は cell_size_deg 四方のセルに振り分けられる。
+    検索時は範囲を覆うセルだけを走査し、候補に対して厳密なhaversine距離で判定する。
+    """
+
+    def __init__(self, cell_size_deg: float = 0.02):
+        # 0.02度 ≒ 南北2.2km（集約範囲の既定値3kmで3x3〜4x4セル程度を走査）
+        self.cell_size_deg = cell_size_deg
+        self._cells: dict[tuple[int, int], dict[Hashable, tuple[float, float]]] = defaultdict(dict)
+        self._points: dict[Hashable, tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell_of(self, lat: float, lon: float) -> tuple[int, int]:
+        return (math.floor(lat / self.cell_size_deg), math.floor(lon / self.cell_size_deg))
+
+    def get(self, key: Hashable) -> Optional[tuple[float, float]]:
+        """点の位置を取得（存在しない場合はNone）"""
+        return self._points.get(key)
+
+    def upsert(self, key: Hashable, lat: float, lon: float) -> None:
+        """点を追加（既存の場合は位置を更新）"""
+        self.remove(key)
+        self._points[key] = (lat, lon)
+        self._cells[self._cell_of(lat, lon)][key] = (lat, lon)
+
+    def remove(self, key: Hashable) -> None:
+        """点を削除（存在しない場合は何もしない）"""
+        old = self._points.pop(key, None)
+        if old is None:
+            return
+        cell = self._cell_of(*old)
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(key, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def bulk_load(self, items: Iterable[tuple[Hashable, float, float]]) -> None:
+        """既存の内容を破棄して一括で読み込む"""
+        self.clear()
+        for key, lat, lon in items:
+            self._points[key] = (lat, lon)
+            self._cells[self._cell_of(lat, lon)][key] = (lat, lon)
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._points.clear()
+
+    def candidates(self, lat: float, lon: float, range_km: float) -> Iterator[tuple[Hashable, float, float]]:
+        """
+        指定地点から range_km を含むバウンディングボックスに掛かるセル内の点を列挙
+
+        返す点は候補であり、範囲外の点も含まれる
+        """
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, range_km)
+        min_row, min_col = self._cell_of(min_lat, min_lon)
+        max_row, max_col = self._cell_of(max_lat, max_lon)
+
+        # 走査セル数が格納セル数より多い場合は格納セル側を走査する
+        if (max_row - min_row + 1) * (max_col - min_col + 1) > len(self._cells):
+            for (row, col), bucket in self._cells.items():
+                if min_row <= row <= max_row and min_col <= col <= max_col:
+                    for key, (p_lat, p_lon) in bucket.items():
+                        yield key, p_lat, p_lon
+            return
+
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                bucket = self._cells.get((row, col))
+                if not bucket:
+                    continue
+                for key, (p_lat, p_lon) in bucket.items():
+                    yield key, p_lat, p_lon
+
+    def query(self, lat: float, lon: float, range_km: float) -> list[Hashable]:
+        """指定地点から range_km 以内にある点のキーを返す"""
+        keys = []
+        lats = []
+        lons = []
+        for key, p_lat, p_lon in self.candidates(lat, lon, range_km):
+            keys.append(key)
+            lats.append(p_lat)
+            lons.append(p_lon)
+        if not keys:
+            return []
+        
+        # 候補に対してまとめて厳密な距離判定を行う
+        mask = within_range_mask(lats, lons, lat, lon, range_km)
+        return [key for key, inside in zip(keys, mask.tolist()) if inside]
@@ -0,0 +1,93 @@
+"""
+TTL付きLRUキャッシュ
+
+有効期限と最大件数で古いエントリを追い出すスレッドセーフなキャッシュ
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class TTLCache:
+    """
+    有効期限（TTL）と最大件数を持つLRUキャッシュ
+
+    無効化が起きるたびに generation が進む。計算前に取得した generation を
+    set() に渡すと、計算中に無効化があった場合は古い値を保存しない。
+    """
+
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """値を取得（期限切れ・未登録の場合は default）"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        """値を保存（generation が古い場合は保存しない）"""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        """指定キーを無効化"""
+        with self._lock:
+            self._data.pop(key, None)
+            self.generation += 1
+
+    def pop_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """条件に合うエントリを無効化し、削除件数を返す"""
+        with self._lock:
+            keys = [key for key, (_, value) in self._data.items() if predicate(key, value)]
+            for key in keys:
+                del self._data[key]
+            self.generation += 1
+            return len(keys)
+
+    def clear(self) -> None:
+        """全エントリを無効化"""
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+    def stats(self) -> dict:
+        """ヒット数・ミス数などの統計情報"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
@@ -17,6 +17,7 @@ export const API_ENDPOINTS = {
     me: `${API_BASE_URL}/admins/me`,
     inventory: `${API_BASE_URL}/admins/inventory`,
     myShelterInventory: `${API_BASE_URL}/admins/my-shelter/inventory`,
+    myShelterInventoryEvents: `${API_BASE_URL}/admins/my-shelter/inventory/events`,
     updateInventory: (medicationName) => `${API_BASE_URL}/admins/inventory/${medicationName}`,
   },
   
@@ -160,6 +160,33 @@ const InventoryManagementMobile = () => {
     fetchInventoryData();
   }, []);
 
+  // 担当避難所の在庫変更をサーバーから受信して反映（他の端末での更新も一覧を再取得せずに反映される）
+  useEffect(() => {
+    if (loading) {
+      return undefined;
+    }
+
+    const unsubscribe = InventoryService.subscribeMyShelterInventory((rows) => {
+      setInventoryData((currentData) => {
+        const nextData = [...currentData];
+        rows.forEach((row) => {
+          const index = nextData.findIndex(
+            (item) =>
+              item.shelter_name === row.shelter_name &&
+              item.medication_name === row.medication_name
+          );
+          if (index >= 0) {
+            nextData[index] = { ...nextData[index], ...row };
+          } else {
+            nextData.push(row);
+          }
+        });
+        return nextData;
+      });
+    });
+    return unsubscribe;
+  }, [loading]);
+
   // 避難所リストと薬品リストを生成する関数
   const generateShelterList = (data, currentShelter) => {
     // 避難所リスト（自分の避難所を除く、在庫0の薬品を除外）
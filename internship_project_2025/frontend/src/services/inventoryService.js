@@ -50,6 +50,7 @@ class InventoryService {
           shelter_name: item.shelter_name || '',
           medication_name: item.medication_name || '',
           quantity: Number(item.quantity) || 0,
+          usable_quantity: Number(item.usable_quantity ?? item.quantity) || 0, // 过期库存为0
           required_quantity: Number(item.required_quantity) || 0, // 确保required_quantity存在
           expiry_date: item.expiry_date || null,
           description: item.description || ''
@@ -73,6 +74,79 @@ class InventoryService {
     }
   }
 
+  // 担当避難所の在庫変更を購読（/api/admins/my-shelter/inventory/events の Server-Sent Events）
+  // EventSource は Authorization ヘッダーを送れないため fetch で受信する
+  // onRows には接続直後の全件（snapshot）と、以降の変更された行（inventory）が渡される
+  // 戻り値の関数を呼ぶと購読を終了する
+  static subscribeMyShelterInventory(onRows, retryDelayMs = 3000) {
+    const controller = new AbortController();
+
+    const handleEvent = (block) => {
+      let event = 'message';
+      let data = '';
+      block.split('\n').forEach((line) => {
+        if (line.startsWith('event: ')) {
+          event = line.slice(7);
+        } else if (line.startsWith('data: ')) {
+          data += line.slice(6);
+        }
+      });
+      if ((event === 'snapshot' || event === 'inventory') && data) {
+        onRows(this.normalizeInventoryData(JSON.parse(data)));
+      }
+    };
+
+    const connect = async () => {
+      while (!controller.signal.aborted) {
+        try {
+          const token = AuthService.getToken();
+          if (!token) {
+            return;
+          }
+
+          const response = await fetch(API_ENDPOINTS.admins.myShelterInventoryEvents, {
+            method: HTTP_METHODS.GET,
+            headers: { 'Authorization': `Bearer ${token}` },
+            signal: controller.signal,
+          });
+          if (response.status === 401) {
+            return;
+          }
+          if (!response.ok || !response.body) {
+            throw new Error(`API Error ${response.status}: 在庫変更の購読に失敗しました`);
+          }
+
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = '';
+          for (;;) {
+            const { value, done } = await reader.read();
+            if (done) {
+              break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+              handleEvent(buffer.slice(0, boundary));
+              buffer = buffer.slice(boundary + 2);
+            }
+          }
+        } catch (error) {
+          if (controller.signal.aborted) {
+            return;
+          }
+          console.warn('⚠️ 在庫変更の購読エラー:', error.message);
+        }
+
+        // 切断・resync の後は少し待って再接続する（再接続時の snapshot で最新の状態に戻る）
+        await new Promise((resolve) => setTimeout(resolve, retryDelayMs));
+      }
+    };
+
+    connect();
+    return () => controller.abort();
+  }
+
   // 获取所有避难所的库存信息（管理员权限）
   static async getAllInventory() {
     try {
@@ -218,9 +292,9 @@ class InventoryService {
   // 基于 required_quantity 的库存状态分类（新增）
   static categorizeInventoryByRequiredQuantity(inventoryList) {
     const categorized = {
-      sufficient: [],    // quantity >= required_quantity
-      insufficient: [],  // quantity < required_quantity
-      shortage: []       // quantity = 0
+      sufficient: [],    // usable_quantity >= required_quantity
+      insufficient: [],  // usable_quantity < required_quantity
+      shortage: []       // usable_quantity = 0
     };
 
     if (!Array.isArray(inventoryList)) {
@@ -229,7 +303,8 @@ class InventoryService {
     }
 
     inventoryList.forEach(item => {
-      const quantity = Number(item.quantity) || 0;
+      // 过期库存不计入可用库存
+      const quantity = Number(item.usable_quantity ?? item.quantity) || 0;
       const requiredQuantity = Number(item.required_quantity) || 0;
       
       if (quantity === 0) {